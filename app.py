@@ -1,8 +1,10 @@
 
 import streamlit as st
+from contextlib import nullcontext
 from database.db_manager import DatabaseManager
 from utils.visualization import VisualizationManager
-from utils.llm_utils import load_llm_model
+from utils.llm_utils import load_llm_model, registry
+from utils.metrics import metrics, profile_request, serve_metrics
 from chains.eda_chain import EDAChain
 import yaml
 
@@ -10,12 +12,45 @@ import yaml
 with open('config/config.yaml', 'r') as file:
     config = yaml.safe_load(file)
 
+@st.cache_resource
+def start_model_preload():
+    """Start loading the model once per process, not on every rerun
+
+    The first request only blocks on whatever part of the load is still left.
+    """
+    return registry.preload(config['model'])
+
+start_model_preload()
+
+metrics_config = config.get('metrics') or {}
+if metrics_config.get('port'):
+    serve_metrics(metrics_config['port'], metrics_config.get('host', '127.0.0.1'))
+
+@st.cache_resource
+def get_db_manager() -> DatabaseManager:
+    """One pooled DatabaseManager shared by every session in this process"""
+    db_manager = DatabaseManager.from_config(config['database'], config.get('cache'))
+    metrics.add_collector('query_cache', db_manager.cache.stats)
+    return db_manager
+
+@st.cache_resource
+def get_eda_chain() -> EDAChain:
+    """EDA chain over the shared model from the registry"""
+    eda_chain = EDAChain(load_llm_model(config['model']), config.get('sql_cache'), config.get('chain'),
+                         config.get('maritime'))
+    metrics.add_collector('sql_cache', eda_chain.sql_cache.stats)
+    metrics.add_collector('router', eda_chain.router.stats)
+    return eda_chain
+
 def initialize_components():
     
-    db_manager = DatabaseManager(config['database']['connection_string'])
-    viz_manager = VisualizationManager()
-    llm_model = load_llm_model(config['model'])
-    eda_chain = EDAChain(llm_model)
+    db_manager = get_db_manager()
+    viz_manager = VisualizationManager(config.get("visualization"))
+    if not registry.is_ready(config['model']):
+        with st.spinner("Loading language model..."):
+            eda_chain = get_eda_chain()
+    else:
+        eda_chain = get_eda_chain()
     return db_manager, viz_manager, eda_chain
 
 def main():
@@ -39,6 +74,24 @@ def main():
                 db_manager.load_sample_data()
                 st.success("Sample data loaded!")
 
+        with st.expander("Query cache"):
+            st.json(db_manager.cache.stats())
+
+        with st.expander("Model timings"):
+            st.json(registry.timing_report())
+
+        with st.expander("Metrics"):
+            st.json(metrics.snapshot())
+            slow = db_manager.slow_log.entries()
+            st.caption(f"Slow queries (over {db_manager.slow_log.threshold_ms:g} ms)")
+            for entry in slow:
+                st.code(f"-- {entry['at']}  {entry['duration_ms']} ms\n{entry['sql']}", language="sql")
+                if entry['plan']:
+                    st.code(entry['plan'], language="text")
+            st.download_button("Prometheus metrics", metrics.to_prometheus(),
+                               file_name="metrics.prom", mime="text/plain")
+        profiling = st.checkbox("Profile requests (cProfile)")
+
     # Chat interface
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -47,7 +100,7 @@ def main():
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.write(message["content"])
-            if "visualization" in message:
+            if message.get("visualization") is not None:
                 st.plotly_chart(message["visualization"])
 
     # Chat input
@@ -58,28 +111,45 @@ def main():
 
         # Generate response
         with st.chat_message("assistant"):
-            with st.spinner("Analyzing..."):
-                # Process query through EDA chain
-                response = eda_chain.process_query(prompt, db_manager)
-                
-                # Create visualization if needed
-                if response.get("needs_visualization"):
-                    fig = viz_manager.create_visualization(
-                        response["data"],
-                        response["viz_type"]
-                    )
-                    response["visualization"] = fig
-
-                # Display response
-                st.write(response["text"])
-                if "visualization" in response:
-                    st.plotly_chart(response["visualization"])
-
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response["text"],
-                    "visualization": response.get("visualization")
-                })
+            with profile_request() if profiling else nullcontext() as profile:
+                # Render the answer as it is generated instead of waiting for the whole chain
+                placeholder = st.empty()
+                placeholder.write("Analyzing...")
+                text = ""
+                response = {}
+                for event in eda_chain.process_query_stream(prompt, db_manager):
+                    if event["stage"] == "text":
+                        text += event["delta"]
+                        placeholder.write(text)
+                    elif event["stage"] == "done":
+                        response = event["response"]
+
+                with st.spinner("Building visualization..."):
+                    # Create visualization if needed
+                    if response.get("needs_visualization"):
+                        fig = viz_manager.create_visualization(
+                            response["data"],
+                            response["viz_type"],
+                            **response.get("viz_params", {})
+                        )
+                        response["visualization"] = fig
+
+                    # Display response
+                    placeholder.write(response["text"])
+                    if "visualization" in response:
+                        st.plotly_chart(response["visualization"])
+                    if response.get("trace"):
+                        with st.expander("Stage timings"):
+                            st.table(response["trace"])
+
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": response["text"],
+                        "visualization": response.get("visualization")
+                    })
+            if profile is not None:
+                with st.expander(f"Profile ({profile.seconds:.2f}s)"):
+                    st.code(profile.report(metrics_config.get('profile_top', 40)), language="text")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,122 @@
+"""Analytical query time on SQLite vs the Parquet/DuckDB mirror.
+
+    python -m benchmarks.bench_columnar --rows 5000000
+
+Generates a sample fleet of roughly ``--rows`` positions (10-minute fixes over
+``--days``), or reuses ``--db`` with ``--keep``, mirrors it to Parquet and
+times each query pair on both engines. Results are compared (row counts and
+column sums) so a dialect difference can't pass as a speedup. The point
+lookup is included to show why those stay on SQLite.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database.db_manager import DatabaseManager
+from database import columnar
+
+# name -> (SQLite SQL, DuckDB SQL); both return the same rows
+QUERIES = {
+    'status counts': (
+        "SELECT navigation_status, COUNT(*) AS n FROM ais_positions GROUP BY 1 ORDER BY 1",
+        "SELECT navigation_status, COUNT(*) AS n FROM ais_positions GROUP BY 1 ORDER BY 1",
+    ),
+    'speed per vessel': (
+        "SELECT mmsi, AVG(speed) AS mean, MAX(speed) AS top FROM ais_positions GROUP BY mmsi ORDER BY mmsi",
+        "SELECT mmsi, AVG(speed) AS mean, MAX(speed) AS top FROM ais_positions GROUP BY mmsi ORDER BY mmsi",
+    ),
+    'speed per type': (
+        "SELECT v.vessel_type, AVG(p.speed) AS mean, COUNT(*) AS n FROM ais_positions p "
+        "JOIN vessels v ON v.mmsi = p.mmsi GROUP BY 1 ORDER BY 1",
+        "SELECT v.vessel_type, AVG(p.speed) AS mean, COUNT(*) AS n FROM ais_positions p "
+        "JOIN vessels v ON v.mmsi = p.mmsi GROUP BY 1 ORDER BY 1",
+    ),
+    'hourly last 3 days': (
+        "SELECT substr(timestamp, 1, 13) AS hour, COUNT(*) AS n, AVG(speed) AS mean FROM ais_positions "
+        "WHERE timestamp >= '{since}' GROUP BY 1 ORDER BY 1",
+        "SELECT substr(timestamp, 1, 13) AS hour, COUNT(*) AS n, AVG(speed) AS mean FROM ais_positions "
+        "WHERE timestamp >= '{since}' AND day >= '{since_day}' GROUP BY 1 ORDER BY 1",
+    ),
+    'density grid 0.5 deg': (
+        "SELECT (CAST((latitude + 90) / 0.5 AS INTEGER) + 0.5) * 0.5 - 90 AS lat, "
+        "(CAST((longitude + 180) / 0.5 AS INTEGER) + 0.5) * 0.5 - 180 AS lon, COUNT(*) AS n "
+        "FROM ais_positions GROUP BY 1, 2 ORDER BY 1, 2",
+        "SELECT (FLOOR((latitude + 90) / 0.5) + 0.5) * 0.5 - 90 AS lat, "
+        "(FLOOR((longitude + 180) / 0.5) + 0.5) * 0.5 - 180 AS lon, COUNT(*) AS n "
+        "FROM ais_positions GROUP BY 1, 2 ORDER BY 1, 2",
+    ),
+    'one vessel track': (
+        "SELECT * FROM ais_positions WHERE mmsi = 100000042 ORDER BY timestamp",
+        "SELECT * FROM ais_positions WHERE mmsi = 100000042 ORDER BY timestamp",
+    ),
+}
+
+
+def timed(fn, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def same_result(a, b) -> bool:
+    if a is None or b is None or len(a) != len(b):
+        return False
+    numeric = [c for c in a.columns if c in b.columns and pd.api.types.is_numeric_dtype(a[c])]
+    return all(np.isclose(a[c].sum(), b[c].sum(), rtol=1e-6, equal_nan=True) for c in numeric)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--db', default='bench_columnar.db')
+    parser.add_argument('--mirror', default='bench_columnar')
+    parser.add_argument('--keep', action='store_true', help='reuse an existing --db')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if not columnar.HAS_DUCKDB:
+        raise SystemExit("duckdb and pyarrow are required for this benchmark")
+    shutil.rmtree(args.mirror, ignore_errors=True)
+    if not args.keep and os.path.exists(args.db):
+        os.remove(args.db)
+    db = DatabaseManager(f'sqlite:///{args.db}', columnar_config={'enabled': True, 'path': args.mirror})
+    if not args.keep:
+        steps = int(args.days * 24 * 6)
+        start = time.perf_counter()
+        written = db.load_sample_data(n_vessels=max(1, args.rows // steps), days=args.days,
+                                      interval_minutes=10, seed=0)
+        print(f"loaded {written:,} rows in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    synced = db.columnar.sync()
+    size = sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(args.mirror) for name in names)
+    print(f"mirrored ids {synced['from_id']}..{synced['to_id']} in {time.perf_counter() - start:.1f}s "
+          f"({size / 2 ** 20:.0f} MB Parquet, SQLite file {os.path.getsize(args.db) / 2 ** 20:.0f} MB)")
+
+    latest = db.execute_query("SELECT MAX(timestamp) AS t FROM ais_positions")['t'].iloc[0]
+    since = str(np.datetime64(latest.replace(' ', 'T')) - np.timedelta64(3, 'D')).replace('T', ' ')
+    print(f"{'query':<22}{'sqlite (ms)':>13}{'duckdb (ms)':>13}{'speedup':>9}  same")
+    for name, (sqlite_sql, duckdb_sql) in QUERIES.items():
+        sqlite_sql = sqlite_sql.format(since=since, since_day=since[:10])
+        duckdb_sql = duckdb_sql.format(since=since, since_day=since[:10])
+        # Straight to the engine, so the result cache doesn't serve repeats
+        with db.engine.connect() as conn:
+            sqlite_s, sqlite_rows = timed(lambda: pd.read_sql_query(text(sqlite_sql), conn), args.repeat)
+        duckdb_s, duckdb_rows = timed(lambda: db.columnar.query(duckdb_sql), args.repeat)
+        print(f"{name:<22}{sqlite_s * 1000:>13.1f}{duckdb_s * 1000:>13.1f}"
+              f"{sqlite_s / duckdb_s:>8.1f}x  {'yes' if same_result(sqlite_rows, duckdb_rows) else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
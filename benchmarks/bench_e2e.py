@@ -0,0 +1,308 @@
+"""End-to-end latency, memory and payload of the chain, database queries and figures.
+
+    python -m benchmarks.bench_e2e --scales 50 200 1000 --output bench_e2e.json
+    python -m benchmarks.bench_e2e --compare before.json after.json
+
+For each scale (``--scales`` vessels reporting every ``--interval-minutes``
+over ``--days``) a sample database is generated and three groups are timed
+``--repeat`` times: each stage of EDAChain.process_query plus building the
+figure the app would show, each DatabaseManager query, and each
+VisualizationManager figure. The chain runs on the stand-in LLM from
+benchmarks/stub_llm.py, so LLM calls cost ``--llm-latency`` each and nothing
+else. Peak memory is traced in a separate tracemalloc pass so it doesn't skew
+the timings. p50/p95 (ms), peak MB and figure payload bytes are written to
+``--output``; ``--compare`` prints the p50 change between two such files.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.stub_llm import CANNED_SQL, StubLLM
+from chains.eda_chain import EDAChain
+from database.db_manager import DatabaseManager
+from database.rollups import SPEED_BUCKET_KNOTS
+from utils.encounters import EncounterDetector
+from utils.visualization import VisualizationManager
+
+# Questions for the chain: routed ones never reach the LLM, the rest get the
+# stand-in's SQL and visualization for that question
+CHAIN_QUESTIONS = {
+    "Show vessel positions in the last 24 hours": None,
+    "Track 100000002 over the last 12 hours": None,
+    "Speed distribution over the past day": None,
+    "Which vessels behaved oddly in the last 3 days?": None,
+    "Which vessels were moving yesterday?": {
+        'sql': CANNED_SQL,
+        'viz': {'viz_type': 'vessel_map', 'parameters': {}},
+    },
+    "Compare average speed by vessel type": {
+        'sql': "SELECT v.vessel_type, COUNT(DISTINCT p.mmsi) AS vessels, AVG(p.speed) AS speed "
+               "FROM ais_positions p JOIN vessels v ON v.mmsi = p.mmsi GROUP BY v.vessel_type",
+        'viz': {'viz_type': 'vessel_type_distribution', 'parameters': {}},
+    },
+    "How did fleet speed change hour by hour?": {
+        'sql': "SELECT hour AS timestamp, SUM(speed_sum) / SUM(speeds) AS speed FROM vessel_hourly "
+               "GROUP BY hour ORDER BY hour",
+        'viz': {'viz_type': 'time_series', 'parameters': {'ma_window': 6}},
+    },
+    "Show the routes of the ten busiest vessels": {
+        'sql': "SELECT v.vessel_name, p.* FROM ais_positions p JOIN vessels v ON v.mmsi = p.mmsi "
+               "WHERE p.mmsi IN (SELECT mmsi FROM ais_positions GROUP BY mmsi ORDER BY COUNT(*) DESC LIMIT 10) "
+               "ORDER BY p.mmsi, p.timestamp",
+        'viz': {'viz_type': 'route_analysis', 'parameters': {}},
+    },
+}
+
+# name -> f(db, context); context carries a sample vessel and time window
+QUERIES: Dict[str, Callable[[DatabaseManager, Dict[str, Any]], Any]] = {
+    'recent_positions_24h': lambda db, ctx: db.get_recent_positions(24),
+    'vessels': lambda db, ctx: db.get_vessels(),
+    'vessel_info': lambda db, ctx: db.get_vessel_info(ctx['mmsi']),
+    'vessel_info_many': lambda db, ctx: db.get_vessel_info_many(ctx['mmsis']),
+    'find_vessel': lambda db, ctx: db.find_vessel(ctx['name']),
+    'vessel_track': lambda db, ctx: db.get_vessel_track(ctx['mmsi']),
+    'positions_in_bbox': lambda db, ctx: db.get_positions_in_bbox(30, -110, 40, -90, start=ctx['since']),
+    'density_grid': lambda db, ctx: db.get_density_grid(0.5),
+    'speed_histogram_24h': lambda db, ctx: db.get_speed_histogram(start=ctx['since']),
+    'speed_summary_24h': lambda db, ctx: db.get_speed_summary(start=ctx['since']),
+    'hourly_speed': lambda db, ctx: db.get_hourly_speed(),
+    'vessel_type_counts': lambda db, ctx: db.get_vessel_type_counts(),
+    'port_events': lambda db, ctx: db.get_port_events(),
+    'anomaly_summary': lambda db, ctx: db.get_anomaly_summary(),
+    'ad_hoc_aggregate': lambda db, ctx: db.execute_query(
+        "SELECT navigation_status, COUNT(*) AS n, AVG(speed) AS speed FROM ais_positions GROUP BY 1"
+    ),
+}
+
+# name -> (viz type, f(db, context) -> data, viz params)
+FIGURES = {
+    'vessel_map': ('vessel_map', lambda db, ctx: ctx['recent'], {}),
+    'vessel_map_encounters': ('vessel_map', lambda db, ctx: ctx['encounters'], {}),
+    'vessel_density_grid': ('vessel_density', lambda db, ctx: db.get_density_grid(0.5), {}),
+    'vessel_density_raw': ('vessel_density', lambda db, ctx: ctx['recent'], {}),
+    'speed_analysis_raw': ('speed_analysis', lambda db, ctx: ctx['recent'], {}),
+    'speed_analysis_binned': ('speed_analysis', lambda db, ctx: db.get_speed_histogram(),
+                              {'bin_width': SPEED_BUCKET_KNOTS}),
+    'port_activity': ('port_activity', lambda db, ctx: db.get_port_events(), {}),
+    'vessel_type_distribution': ('vessel_type_distribution', lambda db, ctx: db.get_vessel_type_counts(), {}),
+    'time_series': ('time_series', lambda db, ctx: db.get_hourly_speed(), {'ma_window': 6}),
+    'route_analysis': ('route_analysis', lambda db, ctx: ctx['recent'], {}),
+}
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/max in milliseconds"""
+    ms = np.asarray(samples) * 1000
+    return {
+        'n': len(samples),
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'max_ms': round(float(ms.max()), 2),
+    }
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_mb(fn: Callable[[], Any]) -> float:
+    """Peak memory traced while ``fn`` runs, above what was allocated before"""
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    return round((tracemalloc.get_traced_memory()[1] - base) / 2 ** 20, 2)
+
+
+def bench_chain(chain: EDAChain, db: DatabaseManager, viz: VisualizationManager, repeat: int) -> Dict:
+    stages: Dict[str, List[float]] = {}
+
+    def answer(question):
+        response = chain.process_query(question, db)
+        if response.get('error'):
+            raise RuntimeError(response['text'])
+        start = time.perf_counter()
+        if response.get('needs_visualization') and response.get('data') is not None:
+            viz.create_visualization(response['data'], response['viz_type'], **response.get('viz_params', {}))
+        for entry in response.get('trace', []):
+            stages.setdefault(entry['stage'], []).append(entry['duration_ms'] / 1000)
+        stages.setdefault('figure', []).append(time.perf_counter() - start)
+        return response
+
+    questions = {}
+    for question in CHAIN_QUESTIONS:
+        questions[question] = measure(lambda: answer(question), repeat)
+        if 'error' not in questions[question]:
+            questions[question]['route'] = answer(question).get('route', 'llm')
+    return {'stages': {name: summarize(samples) for name, samples in stages.items()}, 'questions': questions}
+
+
+def bench_queries(db: DatabaseManager, context: Dict[str, Any], repeat: int) -> Dict:
+    results = {}
+    for name, query in QUERIES.items():
+        results[name] = measure(lambda: query(db, context), repeat)
+    return results
+
+
+def bench_figures(db: DatabaseManager, viz: VisualizationManager, context: Dict[str, Any], repeat: int) -> Dict:
+    results = {}
+    for name, (viz_type, data_fn, params) in FIGURES.items():
+        data = data_fn(db, context)
+        results[name] = measure(lambda: viz.create_visualization(data, viz_type, **params), repeat)
+        if 'error' not in results[name]:
+            results[name]['rows'] = len(data)
+            results[name]['payload_bytes'] = len(viz.create_visualization(data, viz_type, **params).to_json().encode())
+    return results
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict:
+    """Timings and peak memory of ``fn``, or the error it raised
+
+    A failing case (e.g. a missing optional dependency) is recorded rather
+    than ending the run.
+    """
+    try:
+        result = fn()
+    except Exception as e:
+        print(f"  failed: {type(e).__name__}: {e}")
+        return {'error': f"{type(e).__name__}: {e}"}
+    return {
+        **summarize(timed(fn, repeat)),
+        'peak_mb': peak_mb(fn),
+        'rows': len(result) if hasattr(result, '__len__') else None,
+    }
+
+
+def bench_scale(vessels: int, args, directory: str) -> Dict:
+    db = DatabaseManager(
+        f"sqlite:///{os.path.join(directory, f'bench_{vessels}.db')}",
+        columnar_config={'enabled': True, 'path': os.path.join(directory, f'columnar_{vessels}')}
+        if args.columnar else None,
+    )
+    start = time.perf_counter()
+    rows = db.load_sample_data(n_vessels=vessels, days=args.days, interval_minutes=args.interval_minutes, seed=0)
+    load_s = time.perf_counter() - start
+    print(f"{vessels} vessels: {rows:,} positions loaded in {load_s:.1f}s")
+
+    since = (datetime.now(timezone.utc) - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
+    recent = db.get_recent_positions(24)
+    context = {
+        'mmsi': 100000002,
+        'mmsis': list(range(100000000, 100000000 + min(vessels, 50))),
+        'name': 'MARITIME_3',
+        'since': since,
+        'recent': recent,
+        'encounters': EncounterDetector(max_workers=1).detect(recent),
+    }
+    llm = StubLLM(latency=args.llm_latency, answers={q: a for q, a in CHAIN_QUESTIONS.items() if a})
+    chain = EDAChain(llm, {'enabled': False}, {'router': True})
+    viz = VisualizationManager()
+
+    return {
+        'vessels': vessels,
+        'positions': rows,
+        'load_s': round(load_s, 2),
+        'chain': bench_chain(chain, db, viz, args.repeat),
+        'queries': bench_queries(db, context, args.repeat),
+        'figures': bench_figures(db, viz, context, args.repeat),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def report(result: Dict) -> None:
+    print(f"{'':<4}{'name':<48}{'p50 (ms)':>10}{'p95 (ms)':>10}{'peak MB':>9}{'payload':>10}")
+    rows = [('q', name, stats) for name, stats in result['queries'].items()]
+    rows += [('f', name, stats) for name, stats in result['figures'].items()]
+    rows += [('s', name, stats) for name, stats in result['chain']['stages'].items()]
+    rows += [('c', question, stats) for question, stats in result['chain']['questions'].items()]
+    for group, name, stats in rows:
+        if 'error' in stats:
+            print(f"{group:<4}{name[:46]:<48}  {stats['error'][:60]}")
+            continue
+        peak = f"{stats['peak_mb']:.1f}" if 'peak_mb' in stats else ''
+        payload = f"{stats['payload_bytes'] / 1024:.0f} kB" if 'payload_bytes' in stats else ''
+        print(f"{group:<4}{name[:46]:<48}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{peak:>9}{payload:>10}")
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as f:
+        before = {scale['vessels']: scale for scale in json.load(f)['scales']}
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'vessels':>8}  {'name':<56}{'before':>10}{'after':>10}{'change':>9}")
+    for scale in after['scales']:
+        base = before.get(scale['vessels'])
+        if base is None:
+            continue
+        rows = [(f"{group}:{name}", stats, base[group].get(name))
+                for group in ('queries', 'figures') for name, stats in scale[group].items()]
+        rows += [(f"stage:{name}", stats, base['chain']['stages'].get(name))
+                 for name, stats in scale['chain']['stages'].items()]
+        for name, stats, old in rows:
+            if old is None or 'error' in stats or not old.get('p50_ms'):
+                continue
+            change = stats['p50_ms'] / old['p50_ms'] - 1
+            print(f"{scale['vessels']:>8}  {name[:54]:<56}{old['p50_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+                  f"{change:>+9.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[50, 200, 1000], help='vessel counts')
+    parser.add_argument('--days', type=float, default=3)
+    parser.add_argument('--interval-minutes', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--llm-latency', type=float, default=0.0)
+    parser.add_argument('--columnar', action='store_true', help='serve analytical scans from the DuckDB mirror')
+    parser.add_argument('--output', default='bench_e2e.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    tracemalloc.start()
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'versions': {'numpy': np.__version__, 'pandas': pd.__version__},
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'scales': [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for vessels in args.scales:
+            result = bench_scale(vessels, args, directory)
+            report(result)
+            results['scales'].append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
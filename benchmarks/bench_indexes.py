@@ -0,0 +1,83 @@
+"""Query-time comparison for ais_positions with and without the migrated indexes.
+
+    python -m benchmarks.bench_indexes --rows 10000000
+
+Generates a sample fleet of roughly ``--rows`` positions (hourly fixes over
+``--days``), times the hot DatabaseManager queries with all migrations applied,
+then drops the indexes and R*Tree and times the same queries again. Loading
+10M rows through the index and R*Tree maintenance takes several minutes.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from sqlalchemy import text
+
+from database.db_manager import DatabaseManager
+
+INDEXES = [
+    'ux_ais_positions_mmsi_timestamp',
+    'ix_ais_positions_timestamp',
+    'ix_ais_positions_cell_timestamp',
+]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run_queries(db, repeat, indexed):
+    bbox = (34.0, -100.0, 36.0, -98.0)
+    queries = {
+        'get_recent_positions(6)': lambda: db.get_recent_positions(6),
+        'get_vessel_info': lambda: db.get_vessel_info(100000042),
+        'bbox (2x2 deg)': (
+            (lambda: db.get_positions_in_bbox(*bbox)) if indexed else
+            (lambda: db.execute_query(
+                "SELECT * FROM ais_positions WHERE latitude BETWEEN 34 AND 36 "
+                "AND longitude BETWEEN -100 AND -98 ORDER BY mmsi, timestamp"
+            ))
+        ),
+    }
+    return {name: timed(fn, repeat) for name, fn in queries.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--db', default='bench_indexes.db')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    db = DatabaseManager(f'sqlite:///{args.db}')
+
+    steps = int(args.days * 24)
+    start = time.perf_counter()
+    written = db.load_sample_data(n_vessels=max(1, args.rows // steps), days=args.days, seed=0)
+    print(f"loaded {written:,} rows in {time.perf_counter() - start:.1f}s")
+
+    indexed = run_queries(db, args.repeat, indexed=True)
+
+    with db.engine.begin() as conn:
+        for name in INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("DROP TABLE IF EXISTS ais_positions_rtree"))
+    scan = run_queries(db, args.repeat, indexed=False)
+
+    print(f"{'query':<28}{'indexed (ms)':>14}{'full scan (ms)':>16}{'speedup':>10}")
+    for name in indexed:
+        print(f"{name:<28}{indexed[name] * 1000:>14.1f}{scan[name] * 1000:>16.1f}"
+              f"{scan[name] / indexed[name]:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Latency and hit rate of the intent router compared with the full EDA chain.
+
+    python -m benchmarks.bench_router --vessels 500 --llm-latency 2.0
+
+The full chain runs on the stand-in LLM from benchmarks/stub_llm.py, so its
+numbers are chain/database overhead plus ``--llm-latency`` per LLM call.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.stub_llm import StubLLM
+from chains.eda_chain import EDAChain
+from database.db_manager import DatabaseManager
+
+QUESTIONS = [
+    "Show vessel positions in the last 24 hours",
+    "Where were ships in the past 3 days?",
+    "Vessel density heatmap for the last week",
+    "Show info for vessel 100000004",
+    "100000017",
+    "Display trajectory of vessel MARITIME_3",
+    "Track 100000002 over the last 12 hours",
+    "What is the vessel type breakdown?",
+    "Average speed in the last 6 hours",
+    "Speed distribution over the past day",
+    "Analyze port calls at Rotterdam",
+    "Which tankers spent the most time at anchor?",
+    "Compare container ship speeds by flag",
+    "Which vessels are heading to Singapore?",
+]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vessels', type=int, default=500)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--llm-latency', type=float, default=2.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    db = DatabaseManager('sqlite://')
+    db.load_sample_data(n_vessels=args.vessels, days=args.days, seed=0)
+
+    llm = StubLLM(latency=args.llm_latency)
+    routed_chain = EDAChain(llm, {'enabled': False}, {'router': True})
+    full_chain = EDAChain(llm, {'enabled': False}, {'router': False})
+
+    routed, fallback, full = [], [], []
+    hits = 0
+    for question in QUESTIONS:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            matched = routed_chain.router.route(question, db) is not None
+            (routed if matched else fallback).append(time.perf_counter() - start)
+        hits += matched
+
+        start = time.perf_counter()
+        full_chain.process_query(question, db)
+        full.append(time.perf_counter() - start)
+
+    print(f"hit rate: {hits}/{len(QUESTIONS)} ({hits / len(QUESTIONS):.0%})")
+    print(f"{'path':<28}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for name, samples in [('router hit', routed), ('router miss (to LLM)', fallback), ('full chain', full)]:
+        if samples:
+            print(f"{name:<28}{statistics.median(samples) * 1000:>12.1f}{percentile(samples, 0.95) * 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
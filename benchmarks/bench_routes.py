@@ -0,0 +1,87 @@
+"""Route analysis figure build time and payload, per-vessel loop vs vectorized.
+
+    python -m benchmarks.bench_routes --vessels 1000 10000 --points 100
+
+The legacy implementation (one boolean mask and one trace per vessel) is
+only run up to ``--legacy-max-vessels`` because it is O(vessels x rows).
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils.visualization import VisualizationManager
+
+
+def synthetic_tracks(n_vessels: int, points: int, seed: int = 0) -> pd.DataFrame:
+    """Random-walk tracks with the columns route analysis needs"""
+    rng = np.random.default_rng(seed)
+    shape = (n_vessels, points)
+    lat = np.clip(rng.uniform(-60, 60, (n_vessels, 1)) + np.cumsum(rng.normal(0, 0.05, shape), axis=1), -85, 85)
+    lon = np.mod(rng.uniform(-180, 180, (n_vessels, 1)) + np.cumsum(rng.normal(0, 0.05, shape), axis=1) + 180,
+                 360) - 180
+    mmsi = np.repeat(100_000_000 + np.arange(n_vessels), points)
+    timestamps = pd.date_range('2024-01-01', periods=points, freq='10min').strftime('%Y-%m-%d %H:%M:%S')
+    frame = pd.DataFrame({
+        'mmsi': mmsi,
+        'vessel_name': np.char.add('MARITIME_', (mmsi - 100_000_000).astype(str)),
+        'timestamp': np.tile(timestamps, n_vessels),
+        'latitude': lat.ravel(),
+        'longitude': lon.ravel(),
+        'speed': rng.uniform(0, 20, n_vessels * points),
+    })
+    # Query results arrive interleaved in time, not grouped by vessel
+    return frame.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def legacy_route_analysis(data: pd.DataFrame) -> go.Figure:
+    """The original per-vessel implementation, kept for comparison"""
+    fig = go.Figure()
+    for vessel in data['mmsi'].unique():
+        vessel_data = data[data['mmsi'] == vessel].sort_values('timestamp')
+        fig.add_trace(go.Scattergeo(
+            lon=vessel_data['longitude'],
+            lat=vessel_data['latitude'],
+            mode='lines+markers',
+            name=f'Vessel {vessel}',
+            customdata=vessel_data[['vessel_name', 'timestamp', 'speed']].values
+        ))
+    return fig
+
+
+def measure(build, data, repeat):
+    timings, payload, traces = [], 0, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = build(data)
+        payload = len(fig.to_json())
+        timings.append(time.perf_counter() - start)
+        traces = len(fig.data)
+    return statistics.median(timings), payload, traces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vessels', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--points', type=int, default=100, help='positions per vessel')
+    parser.add_argument('--legacy-max-vessels', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    viz = VisualizationManager()
+    print(f"{'vessels':>8} {'rows':>10} {'impl':>10} {'build+json s':>13} {'payload KB':>11} {'traces':>7}")
+    for n_vessels in args.vessels:
+        data = synthetic_tracks(n_vessels, args.points)
+        impls = [('vectorized', lambda d: viz.create_visualization(d, 'route_analysis'))]
+        if n_vessels <= args.legacy_max_vessels:
+            impls.insert(0, ('legacy', legacy_route_analysis))
+        for name, build in impls:
+            seconds, payload, traces = measure(build, data, 1 if name == 'legacy' else args.repeat)
+            print(f"{n_vessels:>8} {len(data):>10} {name:>10} {seconds:>13.2f} {payload // 1024:>11} {traces:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Deterministic stand-in for LLMUtils, for benchmarks that must run without the model.
+
+It is a LangChain ``LLM`` (so EDAChain can wrap it in LLMChain) that also
+implements the LLMUtils methods the chain calls directly. Each call sleeps
+for ``latency`` seconds to approximate generation time. ``answers`` maps a
+question to the SQL and visualization JSON returned for prompts that contain
+it; other questions get the canned defaults below.
+"""
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain.llms.base import LLM
+
+CANNED_SQL = """
+SELECT v.vessel_name, v.vessel_type, p.*
+FROM ais_positions p
+JOIN vessels v ON p.mmsi = v.mmsi
+WHERE p.timestamp >= datetime('now', '-24 hours')
+ORDER BY p.timestamp DESC
+"""
+
+CANNED_VIZ = {"viz_type": "vessel_map", "parameters": {}}
+
+CANNED_ANALYSIS = {
+    "query_type": "vessel_tracking",
+    "time_range": "24h",
+    "vessel_filter": None,
+    "area": None,
+    "visualization": "map",
+}
+
+CANNED_TEXT = "Vessel traffic over the last day is concentrated along the main shipping lanes."
+
+
+class StubLLM(LLM):
+    latency: float = 0.0
+    answers: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        time.sleep(self.latency)
+        answer = next((a for question, a in self.answers.items() if question in prompt), {})
+        if "Generate a SQL query" in prompt:
+            return answer.get('sql', CANNED_SQL)
+        if "best visualization" in prompt:
+            return json.dumps(answer.get('viz', CANNED_VIZ))
+        return CANNED_TEXT
+
+    def generate_response(self, prompt: str, prefix: Optional[str] = None) -> str:
+        return self._call(prompt)
+
+    def analyze_maritime_query(self, query: str) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        return dict(CANNED_ANALYSIS)
+
+    def stream_response(self, prompt: str, max_new_tokens: Optional[int] = None) -> Iterator[str]:
+        words = CANNED_TEXT.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
@@ -1,13 +1,43 @@
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
+from utils.data_profile import DataProfiler
 from utils.llm_utils import LLMUtils
+from utils.encounters import EncounterDetector
+from utils.trajectory import TrajectoryEngine
+from chains.executor import Stage, StageExecutor
+from chains.intent_router import IntentRouter
+from chains.sql_cache import SQLCache
+from database.sql_guard import validate_sql
+from prompts.eda_prompts import EDAPrompts
 import json
+import pandas as pd
+import time
 
 class EDAChain:
-    def __init__(self, llm_utils: LLMUtils):
-        """Initialize EDA Chain"""
+    def __init__(self, llm_utils: LLMUtils, sql_cache_config: Optional[Dict[str, Any]] = None,
+                 chain_config: Optional[Dict[str, Any]] = None,
+                 maritime_config: Optional[Dict[str, Any]] = None):
+        """Initialize EDA Chain
+
+        ``maritime_config`` (ports and stop thresholds) configures the
+        trajectory metrics added to position results and the close-encounter
+        search.
+        """
         self.llm = llm_utils
+        chain_config = chain_config or {}
+        self.trajectory = TrajectoryEngine.from_config(maritime_config)
+        self.executor = StageExecutor(max_workers=chain_config.get('max_workers', 8))
+        self.stage_timeouts: Dict[str, float] = chain_config.get('stage_timeouts', {})
+        self.encounters = EncounterDetector.from_config(maritime_config)
+        self.router = IntentRouter(enabled=chain_config.get('router', True), trajectory=self.trajectory,
+                                   encounters=self.encounters)
+        self.schema_tokens = chain_config.get('schema_tokens', 600)
+        sql_cache_config = sql_cache_config or {}
+        self.sql_cache = SQLCache(
+            max_entries=sql_cache_config.get('max_entries', 1000),
+            enabled=sql_cache_config.get('enabled', True),
+        )
         self.setup_chains()
 
     def setup_chains(self):
@@ -25,6 +55,18 @@ class EDAChain:
                 {question}
                 
                 The query should be optimized and include proper joins if needed.
+                For hourly speeds, speed distributions, vessel type counts and
+                arrivals/departures, query the rollup tables (vessel_hourly,
+                speed_histogram_hourly, vessel_type_counts, port_events)
+                instead of aggregating ais_positions.
+                For reporting gaps, teleports, speed jumps and out-of-range
+                speed/course values, query position_anomalies (one row per
+                flagged position; anomaly is gap, teleport, speed_jump,
+                speed_range or course_range).
+                Leg distance, derived speed/course, cumulative distance and
+                stops are computed for you from any result with mmsi,
+                timestamp, latitude and longitude, so select those columns
+                rather than computing distances in SQL.
                 """
             )
         )
@@ -42,77 +84,180 @@ class EDAChain:
                 {question}
                 
                 Return a JSON with:
-                {
+                {{
                     "viz_type": "type of visualization",
-                    "parameters": {"param1": "value1", ...}
-                }
+                    "parameters": {{"param1": "value1", ...}}
+                }}
                 """
             )
         )
 
     def process_query(self, query: str, db_manager) -> Dict[str, Any]:
-        """Process natural language query"""
+        """Process natural language query
+
+        Stages run as a DAG: query analysis overlaps SQL generation and
+        execution, and the answer text and visualization choice both start as
+        soon as the data is in. The per-stage latency trace is returned under
+        ``"trace"``. Templated questions are answered by the intent router
+        without calling the LLM.
+        """
         try:
-            # Analyze query
-            analysis = self.llm.analyze_maritime_query(query)
-            
-            # Generate SQL
-            sql_query = self.generate_sql_query(query, db_manager)
-            
-            # Execute query
-            data = db_manager.execute_query(sql_query)
-            
-            # Determine visualization
-            viz_params = self.recommend_visualization(data, query)
-            
-            # Generate response
-            response = self.generate_response(data, analysis, viz_params)
-            
+            routed = self.router.route(query, db_manager)
+            if routed is not None:
+                return routed
+
+            run = self.executor.run(self._build_stages(query, db_manager, with_text=True))
+            response = self.generate_response(
+                run.result('data'), run.result('analysis'), run.result('viz'), run.result('text')
+            )
+            response["trace"] = run.trace
             return response
-            
+
         except Exception as e:
             return {
                 "text": f"I encountered an error: {str(e)}",
                 "error": True
             }
 
+    def process_query_stream(self, query: str, db_manager) -> Iterator[Dict[str, Any]]:
+        """Process natural language query, yielding partial results as they arrive
+
+        Yields ``{"stage": "sql", "sql": ...}`` once the query is known, then
+        ``{"stage": "text", "delta": ...}`` for each chunk of the answer, and
+        finally ``{"stage": "done", "response": ...}`` carrying the same dict
+        process_query returns. The visualization choice runs in the background
+        while the answer streams.
+        """
+        try:
+            routed = self.router.route(query, db_manager)
+            if routed is not None:
+                yield {"stage": "text", "delta": routed["text"]}
+                yield {"stage": "done", "response": routed}
+                return
+
+            run = self.executor.start(self._build_stages(query, db_manager, with_text=False))
+            yield {"stage": "sql", "sql": run.result('sql')}
+
+            data, analysis = run.result('data'), run.result('analysis')
+            text = ""
+            start = time.perf_counter()
+            for delta in self.llm.stream_response(self._response_prompt(data, analysis)):
+                text += delta
+                yield {"stage": "text", "delta": delta}
+            run.record('text', start, 'ok')
+
+            response = self.generate_response(data, analysis, run.result('viz'), text)
+            response["trace"] = run.trace
+            yield {"stage": "done", "response": response}
+
+        except Exception as e:
+            yield {
+                "stage": "done",
+                "response": {"text": f"I encountered an error: {str(e)}", "error": True}
+            }
+
+    def _build_stages(self, query: str, db_manager, with_text: bool) -> List[Stage]:
+        """Stage DAG for one query"""
+        timeouts = self.stage_timeouts
+        stages = [
+            Stage('analysis', lambda: self.llm.analyze_maritime_query(query),
+                  timeout=timeouts.get('analysis')),
+            Stage('sql', lambda: self.generate_sql_query(query, db_manager),
+                  timeout=timeouts.get('sql')),
+            Stage('data', lambda sql: self._execute_sql(query, sql, db_manager), ['sql'],
+                  timeout=timeouts.get('data')),
+            Stage('viz', lambda data: self.recommend_visualization(data, query), ['data'],
+                  timeout=timeouts.get('viz')),
+        ]
+        if with_text:
+            stages.append(Stage('text', self._generate_natural_response, ['data', 'analysis'],
+                                timeout=timeouts.get('text')))
+        return stages
+
+    def _execute_sql(self, question: str, sql_query: str, db_manager):
+        """Run generated SQL within the result budget, remembering it if it succeeded
+
+        Position results get the trajectory columns (see TrajectoryEngine.enrich).
+        """
+        guarded = db_manager.guard_query(sql_query)
+        data = db_manager.execute_query(guarded.sql)
+        if data is not None:
+            data = self.trajectory.enrich(data)
+            data.attrs['sql_guard'] = guarded.to_dict(len(data))
+            self.sql_cache.store(question, sql_query, self._schema_version(db_manager))
+        return data
+
     def generate_sql_query(self, question: str, db_manager) -> str:
-        """Generate SQL query from natural language"""
+        """Generate SQL query from natural language
+
+        Repeat questions (ignoring case, punctuation and filler words) are
+        answered from the SQL cache instead of the LLM.
+        """
+        cached = self.sql_cache.lookup(question, self._schema_version(db_manager))
+        if cached is not None:
+            return cached
         schema = self._get_schema_description(db_manager)
         response = self.sql_chain.run(question=question, schema=schema)
         return self._clean_sql_query(response)
 
     def recommend_visualization(self, data, question) -> Dict[str, Any]:
-        """Recommend visualization type"""
-        data_description = data.describe().to_dict()
+        """Recommend visualization type
+
+        ``data`` is a DataFrame or an iterable of chunks (see
+        DatabaseManager.iter_query); it is profiled in one pass.
+        """
+        if data is None:
+            return {"viz_type": None, "parameters": {}}
+        frames = [data] if isinstance(data, pd.DataFrame) else data
         response = self.viz_chain.run(
-            data_description=json.dumps(data_description),
+            data_description=DataProfiler.from_frames(frames).describe(),
             question=question
         )
         return json.loads(response)
 
-    def generate_response(self, data, analysis, viz_params) -> Dict[str, Any]:
+    def generate_response(self, data, analysis, viz_params, text: Optional[str] = None) -> Dict[str, Any]:
         """Generate final response"""
         return {
-            "text": self._generate_natural_response(data, analysis),
+            "text": text if text is not None else self._generate_natural_response(data, analysis),
             "data": data,
             "viz_type": viz_params["viz_type"],
             "viz_params": viz_params["parameters"],
-            "needs_visualization": True
+            "needs_visualization": viz_params["viz_type"] is not None
         }
 
+    def _generate_natural_response(self, data, analysis) -> str:
+        """Summarize the query result in natural language"""
+        return self.llm.generate_response(self._response_prompt(data, analysis))
+
+    @staticmethod
+    def _response_prompt(data, analysis) -> str:
+        """Prompt asking the LLM to explain a query result"""
+        if data is None:
+            sample = "The query returned no data."
+        else:
+            sample = f"{len(data)} rows. First rows:\n{data.head(20).to_csv(index=False)}"
+            note = data.attrs.get('sql_guard', {}).get('note')
+            if note:
+                sample += f"\nNote: {note}."
+        return EDAPrompts.get_analysis_prompt().format(data=sample) + f"\nQuery analysis: {json.dumps(analysis)}\n"
+
     @staticmethod
     def _clean_sql_query(query: str) -> str:
-        """Clean and validate SQL query"""
-        # Add query cleaning logic
-        return query.strip()
+        """Clean and validate SQL query
+
+        Extracts the statement from the LLM reply and rejects anything that
+        is not a single read-only query (raises UnsafeQueryError).
+        """
+        return validate_sql(query)
 
     @staticmethod
-    def _get_schema_description(db_manager) -> str:
-        """Get database schema description"""
-        # Add schema extraction logic
-        return """
-        Tables:
-        - vessels (mmsi, vessel_name, vessel_type, length, width, flag)
-        - ais_positions (mmsi, timestamp, latitude, longitude, speed, course)
+    def _schema_version(db_manager) -> str:
+        """Version stamp of the schema the SQL was generated against
+
+        Only the table layout counts, so cached SQL survives new data.
         """
+        return db_manager.schema_signature()
+
+    def _get_schema_description(self, db_manager) -> str:
+        """Get database schema description"""
+        return db_manager.describe_schema(max_tokens=self.schema_tokens)
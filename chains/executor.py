@@ -0,0 +1,176 @@
+
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from utils.cancellation import cancel_scope
+from utils.metrics import metrics, profile_thread
+
+
+class StageTimeout(TimeoutError):
+    """A chain stage ran past its time budget"""
+
+
+class Stage:
+    """One step of a chain: ``fn`` is called with its dependencies' results as kwargs"""
+
+    def __init__(self, name: str, fn: Callable[..., Any], deps: Iterable[str] = (),
+                 timeout: Optional[float] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+
+
+class StageRun:
+    """A DAG of stages in flight; each stage starts as soon as its deps finish"""
+
+    def __init__(self, pool: ThreadPoolExecutor, stages: List[Stage]):
+        self._pool = pool
+        self._stages = {stage.name: stage for stage in stages}
+        self._futures: Dict[str, Future] = {name: Future() for name in self._stages}
+        self._lock = threading.Lock()
+        self._pending = {name: set(stage.deps) for name, stage in self._stages.items()}
+        # Set when a stage times out; the stage's own thread sees it via utils.cancellation
+        self._cancel = {name: threading.Event() for name in self._stages}
+        self._started = time.perf_counter()
+        self._trace: List[Dict[str, Any]] = []
+
+        for name, deps in self._pending.items():
+            unknown = deps - set(self._stages)
+            if unknown:
+                raise ValueError(f"Stage {name} depends on unknown stages: {sorted(unknown)}")
+
+        for name, stage in self._stages.items():
+            for dep in stage.deps:
+                self._futures[dep].add_done_callback(lambda _, n=name: self._maybe_start(n))
+            if not stage.deps:
+                self._start(name)
+
+    @property
+    def trace(self) -> List[Dict[str, Any]]:
+        """Per-stage timing records, in start order"""
+        with self._lock:
+            return sorted(self._trace, key=lambda record: record['start_ms'])
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Block until a stage finishes and return its value (or raise its error)"""
+        return self._futures[name].result(timeout)
+
+    def results(self) -> Dict[str, Any]:
+        """Wait for every stage; failed stages map to their exception"""
+        out = {}
+        for name, future in self._futures.items():
+            exc = future.exception()
+            out[name] = exc if exc is not None else future.result()
+        return out
+
+    def _maybe_start(self, name: str) -> None:
+        stage = self._stages[name]
+        with self._lock:
+            if self._futures[name].done() or name not in self._pending:
+                return
+            if not all(self._futures[dep].done() for dep in stage.deps):
+                return
+            del self._pending[name]
+        self._start(name)
+
+    def _start(self, name: str) -> None:
+        stage = self._stages[name]
+        with self._lock:
+            self._pending.pop(name, None)
+        target = self._futures[name]
+
+        for dep in stage.deps:
+            exc = self._futures[dep].exception()
+            if exc is not None:
+                self.record(name, time.perf_counter(), 'skipped')
+                self._settle(target, exc=exc)
+                return
+
+        kwargs = {dep: self._futures[dep].result() for dep in stage.deps}
+        start = time.perf_counter()
+
+        if stage.timeout is not None:
+            timer = threading.Timer(stage.timeout, self._expire, args=(name, start))
+            timer.daemon = True
+            timer.start()
+        else:
+            timer = None
+
+        cancel = self._cancel[name]
+
+        def run():
+            if cancel.is_set():
+                # Timed out while waiting for a worker; don't start it at all
+                return
+            try:
+                with profile_thread(), cancel_scope(cancel):
+                    value = stage.fn(**kwargs)
+            except Exception as e:
+                end = time.perf_counter()
+                if self._settle(target, exc=e):
+                    self.record(name, start, 'error', end)
+            else:
+                end = time.perf_counter()
+                if self._settle(target, value=value):
+                    self.record(name, start, 'ok', end)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+        self._pool.submit(run)
+
+    def _expire(self, name: str, start: float) -> None:
+        stage = self._stages[name]
+        if self._settle(self._futures[name], exc=StageTimeout(f"Stage '{name}' exceeded {stage.timeout}s")):
+            self._cancel[name].set()
+            self.record(name, start, 'timeout')
+
+    @staticmethod
+    def _settle(future: Future, value: Any = None, exc: Optional[BaseException] = None) -> bool:
+        """Resolve a future once; later results (e.g. after a timeout) are dropped"""
+        try:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(value)
+            return True
+        except InvalidStateError:
+            return False
+
+    def record(self, name: str, start: float, status: str, end: Optional[float] = None) -> None:
+        """Add a trace entry; also used for work done outside the DAG (e.g. streaming)"""
+        end = end if end is not None else time.perf_counter()
+        metrics.observe('chain_stage_seconds', end - start, stage=name, status=status)
+        with self._lock:
+            self._trace.append({
+                'stage': name,
+                'start_ms': round((start - self._started) * 1000, 1),
+                'duration_ms': round((end - start) * 1000, 1),
+                'status': status,
+            })
+
+
+class StageExecutor:
+    """Runs chain stages as a DAG on a shared thread pool
+
+    A stage that times out is failed with StageTimeout at once, but Python
+    can't stop its thread: the stage is only told to give up through its
+    cancellation flag (utils.cancellation). LLM calls honour it, so a hung
+    generation frees its worker within a poll interval and drops its queued
+    batch request; other stage code keeps its worker until it returns.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chain-stage')
+
+    def start(self, stages: List[Stage]) -> StageRun:
+        return StageRun(self._pool, stages)
+
+    def run(self, stages: List[Stage]) -> StageRun:
+        """Run stages to completion and return the finished run"""
+        run = self.start(stages)
+        run.results()
+        return run
@@ -0,0 +1,361 @@
+
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from database.rollups import SPEED_BUCKET_KNOTS
+from utils.encounters import EncounterDetector
+from utils.trajectory import TrajectoryEngine
+
+_MMSI = r"(?P<mmsi>\d{9})"
+_WINDOW = (
+    r"(?:last|past|previous)\s+(?:(?P<count>\d+)\s*)?"
+    r"(?P<unit>hours?|hrs?|h|days?|d|weeks?|w)\b"
+)
+_UNIT_HOURS = {'h': 1, 'd': 24, 'w': 168}
+_WITHIN_NM = r"\bwithin\s+(?P<distance>\d+(?:\.\d+)?)\s*(?:nm|nmi|nautical\s+miles?|miles?)\b"
+# Anomaly kinds a question can ask about by name (others get every kind)
+_ANOMALY_WORDS = {
+    'gap': r"\bgaps?\b|went\s+dark",
+    'teleport': r"teleport|spoof|jump(?:ed|s)?\s+position",
+    'speed_jump': r"speed\s+jumps?",
+    'speed_range': r"(?:invalid|impossible|out[\s-]of[\s-]range)\s+speeds?",
+    'course_range': r"(?:invalid|impossible|out[\s-]of[\s-]range)\s+courses?",
+}
+# Window for trajectory questions that don't name one
+_TRAJECTORY_HOURS = 168
+
+
+class Intent:
+    """A templated question: a compiled pattern plus the handler that answers it"""
+
+    def __init__(self, name: str, pattern: str, handler: Callable[..., Optional[Dict[str, Any]]]):
+        self.name = name
+        self.pattern = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        self.handler = handler
+
+
+class IntentRouter:
+    """Answers common, templated questions without the LLM
+
+    Each intent maps a question pattern straight onto a parameterized
+    DatabaseManager query and a fixed visualization type. ``route`` returns
+    a response in the same shape as EDAChain.process_query, or None when no
+    intent matches (or the match can't be resolved) so the caller falls back
+    to the LLM chain.
+    """
+
+    def __init__(self, enabled: bool = True, trajectory: Optional[TrajectoryEngine] = None,
+                 encounters: Optional[EncounterDetector] = None):
+        self.enabled = enabled
+        self.trajectory = trajectory or TrajectoryEngine()
+        self.encounters = encounters or EncounterDetector()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+        # Order matters: the first intent whose pattern matches and whose handler
+        # produces a response wins.
+        self.intents: List[Intent] = [
+            Intent('port_calls',
+                   r"\bport\s+(?:calls?|visits?)\b|\b(?:arrivals?|calls?)\s+(?:at|in)\s+(?:the\s+)?ports?\b",
+                   self._port_calls),
+            Intent('anchor_time',
+                   r"\btime\s+(?:at|on)\s+anchor\b|\banchor(?:ed|age)?\s+(?:time|hours|duration)\b"
+                   r"|\bhow\s+long\b.*\b(?:anchor(?:ed)?|moored|berthed)\b",
+                   self._anchor_time),
+            Intent('distance_sailed',
+                   r"\b(?:distance|miles|nm)\b.*\b(?:sailed|travell?ed|covered|steamed|run)\b"
+                   r"|\bhow\s+far\s+(?:did|does|has|have|had)\b.*\b(?:sail(?:ed)?|travell?(?:ed)?|go(?:ne)?"
+                   r"|steam(?:ed)?|run|come)\b",
+                   self._distance_sailed),
+            Intent('encounters',
+                   r"\b(?:close|near)[\s-]*(?:encounters?|quarters|miss(?:es)?|approach(?:es)?)\b"
+                   r"|\bcollision\s+risks?\b"
+                   rf"|\b(?:vessels?|ships?)\b.*{_WITHIN_NM}\s+of\s+(?:each\s+other|one\s+another)",
+                   self._encounters),
+            Intent('anomalies',
+                   r"\b(?:anomal(?:y|ies|ous)|odd(?:ly)?|strange(?:ly)?|suspicious|unusual(?:ly)?|spoof\w*"
+                   r"|teleport\w*|data\s+quality|went\s+dark|(?:reporting|ais|transmission)\s+gaps?"
+                   r"|speed\s+jumps?)\b",
+                   self._anomalies),
+            Intent('vessel_track',
+                   rf"^(?=.*\b(?:track|route|trajectory|path|movements?)\b)(?=.*\b{_MMSI}\b)",
+                   self._vessel_track),
+            Intent('vessel_track_by_name',
+                   r"\b(?:track|route|trajectory|path|movements?)\b.*?\b(?:vessel|ship)\s+(?P<name>[A-Z0-9][\w-]*)",
+                   self._vessel_track),
+            Intent('vessel_info',
+                   r"^(?:(?=.*\b(?:info|information|details?|about|describe|who)\b)"
+                   r"|(?=\s*(?:vessel|ship|mmsi)?\s*\d{9}\s*\??\s*$))"
+                   rf"(?=.*\b{_MMSI}\b)",
+                   self._vessel_info),
+            Intent('vessel_types',
+                   r"\b(?:vessel|ship)\s+types?\b.*\b(?:breakdown|distribution|split|mix|share|count)"
+                   r"|\b(?:breakdown|distribution|split|mix|share|count)\b.*\b(?:vessel|ship)\s+types?\b"
+                   r"|\bhow many\b.*\beach\b.*\btypes?\b",
+                   self._vessel_types),
+            Intent('speed_window',
+                   rf"^(?=.*\bspeeds?\b)(?=.*{_WINDOW})",
+                   self._speed_window),
+            Intent('recent_positions',
+                   r"^(?=.*\b(?:positions?|locations?|where|traffic|movements?|map|density|heat\s*map)\b)"
+                   rf"(?=.*{_WINDOW})",
+                   self._recent_positions),
+        ]
+
+    def route(self, question: str, db_manager) -> Optional[Dict[str, Any]]:
+        """Answer ``question`` directly if it matches a known intent"""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        for intent in self.intents:
+            match = intent.pattern.search(question)
+            if match is None:
+                continue
+            response = intent.handler(match, question, db_manager)
+            if response is not None:
+                response["route"] = intent.name
+                response["trace"] = [{
+                    'stage': f'router:{intent.name}',
+                    'start_ms': 0.0,
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+                    'status': 'ok',
+                }]
+                self._count('hits')
+                return response
+        self._count('misses')
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / total if total else 0.0
+        return stats
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    # -- handlers -------------------------------------------------------------
+
+    def _vessel_track(self, match, question, db_manager):
+        mmsi = self._resolve_vessel(match, db_manager)
+        if mmsi is None:
+            return None
+        hours = _window_hours(question)
+        start = None
+        if hours is not None:
+            since = datetime.now(timezone.utc) - timedelta(hours=hours)
+            start = since.strftime('%Y-%m-%d %H:%M:%S')
+        data = db_manager.get_vessel_track(mmsi, start=start, budgeted=True)
+        if data is None or data.empty:
+            return _text_response(f"No positions found for vessel {mmsi}.")
+        name = data['vessel_name'].iloc[0]
+        return _viz_response(
+            _budget_note(f"Track of {name} (MMSI {mmsi}): {len(data)} positions from "
+                         f"{data['timestamp'].iloc[0]} to {data['timestamp'].iloc[-1]}.", data),
+            data, 'route_analysis', title=f'Route of {name}',
+        )
+
+    def _vessel_info(self, match, question, db_manager):
+        mmsi = self._resolve_vessel(match, db_manager)
+        if mmsi is None:
+            return None
+        info = db_manager.get_vessel_info(mmsi)
+        if info is None:
+            return _text_response(f"No vessel with MMSI {mmsi} was found.")
+        details = ", ".join(f"{key}: {value}" for key, value in info.items() if value is not None)
+        return _table_response(details, pd.DataFrame([info]))
+
+    def _vessel_types(self, match, question, db_manager):
+        # Served from the vessel_type_counts rollup (vessels that reported positions)
+        data = db_manager.get_vessel_type_counts()
+        if data is None or data.empty:
+            return None
+        summary = ", ".join(f"{row['vessel_type']}: {row['vessels']}" for _, row in data.iterrows())
+        return _viz_response(
+            f"{int(data['vessels'].sum())} vessels by type - {summary}.",
+            data, 'vessel_type_distribution',
+        )
+
+    def _speed_window(self, match, question, db_manager):
+        hours = _window_hours(question) or 24
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        # Served from the hourly rollups, so the window starts on the hour
+        summary = db_manager.get_speed_summary(start=since)
+        if not summary or not summary['positions']:
+            return _text_response(f"No positions were reported in the last {hours} hours.")
+        data = db_manager.get_speed_histogram(start=since)
+        return _viz_response(
+            f"Speed over the last {hours} hours across {int(summary['vessels'])} vessels: "
+            f"mean {summary['mean_speed'] or 0:.1f} kn, max {summary['max_speed'] or 0:.1f} kn.",
+            data, 'speed_analysis', bin_width=SPEED_BUCKET_KNOTS,
+        )
+
+    def _port_calls(self, match, question, db_manager):
+        data, scope = self._trajectory_positions(question, db_manager)
+        if data is None:
+            return _text_response(f"No positions were reported for {scope}.")
+        calls = self.trajectory.port_calls(data)
+        if calls.empty:
+            return _text_response(
+                f"No port calls at {', '.join(self.trajectory.ports) or 'the configured ports'} for {scope}."
+            )
+        ports = calls['port_name'].value_counts()
+        return _viz_response(
+            _budget_note(f"{len(calls)} port calls by {calls['mmsi'].nunique()} vessels for {scope}: "
+                         + ", ".join(f"{port} {count}" for port, count in ports.items())
+                         + f"; mean stay {calls['dwell_hours'].mean():.1f} h.", data),
+            calls, 'port_activity',
+        )
+
+    def _anchor_time(self, match, question, db_manager):
+        data, scope = self._trajectory_positions(question, db_manager)
+        if data is None:
+            return _text_response(f"No positions were reported for {scope}.")
+        summary = self.trajectory.summary(data).sort_values('anchor_hours', ascending=False)
+        top = summary[summary['anchor_hours'] > 0].head(5)
+        lines = ", ".join(f"{_label(row)} {row['anchor_hours']:.1f} h" for _, row in top.iterrows())
+        return _table_response(
+            _budget_note(f"Time at anchor for {scope}: {summary['anchor_hours'].sum():.1f} h in total across "
+                         f"{int((summary['anchor_hours'] > 0).sum())} of {len(summary)} vessels"
+                         + (f" (longest: {lines})" if lines else "")
+                         + f"; moored {summary['moored_hours'].sum():.1f} h.", data),
+            summary,
+        )
+
+    def _distance_sailed(self, match, question, db_manager):
+        data, scope = self._trajectory_positions(question, db_manager)
+        if data is None:
+            return _text_response(f"No positions were reported for {scope}.")
+        summary = self.trajectory.summary(data).sort_values('distance_nm', ascending=False)
+        top = summary.head(5)
+        lines = ", ".join(f"{_label(row)} {row['distance_nm']:,.0f} nm" for _, row in top.iterrows())
+        return _table_response(
+            _budget_note(f"Distance sailed for {scope}: {summary['distance_nm'].sum():,.0f} nm across "
+                         f"{len(summary)} vessels (most: {lines}).", data),
+            summary,
+        )
+
+    def _encounters(self, match, question, db_manager):
+        hours = _window_hours(question) or 24
+        data = db_manager.get_recent_positions(hours, budgeted=True)
+        if data is None or data.empty:
+            return _text_response(f"No positions were reported in the last {hours} hours.")
+        within = re.search(_WITHIN_NM, question, re.IGNORECASE)
+        distance = float(within.group('distance')) if within else self.encounters.distance_nm
+        found = self.encounters.detect(data, distance_nm=distance)
+        if found.empty:
+            return _text_response(_budget_note(
+                f"No vessels came within {distance:g} nm of each other in the last {hours} hours.", data))
+        closest = found.iloc[0]
+        other = {'mmsi': closest['other_mmsi'], 'vessel_name': closest.get('other_vessel_name')}
+        return _viz_response(
+            _budget_note(f"{len(found)} close encounters (within {distance:g} nm) in the last {hours} hours; "
+                         f"closest: {_label(closest)} and {_label(other)} at {closest['distance_nm']:.2f} nm "
+                         f"on {closest['timestamp']}.", data),
+            found, 'vessel_map', title=f'Close Encounters (within {distance:g} nm)',
+        )
+
+    def _anomalies(self, match, question, db_manager):
+        hours = _window_hours(question) or _TRAJECTORY_HOURS
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        summary = db_manager.get_anomaly_summary(start=since)
+        if summary is None:
+            return None
+        named = [kind for kind, words in _ANOMALY_WORDS.items() if re.search(words, question, re.IGNORECASE)]
+        if named:
+            summary = summary[summary['anomaly'].isin(named)]
+        if summary.empty:
+            what = ", ".join(kind.replace('_', ' ') + "s" for kind in named) or "anomalies"
+            return _text_response(f"No {what} were flagged in the last {hours} hours.")
+        kinds = summary.groupby('anomaly')['flags'].sum().sort_values(ascending=False)
+        data = summary.pivot_table(index='mmsi', columns='anomaly', values='flags', aggfunc='sum', fill_value=0)
+        data.insert(0, 'total', data.sum(axis=1))
+        names = summary.drop_duplicates('mmsi').set_index('mmsi')[['vessel_name', 'vessel_type']]
+        data = names.join(data, how='right').sort_values('total', ascending=False).reset_index()
+        top = ", ".join(f"{_label(row)} {int(row['total'])}" for _, row in data.head(5).iterrows())
+        return _table_response(
+            f"{int(kinds.sum())} anomalies on {len(data)} vessels in the last {hours} hours ("
+            + ", ".join(f"{kind.replace('_', ' ')} {count}" for kind, count in kinds.items())
+            + f"); most flagged: {top}.",
+            data,
+        )
+
+    def _trajectory_positions(self, question, db_manager):
+        """Positions for a trajectory question: one vessel's track or the whole fleet over a window"""
+        hours = _window_hours(question) or _TRAJECTORY_HOURS
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        found = re.search(rf"\b{_MMSI}\b", question)
+        if found:
+            data = db_manager.get_vessel_track(int(found.group('mmsi')), start=since, budgeted=True)
+            scope = f"vessel {found.group('mmsi')} over the last {hours} hours"
+        else:
+            data = db_manager.get_recent_positions(hours, budgeted=True)
+            scope = f"the last {hours} hours"
+        if data is None or data.empty:
+            return None, scope
+        return data, scope
+
+    def _recent_positions(self, match, question, db_manager):
+        hours = _window_hours(question) or 24
+        data = db_manager.get_recent_positions(hours, budgeted=True)
+        if data is None or data.empty:
+            return _text_response(f"No positions were reported in the last {hours} hours.")
+        viz_type = 'vessel_density' if re.search(r"density|heat\s*map|busy", question, re.I) else 'vessel_map'
+        return _viz_response(
+            _budget_note(f"{len(data)} positions from {data['mmsi'].nunique()} vessels in the last {hours} hours.",
+                         data),
+            data, viz_type,
+        )
+
+    @staticmethod
+    def _resolve_vessel(match, db_manager) -> Optional[int]:
+        groups = match.groupdict()
+        if groups.get('mmsi'):
+            return int(groups['mmsi'])
+        if groups.get('name'):
+            return db_manager.find_vessel(groups['name'])
+        return None
+
+
+def _window_hours(question: str) -> Optional[int]:
+    """Hours covered by a "last N hours/days/weeks" phrase, if present"""
+    match = re.search(_WINDOW, question, re.IGNORECASE)
+    if match is None:
+        return None
+    count = int(match.group('count') or 1)
+    return count * _UNIT_HOURS[match.group('unit')[0].lower()]
+
+
+def _budget_note(text: str, data: pd.DataFrame) -> str:
+    """``text`` plus the note on raw positions that were sampled or cut to the result budget"""
+    note = data.attrs.get('sql_guard', {}).get('note')
+    return f"{text} Note: {note}." if note else text
+
+
+def _text_response(text: str) -> Dict[str, Any]:
+    return {"text": text, "data": None, "needs_visualization": False}
+
+
+def _table_response(text: str, data: pd.DataFrame) -> Dict[str, Any]:
+    return {"text": text, "data": data, "needs_visualization": False}
+
+
+def _label(row) -> str:
+    name = row.get('vessel_name')
+    return f"{name} ({row['mmsi']})" if isinstance(name, str) else str(row['mmsi'])
+
+
+def _viz_response(text: str, data: pd.DataFrame, viz_type: str, **viz_params) -> Dict[str, Any]:
+    return {
+        "text": text,
+        "data": data,
+        "viz_type": viz_type,
+        "viz_params": viz_params,
+        "needs_visualization": True,
+    }
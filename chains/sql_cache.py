@@ -0,0 +1,72 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+# Filler that doesn't change which SQL answers a question. Negations,
+# comparatives and question words ("how many" vs "which") are content.
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'of', 'is', 'are', 'was', 'were', 'be', 'been', 'please', 'me', 'us', 'i',
+    'we', 'you', 'can', 'could', 'would', 'show', 'give', 'tell', 'display', 'list', 'find', 'get',
+    'what', 'which', 'do', 'does', 'did',
+})
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return ' '.join(_PUNCTUATION.sub(' ', question.lower()).split())
+
+
+def question_key(question: str) -> str:
+    """The content words of a question, in order: the part that decides its SQL"""
+    return ' '.join(word for word in normalize_question(question).split() if word not in STOPWORDS)
+
+
+class SQLCache:
+    """Question -> validated SQL cache keyed on the question's content words
+
+    Entries are partitioned by schema version so SQL written against an older
+    schema is never reused. Questions that differ only in case, punctuation
+    and filler (see STOPWORDS) share an entry; any other difference, word
+    order included, is a different question: "arrivals in Rotterdam not
+    Singapore" and "arrivals in Singapore not Rotterdam" need different SQL.
+    """
+
+    def __init__(self, max_entries: int = 1000, enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    def lookup(self, question: str, schema_version: str) -> Optional[str]:
+        """Cached SQL for this question (or one differing only in filler), if any"""
+        if not self.enabled:
+            return None
+        key = (schema_version, question_key(question))
+        with self._lock:
+            sql = self._entries.get(key)
+            if sql is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return sql
+
+    def store(self, question: str, sql: str, schema_version: str) -> None:
+        """Remember SQL that executed successfully for this question"""
+        if not self.enabled:
+            return
+        key = (schema_version, question_key(question))
+        with self._lock:
+            if key not in self._entries:
+                self._stats['stores'] += 1
+            self._entries[key] = sql
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
@@ -0,0 +1,202 @@
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from utils.trajectory import epoch_seconds, format_timestamps, haversine_nm
+
+# Data-quality flags over ais_positions, kept up to date like the rollups:
+# positions past the 'anomalies' watermark in rollup_state are read by id,
+# ordered per vessel and diffed against the previous fix. A vessel's first new
+# fix is diffed against its last fix from the previous run
+# (rollup_anomaly_state), so history is never rescanned. Flags go to
+# position_anomalies, one row per position and kind; ``value`` is
+#   gap           minutes since the previous report (over GAP_MINUTES)
+#   teleport      implied knots from the previous fix (over MAX_IMPLIED_KNOTS)
+#   speed_jump    change in reported speed, knots, within SPEED_JUMP_MINUTES
+#   speed_range   reported speed outside 0..MAX_SPEED_KNOTS
+#   course_range  reported course outside 0..360
+# Ingestion nulls speeds/courses outside the AIS ranges and keeps what was
+# received in reported_speed/reported_course, so the range checks see those.
+ANOMALY_KINDS = ('gap', 'teleport', 'speed_jump', 'speed_range', 'course_range')
+GAP_MINUTES = 120
+MAX_IMPLIED_KNOTS = 60
+TELEPORT_MIN_NM = 1.0  # shorter hops are position noise, however brief
+SPEED_JUMP_KNOTS = 20
+SPEED_JUMP_MINUTES = 10
+MAX_SPEED_KNOTS = 50
+
+ANOMALY_TABLES = ('position_anomalies', 'rollup_anomaly_state')
+_STATE_COLUMNS = ['mmsi', 'position_id', 'timestamp', 'latitude', 'longitude', 'speed']
+_FLAG_COLUMNS = ['position_id', 'mmsi', 'timestamp', 'anomaly', 'value', 'latitude', 'longitude',
+                 'previous_timestamp']
+
+
+def refresh_anomalies(engine: Engine, chunk_rows: int = 500_000) -> Dict[str, int]:
+    """Flag positions inserted since the last refresh
+
+    Runs in one transaction, reading new positions ``chunk_rows`` at a time.
+    Returns the ais_positions id range processed.
+    """
+    with engine.begin() as conn:
+        last = conn.execute(text(
+            "SELECT last_id FROM rollup_state WHERE name = 'anomalies'"
+        )).scalar() or 0
+        upto = conn.execute(text("SELECT MAX(id) FROM ais_positions")).scalar() or 0
+        if upto <= last:
+            return {'from_id': last, 'to_id': last}
+
+        state = pd.read_sql_query(text(f"SELECT {', '.join(_STATE_COLUMNS)} FROM rollup_anomaly_state"), conn)
+        changed = []
+        for lo in range(last, upto, chunk_rows):
+            positions = pd.read_sql_query(text("""
+                SELECT id, mmsi, timestamp, latitude, longitude, speed, course,
+                       reported_speed, reported_course
+                FROM ais_positions
+                WHERE id > :lo AND id <= :hi
+            """), conn, params={'lo': lo, 'hi': min(upto, lo + chunk_rows)})
+            flags, latest = find_anomalies(positions, state)
+            if not flags.empty:
+                conn.execute(text(f"""
+                    INSERT INTO position_anomalies ({', '.join(_FLAG_COLUMNS)})
+                    VALUES ({', '.join(':' + c for c in _FLAG_COLUMNS)})
+                    ON CONFLICT (position_id, anomaly) DO NOTHING
+                """), _records(flags))
+            # Empty when every fix in the chunk arrived late
+            if not latest.empty:
+                state = pd.concat([state[~state['mmsi'].isin(latest['mmsi'])], latest], ignore_index=True)
+                changed.append(latest['mmsi'])
+
+        if changed:
+            updated = state[state['mmsi'].isin(pd.concat(changed))]
+            conn.execute(text(f"""
+                INSERT INTO rollup_anomaly_state ({', '.join(_STATE_COLUMNS)})
+                VALUES ({', '.join(':' + c for c in _STATE_COLUMNS)})
+                ON CONFLICT (mmsi) DO UPDATE SET
+                    position_id = excluded.position_id,
+                    timestamp = excluded.timestamp,
+                    latitude = excluded.latitude,
+                    longitude = excluded.longitude,
+                    speed = excluded.speed
+            """), _records(updated))
+        conn.execute(text("""
+            INSERT INTO rollup_state (name, last_id) VALUES ('anomalies', :upto)
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+        """), {'upto': upto})
+    return {'from_id': last, 'to_id': upto}
+
+
+def reset_anomalies(conn: Connection) -> None:
+    """Empty the flags and per-vessel state, e.g. after ais_positions was cleared"""
+    for table in ANOMALY_TABLES:
+        conn.execute(text(f"DELETE FROM {table}"))
+    conn.execute(text("DELETE FROM rollup_state WHERE name = 'anomalies'"))
+
+
+def find_anomalies(positions: pd.DataFrame, state: pd.DataFrame):
+    """Flags for ``positions`` given each vessel's last fix in ``state``
+
+    Returns (flags, new state). Range checks apply to every position;
+    positions no newer than their vessel's last fix arrived late and are
+    left out of the fix-to-fix checks, as they can't be placed in a
+    sequence that was already checked.
+    """
+    flags = []
+    speed = positions['speed'].to_numpy(dtype=float)
+    course = positions['course'].to_numpy(dtype=float)
+    reported_speed = _reported(positions, 'reported_speed', speed)
+    reported_course = _reported(positions, 'reported_course', course)
+    flags.append(_flags(positions, 'speed_range', (reported_speed < 0) | (reported_speed > MAX_SPEED_KNOTS),
+                        reported_speed))
+    flags.append(_flags(positions, 'course_range', (reported_course < 0) | (reported_course >= 360),
+                        reported_course))
+
+    seconds = epoch_seconds(positions['timestamp'])
+    known = pd.Series(epoch_seconds(state['timestamp']), index=state['mmsi'].to_numpy())
+    previous = known.reindex(positions['mmsi'].to_numpy()).to_numpy()
+    in_order = ~(seconds <= previous)
+
+    # The previous run's last fixes lead each vessel's sequence
+    fixes = pd.DataFrame({
+        'position_id': np.concatenate([state['position_id'].to_numpy(), positions['id'].to_numpy()[in_order]]),
+        'mmsi': np.concatenate([state['mmsi'].to_numpy(), positions['mmsi'].to_numpy()[in_order]]),
+        'seconds': np.concatenate([known.to_numpy(), seconds[in_order]]),
+        'latitude': np.concatenate([state['latitude'].to_numpy(dtype=float),
+                                    positions['latitude'].to_numpy(dtype=float)[in_order]]),
+        'longitude': np.concatenate([state['longitude'].to_numpy(dtype=float),
+                                     positions['longitude'].to_numpy(dtype=float)[in_order]]),
+        'speed': np.concatenate([state['speed'].to_numpy(dtype=float), speed[in_order]]),
+        # Row in ``positions``; -1 for the previous run's fixes
+        'row': np.concatenate([np.full(len(state), -1), np.flatnonzero(in_order)]),
+    })
+    fixes = fixes.iloc[np.lexsort((fixes['seconds'].to_numpy(), fixes['mmsi'].to_numpy()))]
+
+    mmsi = fixes['mmsi'].to_numpy()
+    t = fixes['seconds'].to_numpy()
+    lat, lon = fixes['latitude'].to_numpy(), fixes['longitude'].to_numpy()
+    v = fixes['speed'].to_numpy()
+    # Pair each fix with the one before it; the first of a vessel has none
+    pair = np.zeros(len(fixes), dtype=bool)
+    new = fixes['row'].to_numpy() >= 0
+    pair[1:] = (mmsi[1:] == mmsi[:-1]) & new[1:]
+    later = np.flatnonzero(pair)
+    earlier = later - 1
+    dt = (t[later] - t[earlier]).astype(float)
+    hop = haversine_nm(lat[earlier], lon[earlier], lat[later], lon[later])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        implied = np.where(dt > 0, hop / dt * 3600, np.inf)
+    jump = np.abs(v[later] - v[earlier])
+
+    sequence = positions.iloc[fixes['row'].to_numpy()[later]]
+    previous_seconds = t[earlier]
+    checks = (
+        ('gap', dt > GAP_MINUTES * 60, dt / 60),
+        ('teleport', (hop > TELEPORT_MIN_NM) & (implied > MAX_IMPLIED_KNOTS), implied),
+        ('speed_jump', (dt <= SPEED_JUMP_MINUTES * 60) & (jump > SPEED_JUMP_KNOTS), jump),
+    )
+    for kind, hit, value in checks:
+        flags.append(_flags(sequence, kind, hit, value, previous_seconds))
+
+    last = np.ones(len(fixes), dtype=bool)
+    last[:-1] = mmsi[1:] != mmsi[:-1]
+    newest = fixes[last & new]
+    latest = pd.DataFrame({
+        'mmsi': newest['mmsi'].to_numpy(),
+        'position_id': newest['position_id'].to_numpy(),
+        'timestamp': format_timestamps(newest['seconds'].to_numpy()),
+        'latitude': newest['latitude'].to_numpy(),
+        'longitude': newest['longitude'].to_numpy(),
+        'speed': newest['speed'].to_numpy(),
+    })
+    return pd.concat(flags, ignore_index=True), latest
+
+
+def _reported(positions: pd.DataFrame, column: str, value: np.ndarray) -> np.ndarray:
+    """The value as received: the stored one, or what ingestion nulled as out of range"""
+    if column not in positions:
+        return value
+    return np.where(np.isnan(value), positions[column].to_numpy(dtype=float), value)
+
+
+def _flags(positions: pd.DataFrame, kind: str, hit: np.ndarray, value: np.ndarray,
+           previous_seconds: Optional[np.ndarray] = None) -> pd.DataFrame:
+    hit = np.asarray(hit, dtype=bool)
+    return pd.DataFrame({
+        'position_id': positions['id'].to_numpy()[hit],
+        'mmsi': positions['mmsi'].to_numpy()[hit],
+        'timestamp': positions['timestamp'].astype(str).to_numpy()[hit],
+        'anomaly': kind,
+        'value': np.asarray(value, dtype=float)[hit],
+        'latitude': positions['latitude'].to_numpy(dtype=float)[hit],
+        'longitude': positions['longitude'].to_numpy(dtype=float)[hit],
+        'previous_timestamp': format_timestamps(previous_seconds[hit]) if previous_seconds is not None else None,
+    }, columns=_FLAG_COLUMNS)
+
+
+def _records(frame: pd.DataFrame):
+    """Plain Python rows for executemany, with NaN as NULL"""
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict('records')
@@ -0,0 +1,169 @@
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (Parquet spill is optional)
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Quoted literals are kept verbatim; whitespace runs elsewhere collapse to one space
+_SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """Canonical form of a SQL string for use as a cache key"""
+    collapsed = _SQL_TOKENS.sub(lambda m: m.group(1) or ' ', query)
+    return collapsed.strip().rstrip(';').strip()
+
+
+class QueryCache:
+    """TTL + LRU cache of query results, keyed on SQL, params and data version
+
+    The data version is bumped by ``invalidate`` whenever rows are written, so
+    entries computed against older data are never served. That counter only
+    lives in this process; ``stamp`` returns a persistent one so writes by
+    other processes are seen too. It is read at most every ``stamp_interval``
+    seconds (and right after ``invalidate``), so a hit costs no database
+    round trip and another process's write shows within that interval.
+    Entries evicted from memory can optionally spill to Parquet files under
+    ``spill_dir``, which is emptied on startup.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1000,
+                 spill_dir: Optional[str] = None, enabled: bool = True,
+                 stamp: Optional[Callable[[], Any]] = None, stamp_interval: float = 1.0):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stamp = stamp
+        self.stamp_interval = stamp_interval
+        self._stamp: Optional[Tuple[float, Any]] = None
+        self.spill_dir = spill_dir if spill_dir and HAS_PYARROW else None
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            # Spills from an earlier process may predate writes it never saw
+            self._clear_spill()
+
+        self.version = 0
+        self._entries: "OrderedDict[str, Tuple[float, pd.DataFrame]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'spill_hits': 0, 'evictions': 0,
+                       'expirations': 0, 'invalidations': 0}
+
+    def make_key(self, query: str, params: Optional[Dict[str, Any]] = None) -> str:
+        items = sorted((params or {}).items())
+        stamp = self._current_stamp()
+        raw = f"{self.version}\x00{stamp!r}\x00{normalize_sql(query)}\x00{items!r}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _current_stamp(self) -> Any:
+        if self.stamp is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if self._stamp is not None and now - self._stamp[0] < self.stamp_interval:
+                return self._stamp[1]
+        value = self.stamp()
+        with self._lock:
+            self._stamp = (now, value)
+        return value
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored, frame = entry
+                if now - stored <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return frame.copy()
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        frame = self._read_spill(key)
+        with self._lock:
+            if frame is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['spill_hits'] += 1
+        self.put(key, frame)
+        return frame.copy()
+
+    def put(self, key: str, frame: pd.DataFrame) -> None:
+        if not self.enabled or frame is None:
+            return
+        evicted = []
+        with self._lock:
+            self._entries[key] = (time.monotonic(), frame)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+                self._stats['evictions'] += 1
+        for old_key, (_, old_frame) in evicted:
+            self._write_spill(old_key, old_frame)
+
+    def invalidate(self) -> None:
+        """Drop every entry; called after any write to the underlying tables"""
+        with self._lock:
+            self.version += 1
+            self._stamp = None
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+        self._clear_spill()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['data_version'] = self.version
+        lookups = stats['hits'] + stats['spill_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['spill_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _clear_spill(self) -> None:
+        if not self.spill_dir:
+            return
+        for name in os.listdir(self.spill_dir):
+            if name.endswith('.parquet'):
+                try:
+                    os.remove(os.path.join(self.spill_dir, name))
+                except OSError:
+                    pass
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.parquet")
+
+    def _write_spill(self, key: str, frame: pd.DataFrame) -> None:
+        if not self.spill_dir:
+            return
+        try:
+            frame.to_parquet(self._spill_path(key), index=False)
+        except Exception:
+            # Frames with mixed-type object columns can't always be written; skip them
+            pass
+
+    def _read_spill(self, key: str) -> Optional[pd.DataFrame]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            frame = pd.read_parquet(path)
+            os.remove(path)
+            return frame
+        except Exception:
+            return None
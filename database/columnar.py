@@ -0,0 +1,240 @@
+
+import glob
+import os
+import re
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from database import queries
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+# ais_positions is mirrored as Parquet under <path>/positions/day=YYYY-MM-DD/,
+# one file per sync and day named part-<first id>-<last id>.parquet, plus
+# <path>/vessels.parquet. Rows are only ever inserted, so the mirror catches
+# up by id like the rollups do. The SQLite-only grid ``cell`` column is left out.
+# The watermark file also records the database's identity and reset generation
+# (data_version); if either changed, or ids went backwards, the mirror belongs
+# to data that no longer exists and is rebuilt from scratch.
+POSITION_COLUMNS = {
+    'id': 'int64',
+    'mmsi': 'int64',
+    'timestamp': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'speed': 'float64',
+    'course': 'float64',
+    'navigation_status': 'string',
+}
+VESSEL_COLUMNS = {
+    'mmsi': 'int64',
+    'vessel_name': 'string',
+    'vessel_type': 'string',
+    'length': 'float64',
+    'width': 'float64',
+    'flag': 'string',
+    'destination': 'string',
+}
+_PART = re.compile(r"part-(\d+)-(\d+)\.parquet$")
+_WATERMARK = '_watermark'
+
+# DuckDB dialect. CAST to INTEGER rounds in DuckDB, so bins use FLOOR; the
+# day predicate lets DuckDB skip whole partitions.
+DENSITY_GRID = """
+    SELECT (FLOOR((latitude + 90) / $cell_degrees) + 0.5) * $cell_degrees - 90 AS latitude,
+           (FLOOR((longitude + 180) / $cell_degrees) + 0.5) * $cell_degrees - 180 AS longitude,
+           COUNT(*) AS count,
+           AVG(speed) AS speed
+    FROM ais_positions
+    WHERE timestamp BETWEEN $start AND $end
+      AND day BETWEEN substr($start, 1, 10) AND substr($end, 1, 10)
+    GROUP BY 1, 2
+"""
+
+
+class ColumnarMirror:
+    """Parquet mirror of ais_positions queried with DuckDB, for analytical scans
+
+    ``query`` first folds in positions written to SQLite since the last sync,
+    so results are never stale. Partitions that collect more than
+    ``max_files`` files are rewritten as one file sorted by vessel and time.
+    Syncs and queries share a lock, so compaction never removes a file a
+    query is reading.
+    """
+
+    def __init__(self, engine: Engine, path: str, max_files: int = 8, chunk_rows: int = 200_000):
+        if not HAS_DUCKDB:
+            raise ImportError("duckdb and pyarrow are required for the columnar mirror")
+        self.engine = engine
+        self.path = path
+        self.max_files = max_files
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._conn = duckdb.connect()
+        self._views_ready = False
+        self._positions_schema = pa.schema([(name, _arrow_type(kind)) for name, kind in POSITION_COLUMNS.items()])
+        self._vessels_schema = pa.schema([(name, _arrow_type(kind)) for name, kind in VESSEL_COLUMNS.items()])
+
+    def sync(self) -> Dict[str, int]:
+        """Append positions newer than the mirror; returns the id range copied"""
+        with self._lock:
+            return self._sync()
+
+    def reset(self) -> None:
+        """Drop the mirror, e.g. after ais_positions was cleared"""
+        with self._lock:
+            self._clear()
+
+    def query(self, sql: str, params: Optional[Dict[str, Any]] = None) -> Optional[pd.DataFrame]:
+        """Run DuckDB SQL over the ``ais_positions`` and ``vessels`` views
+
+        Returns None while there is nothing mirrored yet.
+        """
+        with self._lock:
+            self._sync()
+            if not self._part_files():
+                return None
+            if not self._views_ready:
+                self._create_views()
+                self._views_ready = True
+            return self._conn.execute(sql, params or {}).df()
+
+    def watermark(self) -> int:
+        """Highest ais_positions id in the mirror"""
+        return self._read_watermark()[0]
+
+    def _read_watermark(self):
+        """(id, source) from the watermark file; source is '<instance> <generation>', or None"""
+        try:
+            with open(os.path.join(self.path, _WATERMARK)) as f:
+                fields = f.read().split(None, 1)
+        except FileNotFoundError:
+            return 0, None
+        return (int(fields[0]) if fields else 0), (fields[1].strip() if len(fields) > 1 else None)
+
+    def _clear(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._views_ready = False
+
+    def _sync(self) -> Dict[str, int]:
+        last, mirrored = self._read_watermark()
+        with self.engine.connect() as conn:
+            upto = conn.execute(text("SELECT MAX(id) FROM ais_positions")).scalar() or 0
+            source = " ".join(str(v) for v in conn.execute(queries.DATA_SOURCE).one())
+        if mirrored != source or upto < last:
+            # Another database, or ais_positions was emptied since this mirror was built
+            self._clear()
+            last = 0
+        if upto <= last:
+            return {'from_id': last, 'to_id': last}
+
+        self._drop_orphans(last)
+        columns = ', '.join(POSITION_COLUMNS)
+        writers: Dict[str, Any] = {}
+        ranges: Dict[str, List[int]] = {}
+        try:
+            with self.engine.connect() as conn:
+                chunks = pd.read_sql_query(
+                    text(f"SELECT {columns} FROM ais_positions WHERE id > :last AND id <= :upto ORDER BY id"),
+                    conn, params={'last': last, 'upto': upto}, chunksize=self.chunk_rows,
+                )
+                for chunk in chunks:
+                    for day, rows in chunk.groupby(chunk['timestamp'].astype(str).str[:10], sort=False):
+                        if day not in writers:
+                            directory = os.path.join(self.path, 'positions', f'day={day}')
+                            os.makedirs(directory, exist_ok=True)
+                            writers[day] = pq.ParquetWriter(
+                                os.path.join(directory, '.pending.parquet'), self._positions_schema
+                            )
+                            ranges[day] = [int(rows['id'].iloc[0]), 0]
+                        writers[day].write_table(self._table(rows, self._positions_schema))
+                        ranges[day][1] = int(rows['id'].iloc[-1])
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        for day, (first, final) in ranges.items():
+            directory = os.path.join(self.path, 'positions', f'day={day}')
+            os.replace(os.path.join(directory, '.pending.parquet'),
+                       os.path.join(directory, f'part-{first}-{final}.parquet'))
+        self._write_vessels()
+        target = os.path.join(self.path, _WATERMARK)
+        with open(target + '.pending', 'w') as f:
+            f.write(f"{upto} {source}")
+        os.replace(target + '.pending', target)
+
+        for day in ranges:
+            self._compact(os.path.join(self.path, 'positions', f'day={day}'))
+        return {'from_id': last, 'to_id': upto}
+
+    def _drop_orphans(self, last: int) -> None:
+        """Remove files left behind by a sync or compaction that was interrupted
+
+        That is files past the saved watermark, and files whose id range is
+        covered by a compacted file in the same partition.
+        """
+        parts = [(path, *(int(v) for v in _PART.search(path).groups())) for path in self._part_files()]
+        for path, first, final in parts:
+            covered = any(
+                os.path.dirname(other) == os.path.dirname(path) and other != path
+                and lo <= first and final <= hi
+                for other, lo, hi in parts
+            )
+            if first > last or covered:
+                os.remove(path)
+
+    def _write_vessels(self) -> None:
+        columns = ', '.join(VESSEL_COLUMNS)
+        with self.engine.connect() as conn:
+            vessels = pd.read_sql_query(text(f"SELECT {columns} FROM vessels"), conn)
+        target = os.path.join(self.path, 'vessels.parquet')
+        pq.write_table(self._table(vessels, self._vessels_schema), target + '.pending')
+        os.replace(target + '.pending', target)
+
+    def _compact(self, directory: str) -> None:
+        files = sorted(glob.glob(os.path.join(directory, 'part-*.parquet')))
+        if len(files) <= self.max_files:
+            return
+        ids = [tuple(int(v) for v in _PART.search(path).groups()) for path in files]
+        table = pq.read_table(files, schema=self._positions_schema)
+        table = table.sort_by([('mmsi', 'ascending'), ('timestamp', 'ascending')])
+        target = os.path.join(directory, f'part-{min(i[0] for i in ids)}-{max(i[1] for i in ids)}.parquet')
+        pq.write_table(table, os.path.join(directory, '.pending.parquet'))
+        # The compacted file covers the old ones, so a crash in between is cleaned up on the next sync
+        os.replace(os.path.join(directory, '.pending.parquet'), target)
+        for path in files:
+            if path != target:
+                os.remove(path)
+
+    def _part_files(self) -> List[str]:
+        return glob.glob(os.path.join(self.path, 'positions', 'day=*', 'part-*.parquet'))
+
+    def _create_views(self) -> None:
+        # The glob is expanded per query, so new and compacted files are picked up
+        positions = os.path.join(self.path, 'positions', 'day=*', 'part-*.parquet').replace("'", "''")
+        vessels = os.path.join(self.path, 'vessels.parquet').replace("'", "''")
+        self._conn.execute(
+            f"CREATE OR REPLACE VIEW ais_positions AS SELECT * FROM read_parquet("
+            f"'{positions}', hive_partitioning = true, hive_types = {{'day': VARCHAR}})"
+        )
+        self._conn.execute(f"CREATE OR REPLACE VIEW vessels AS SELECT * FROM read_parquet('{vessels}')")
+
+    @staticmethod
+    def _table(frame: pd.DataFrame, schema) -> 'pa.Table':
+        frame = frame.reindex(columns=schema.names)
+        return pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+
+
+def _arrow_type(kind: str):
+    return {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string()}[kind]
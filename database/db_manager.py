@@ -1,15 +1,129 @@
 
-from sqlalchemy import create_engine, text
+import os
+import threading
+import time
+import weakref
+from functools import partial
+from sqlalchemy import text
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, List, Any, Callable, Iterable, Iterator, Union
+from sqlalchemy.sql.elements import TextClause
+from database import columnar, queries
+from database.cache import HAS_PYARROW, QueryCache
+from database.anomalies import refresh_anomalies, reset_anomalies
+from database.columnar import HAS_DUCKDB, ColumnarMirror
+from database.engine import get_engine
+from database.ingestion import IngestStats, Source, batched, iter_records, split_batch
+from database.migrations import apply_migrations, cells_for_bbox, grid_cell, has_rtree
+from database.rollups import refresh_rollups, reset_rollups
+from database.schema import SchemaIntrospector
+from database.slow_log import SlowQueryLog
+from database.sql_guard import GuardedQuery, QueryGuard
+from utils.metrics import metrics
 
 class DatabaseManager:
-    def __init__(self, connection_string: str):
-        """Initialize database connection"""
-        self.engine = create_engine(connection_string)
-        self.create_tables()
+    VESSEL_TYPES = ['Container Ship', 'Bulk Carrier', 'Tanker', 'Passenger', 'Cargo']
+    FLAGS = ['US', 'UK', 'NL', 'DE', 'SG', 'CN', 'JP']
+    DESTINATIONS = ['Rotterdam', 'Singapore', 'Shanghai']
+    # Sample tracks turn back at these latitudes (roughly the navigable band)
+    LATITUDE_BOUNDS = (-60.0, 70.0)
+
+    # Engines whose schema has already been created/migrated in this process
+    _schema_ready = weakref.WeakSet()
+    _schema_lock = threading.Lock()
+    # One result cache per engine, so every manager sees the others' invalidations
+    _caches = weakref.WeakKeyDictionary()
+    _introspectors = weakref.WeakKeyDictionary()
+    _mirrors = weakref.WeakKeyDictionary()
+    _slow_logs = weakref.WeakKeyDictionary()
+
+    def __init__(self, connection_string: str, pool_size: int = 5,
+                 max_overflow: int = 10, timeout: float = 30,
+                 cache_config: Optional[Dict[str, Any]] = None,
+                 max_result_rows: int = 100_000, max_result_mb: float = 256,
+                 oversize: str = 'sample', columnar_config: Optional[Dict[str, Any]] = None,
+                 slow_query_ms: float = 500, slow_query_log_size: int = 50,
+                 schema_stats_ttl: float = 600):
+        """Initialize database connection
+
+        Engines are shared process-wide per connection settings (see
+        database/engine.py), and DDL runs only the first time an engine is used.
+        ``cache_config`` is the ``cache`` section of config.yaml; without it
+        query results are not cached. ``max_result_rows``/``max_result_mb``
+        bound the results of generated SQL (see ``guard_query``).
+        ``columnar_config`` (``database.columnar`` in config.yaml) enables the
+        Parquet/DuckDB mirror that serves analytical scans (a relative ``path``
+        is next to the SQLite file); it is skipped when duckdb or pyarrow is
+        not installed. Statements slower than ``slow_query_ms`` are kept in
+        ``slow_log`` with their EXPLAIN output.
+        ``schema_stats_ttl`` bounds how stale the column stats in the schema
+        summary may get.
+        """
+        self.engine = get_engine(connection_string, pool_size, max_overflow, timeout)
+        with self._schema_lock:
+            self.slow_log = self._slow_logs.get(self.engine)
+            if self.slow_log is None:
+                self.slow_log = SlowQueryLog(slow_query_ms, slow_query_log_size).attach(self.engine)
+                self._slow_logs[self.engine] = self.slow_log
+            if self.engine not in self._schema_ready:
+                self.create_tables()
+                # Catch up on positions written before the rollups existed
+                refresh_rollups(self.engine)
+                refresh_anomalies(self.engine)
+                self._schema_ready.add(self.engine)
+            self.cache = self._caches.get(self.engine)
+            if self.cache is None:
+                cache_config = cache_config or {'enabled': False}
+                self.cache = QueryCache(
+                    ttl=cache_config.get('ttl', 3600),
+                    max_entries=cache_config.get('max_entries', 1000),
+                    spill_dir=cache_config.get('spill_dir'),
+                    enabled=cache_config.get('enabled', True),
+                    stamp=partial(self._data_stamp, self.engine),
+                    stamp_interval=cache_config.get('stamp_interval', 1.0),
+                )
+                self._caches[self.engine] = self.cache
+            self.introspector = self._introspectors.get(self.engine)
+            if self.introspector is None:
+                self.introspector = SchemaIntrospector(self.engine, schema_stats_ttl)
+                self._introspectors[self.engine] = self.introspector
+            self.columnar = self._mirrors.get(self.engine)
+            if self.columnar is None and (columnar_config or {}).get('enabled') and HAS_DUCKDB:
+                self.columnar = ColumnarMirror(
+                    self.engine,
+                    self._columnar_path(columnar_config.get('path', 'columnar')),
+                    max_files=columnar_config.get('max_files', 8),
+                )
+                self._mirrors[self.engine] = self.columnar
+        self.guard = QueryGuard(self.engine, self.introspector, max_result_rows, max_result_mb, oversize)
+
+    def _columnar_path(self, path: str) -> str:
+        """A relative mirror path is taken from the SQLite file's directory, not the working directory"""
+        database = self.engine.url.database
+        if os.path.isabs(path) or self.engine.dialect.name != 'sqlite' or not database or database == ':memory:':
+            return path
+        return os.path.join(os.path.dirname(os.path.abspath(database)), path)
+
+    @classmethod
+    def from_config(cls, db_config: Dict[str, Any],
+                    cache_config: Optional[Dict[str, Any]] = None) -> 'DatabaseManager':
+        """Build from the ``database`` (and optional ``cache``) sections of config.yaml"""
+        return cls(
+            db_config['connection_string'],
+            pool_size=db_config.get('pool_size', 5),
+            max_overflow=db_config.get('max_overflow', 10),
+            timeout=db_config.get('timeout', 30),
+            cache_config=cache_config,
+            max_result_rows=db_config.get('max_result_rows', 100_000),
+            max_result_mb=db_config.get('max_result_mb', 256),
+            oversize=db_config.get('oversize', 'sample'),
+            columnar_config=db_config.get('columnar'),
+            slow_query_ms=db_config.get('slow_query_ms', 500),
+            slow_query_log_size=db_config.get('slow_query_log_size', 50),
+            schema_stats_ttl=db_config.get('schema_stats_ttl', 600),
+        )
 
     def create_tables(self):
         """Create necessary database tables"""
@@ -41,75 +155,499 @@ class DatabaseManager:
                     FOREIGN KEY (mmsi) REFERENCES vessels(mmsi)
                 )
             """))
+            conn.commit()
 
-    def load_sample_data(self) -> None:
-        """Generate and load sample maritime data"""
-        vessel_types = ['Container Ship', 'Bulk Carrier', 'Tanker', 'Passenger', 'Cargo']
-        flags = ['US', 'UK', 'NL', 'DE', 'SG', 'CN', 'JP']
-        
-        # Generate sample vessels
-        vessels = pd.DataFrame({
-            'mmsi': range(100000000, 100000020),
-            'vessel_name': [f'MARITIME_{i}' for i in range(20)],
-            'vessel_type': np.random.choice(vessel_types, 20),
-            'length': np.random.uniform(100, 400, 20),
-            'width': np.random.uniform(20, 60, 20),
-            'flag': np.random.choice(flags, 20),
-            'destination': np.random.choice(['Rotterdam', 'Singapore', 'Shanghai'], 20)
-        })
+        # Indexes and derived columns are versioned in database/migrations.py
+        apply_migrations(self.engine)
+
+    def load_sample_data(self, n_vessels: int = 20, days: float = 7,
+                         interval_minutes: float = 60, seed: Optional[int] = None,
+                         chunk_rows: int = 200_000) -> int:
+        """Generate and load sample maritime data
+
+        Tracks are dead-reckoned from a random start position along a slowly
+        drifting heading, with one stop window per vessel where it sits at
+        anchor or moored. Positions are generated for a block of vessels at a
+        time and written with executemany, so memory stays bounded by
+        ``chunk_rows`` regardless of fleet size or duration.
+
+        Returns the number of position rows written.
+        """
+        rng = np.random.default_rng(seed)
+        n_steps = max(1, int(days * 24 * 60 / interval_minutes))
+        step_hours = interval_minutes / 60.0
+        end_time = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0), 's')
+        start_time = end_time - np.timedelta64(int(n_steps * interval_minutes * 60), 's')
+        offsets = (np.arange(n_steps) * interval_minutes * 60).astype('timedelta64[s]')
+        timestamps = np.char.replace(
+            np.datetime_as_string(start_time + offsets, unit='s'), 'T', ' '
+        )
+
+        mmsis = np.arange(100000000, 100000000 + n_vessels)
+
+        with self.engine.begin() as conn:
+            if has_rtree(conn):
+                conn.execute(text("DELETE FROM ais_positions_rtree"))
+            conn.execute(text("DELETE FROM ais_positions"))
+            conn.execute(text("DELETE FROM vessels"))
+            conn.execute(queries.DATA_GENERATION_BUMP)
+            reset_rollups(conn)
+            reset_anomalies(conn)
+
+            for lo in range(0, n_vessels, chunk_rows):
+                block = mmsis[lo:lo + chunk_rows]
+                n = len(block)
+                columns = {
+                    'mmsi': block.tolist(),
+                    'vessel_name': [f'MARITIME_{i - 100000000}' for i in block.tolist()],
+                    'vessel_type': rng.choice(self.VESSEL_TYPES, n).tolist(),
+                    'length': rng.uniform(100, 400, n).tolist(),
+                    'width': rng.uniform(20, 60, n).tolist(),
+                    'flag': rng.choice(self.FLAGS, n).tolist(),
+                    'destination': rng.choice(self.DESTINATIONS, n).tolist(),
+                }
+                conn.execute(self._insert_statement('vessels', columns), self._records(columns))
+
+            vessels_per_chunk = max(1, chunk_rows // n_steps)
+            written = 0
+            for lo in range(0, n_vessels, vessels_per_chunk):
+                block = mmsis[lo:lo + vessels_per_chunk]
+                columns = self._generate_tracks(rng, block, n_steps, step_hours, timestamps)
+                conn.execute(self._insert_statement('ais_positions', columns), self._records(columns))
+                written += len(columns['mmsi'])
+
+        refresh_rollups(self.engine)
+        refresh_anomalies(self.engine)
+        if self.columnar is not None:
+            self.columnar.reset()
+        self._invalidate()
+        return written
+
+    @staticmethod
+    def _generate_tracks(rng: np.random.Generator, mmsis: np.ndarray, n_steps: int,
+                         step_hours: float, timestamps: np.ndarray) -> Dict[str, List]:
+        """Vectorized dead-reckoning tracks for a block of vessels"""
+        n = len(mmsis)
+        shape = (n, n_steps)
+
+        # Heading drifts as a random walk around the initial course
+        heading = rng.uniform(0, 360, (n, 1)) + np.cumsum(rng.normal(0, 3, shape), axis=1)
+        heading = np.mod(heading, 360)
+
+        cruise = rng.uniform(8, 20, (n, 1))
+        speed = np.clip(cruise + rng.normal(0, 0.8, shape), 0, None)
 
-        # Save to database
-        vessels.to_sql('vessels', self.engine, if_exists='replace', index=False)
-
-        # Generate AIS positions
-        positions = []
-        start_time = datetime.now() - timedelta(days=7)
-        
-        for mmsi in vessels['mmsi']:
-            for hour in range(168):  # One week of data
-                positions.append({
-                    'mmsi': mmsi,
-                    'timestamp': start_time + timedelta(hours=hour),
-                    'latitude': np.random.uniform(20, 50),
-                    'longitude': np.random.uniform(-130, -70),
-                    'speed': np.random.uniform(0, 20),
-                    'course': np.random.uniform(0, 359),
-                    'navigation_status': np.random.choice(['Under way', 'At anchor', 'Moored'])
-                })
-
-        positions_df = pd.DataFrame(positions)
-        positions_df.to_sql('ais_positions', self.engine, if_exists='replace', index=False)
-
-    def execute_query(self, query: str) -> Optional[pd.DataFrame]:
-        """Execute SQL query and return results as DataFrame"""
+        # One stop window per vessel, spent either at anchor or moored
+        steps = np.arange(n_steps)
+        stop_start = rng.integers(0, n_steps, (n, 1))
+        stop_len = rng.integers(0, max(1, n_steps // 6) + 1, (n, 1))
+        stopped = (steps >= stop_start) & (steps < stop_start + stop_len)
+        speed[stopped] = rng.uniform(0, 0.3, int(stopped.sum()))
+        moored = rng.random((n, 1)) < 0.5
+        status = np.where(
+            stopped, np.where(moored, 'Moored', 'At anchor'), 'Under way'
+        )
+
+        # Distance covered in each step (nm); a nautical mile is a minute of latitude
+        rad = np.deg2rad(heading)
+        distance = speed * step_hours
+        start_lat = rng.uniform(20, 50, (n, 1))
+        start_lon = rng.uniform(-130, -70, (n, 1))
+        dlat = distance * np.cos(rad) / 60.0
+        # Fold the unbounded track back at the latitude bounds (a triangle wave):
+        # on every other leg the vessel runs mirrored, so its course is too
+        low, high = DatabaseManager.LATITUDE_BOUNDS
+        span = high - low
+        phase = np.mod(start_lat + np.cumsum(dlat, axis=1) - dlat - low, 2 * span)
+        mirrored = phase > span
+        latitude = low + np.where(mirrored, 2 * span - phase, phase)
+        heading = np.where(mirrored, np.mod(180 - heading, 360), heading)
+        rad = np.deg2rad(heading)
+        dlon = distance * np.sin(rad) / (60.0 * np.cos(np.deg2rad(latitude)))
+        longitude = np.mod(start_lon + np.cumsum(dlon, axis=1) - dlon + 180, 360) - 180
+
+        return {
+            'mmsi': np.repeat(mmsis, n_steps).tolist(),
+            'timestamp': np.tile(timestamps, n).tolist(),
+            'latitude': latitude.ravel().tolist(),
+            'longitude': longitude.ravel().tolist(),
+            'speed': speed.ravel().tolist(),
+            'course': heading.ravel().tolist(),
+            'navigation_status': status.ravel().tolist(),
+            'cell': grid_cell(latitude, longitude).ravel().tolist(),
+        }
+
+    @staticmethod
+    def _insert_statement(table: str, columns: Dict[str, List]):
+        """Build a parameterized INSERT for the given column names"""
+        names = ', '.join(columns)
+        binds = ', '.join(f':{name}' for name in columns)
+        return text(f"INSERT INTO {table} ({names}) VALUES ({binds})")
+
+    @staticmethod
+    def _records(columns: Dict[str, List]) -> List[Dict]:
+        """Turn column lists into executemany parameter rows"""
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+    def ingest_stream(self, source: Source, fmt: Optional[str] = None,
+                      batch_size: int = 20_000,
+                      on_batch: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Stream an AIS feed (NMEA, CSV or NDJSON) into the database
+
+        ``source`` is a file path (optionally gzipped), an iterable of feed
+        lines or an iterable of record dicts. Records are parsed lazily,
+        validated and de-duplicated on (mmsi, timestamp) in batches, and each
+        batch is written in a single transaction: vessel static data is
+        upserted and positions already stored are skipped. The rollup tables
+        and anomaly flags are brought up to date after every batch. ``on_batch``
+        receives the running metrics after every commit.
+
+        Returns throughput and lag metrics for the run.
+        """
+        stats = IngestStats()
+
+        for batch in batched(iter_records(source, fmt), batch_size):
+            positions, vessels = split_batch(batch, stats)
+            with self.engine.begin() as conn:
+                if vessels:
+                    conn.execute(queries.VESSEL_UPSERT, vessels)
+                    stats.vessels += len(vessels)
+                if positions:
+                    result = conn.execute(queries.POSITION_INSERT, positions)
+                    inserted = result.rowcount if result.rowcount >= 0 else len(positions)
+                    stats.positions += inserted
+                    stats.duplicates += len(positions) - inserted
+            stats.batches += 1
+            if positions:
+                refresh_rollups(self.engine)
+                refresh_anomalies(self.engine)
+            if positions or vessels:
+                self._invalidate()
+            if on_batch is not None:
+                on_batch(stats.to_dict())
+
+        return stats.to_dict()
+
+    @staticmethod
+    def _data_stamp(engine) -> tuple:
+        """Newest position id and write counter, as seen by every process sharing the database"""
+        with engine.connect() as conn:
+            return tuple(conn.execute(queries.DATA_STAMP).one())
+
+    def _invalidate(self) -> None:
+        """Drop cached results here and move the stamp other processes key their caches on"""
+        with self.engine.begin() as conn:
+            conn.execute(queries.DATA_VERSION_BUMP)
+        self.cache.invalidate()
+
+    def execute_query(self, query: Union[str, TextClause],
+                      params: Optional[Dict[str, Any]] = None) -> Optional[pd.DataFrame]:
+        """Execute SQL query and return results as DataFrame
+
+        Read-only queries are served from the result cache when enabled.
+        """
+        statement = text(query) if isinstance(query, str) else query
+        key = None
+        start = time.perf_counter()
+        if self.cache.enabled and self._is_read_only(statement.text):
+            key = self.cache.make_key(statement.text, params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                metrics.observe('db_query_seconds', time.perf_counter() - start, source='cache')
+                return cached
         try:
-            with self.engine.connect() as conn:
-                return pd.read_sql_query(text(query), conn)
+            with self.slow_log.measure(), self.engine.connect() as conn:
+                result = pd.read_sql_query(statement, conn, params=params)
         except Exception as e:
+            metrics.inc('db_query_errors_total', source='sqlite')
             print(f"Query execution failed: {str(e)}")
             return None
+        metrics.observe('db_query_seconds', time.perf_counter() - start, source='sqlite')
+        if key is not None:
+            self.cache.put(key, result)
+            return result.copy()
+        return result
+
+    def execute_analytical(self, duckdb_sql: str, params: Optional[Dict[str, Any]] = None,
+                           fallback: Optional[Union[str, TextClause]] = None) -> Optional[pd.DataFrame]:
+        """Run a scan-heavy query on the columnar mirror, or ``fallback`` on SQLite
 
-    def get_vessel_info(self, mmsi: int) -> Dict:
+        ``duckdb_sql`` is DuckDB SQL over the mirrored ``ais_positions`` and
+        ``vessels`` (``$name`` parameters); ``fallback`` is the equivalent
+        SQLAlchemy statement, used when the mirror is disabled, empty or fails.
+        Results are cached like execute_query's.
+        """
+        if self.columnar is not None:
+            start = time.perf_counter()
+            key = self.cache.make_key('duckdb:' + duckdb_sql, params) if self.cache.enabled else None
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                metrics.observe('db_query_seconds', time.perf_counter() - start, source='cache')
+                return cached
+            try:
+                result = self.columnar.query(duckdb_sql, params)
+            except Exception as e:
+                metrics.inc('db_query_errors_total', source='duckdb')
+                print(f"Columnar query failed, using SQLite: {str(e)}")
+                result = None
+            if result is not None:
+                metrics.observe('db_query_seconds', time.perf_counter() - start, source='duckdb')
+                if key is not None:
+                    self.cache.put(key, result)
+                    return result.copy()
+                return result
+        return self.execute_query(fallback, params) if fallback is not None else None
+
+    def iter_query(self, query: Union[str, TextClause], params: Optional[Dict[str, Any]] = None,
+                   chunk_rows: int = 50_000, max_chunk_mb: Optional[float] = None,
+                   arrow: bool = False) -> Iterator[Any]:
+        """Execute SQL and yield the result in chunks from a streaming cursor
+
+        Only one chunk is held in memory at a time and nothing is cached. With
+        ``max_chunk_mb`` a small first chunk measures the row size and later
+        chunks are sized to stay under the ceiling. ``arrow=True`` yields
+        pyarrow RecordBatches instead of DataFrames. The connection stays
+        checked out until the iterator is exhausted or closed.
+        """
+        if arrow and not HAS_PYARROW:
+            raise ImportError("pyarrow is required for Arrow chunks")
+        statement = text(query) if isinstance(query, str) else query
+        size = min(chunk_rows, 1_000) if max_chunk_mb else chunk_rows
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(statement, params or {})
+            columns = list(result.keys())
+            while True:
+                rows = result.fetchmany(size)
+                if not rows:
+                    break
+                frame = pd.DataFrame.from_records(rows, columns=columns)
+                if max_chunk_mb:
+                    row_bytes = max(1, frame.memory_usage(deep=True, index=False).sum() / len(frame))
+                    size = max(1, min(chunk_rows, int(max_chunk_mb * 1024 * 1024 // row_bytes)))
+                if arrow:
+                    import pyarrow as pa
+                    yield pa.RecordBatch.from_pandas(frame, preserve_index=False)
+                else:
+                    yield frame
+
+    def export_query(self, query: Union[str, TextClause], path: str,
+                     params: Optional[Dict[str, Any]] = None, chunk_rows: int = 50_000,
+                     max_chunk_mb: Optional[float] = 64) -> int:
+        """Stream a query result to a .parquet or .csv file; returns rows written"""
+        written = 0
+        if path.endswith('.parquet'):
+            if not HAS_PYARROW:
+                raise ImportError("pyarrow is required for Parquet export")
+            import pyarrow.parquet as pq
+            writer = None
+            try:
+                for batch in self.iter_query(query, params, chunk_rows, max_chunk_mb, arrow=True):
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, batch.schema)
+                    writer.write_batch(batch)
+                    written += batch.num_rows
+            finally:
+                if writer is not None:
+                    writer.close()
+            return written
+
+        if os.path.exists(path):
+            os.remove(path)
+        for frame in self.iter_query(query, params, chunk_rows, max_chunk_mb):
+            frame.to_csv(path, mode='a', header=written == 0, index=False)
+            written += len(frame)
+        return written
+
+    @staticmethod
+    def _is_read_only(query: str) -> bool:
+        head = query.lstrip().split(None, 1)[0].lower() if query.strip() else ''
+        return head in ('select', 'with')
+
+    def guard_query(self, query: str) -> GuardedQuery:
+        """Validate untrusted (generated) SQL as read-only and fit it to the result budget
+
+        Raises UnsafeQueryError for anything but a single SELECT/WITH statement.
+        Run ``.sql`` of the returned query through execute_query.
+        """
+        return self.guard.prepare(query)
+
+    def execute_budgeted(self, statement: TextClause,
+                         params: Optional[Dict[str, Any]] = None) -> Optional[pd.DataFrame]:
+        """Run a prepared statement within the row/memory budget of ``guard_query``
+
+        For raw-position reads answering user questions. Results over budget
+        are sampled or limited like generated SQL, and ``attrs['sql_guard']``
+        reports what was done.
+        """
+        guarded = self.guard.prepare(statement.text, params)
+        data = self.execute_query(statement if guarded.action == 'none' else guarded.sql, params)
+        if data is not None:
+            data.attrs['sql_guard'] = guarded.to_dict(len(data))
+        return data
+
+    def describe_schema(self, max_tokens: int = 600) -> str:
+        """Live schema summary with column stats, for SQL generation prompts
+
+        Stats are recomputed after DDL and otherwise at most every
+        ``schema_stats_ttl`` seconds, in the background.
+        """
+        return self.introspector.describe(max_tokens)
+
+    def schema_signature(self) -> str:
+        """Hash of the visible table layout; changes only with DDL"""
+        return self.introspector.signature()
+
+    def get_vessel_info(self, mmsi: int) -> Optional[Dict]:
         """Get detailed information about a specific vessel"""
-        query = f"""
-            SELECT v.*, 
-                   COUNT(DISTINCT p.id) as position_count,
-                   MAX(p.timestamp) as last_position
-            FROM vessels v
-            LEFT JOIN ais_positions p ON v.mmsi = p.mmsi
-            WHERE v.mmsi = {mmsi}
-            GROUP BY v.mmsi
+        result = self.execute_query(queries.VESSEL_INFO, {'mmsi': int(mmsi)})
+        return result.iloc[0].to_dict() if result is not None and not result.empty else None
+
+    def get_vessel_info_many(self, mmsis: Iterable[int]) -> Dict[int, Dict]:
+        """Get vessel information for many vessels in one round trip, keyed by mmsi"""
+        mmsis = sorted({int(m) for m in mmsis})
+        if not mmsis:
+            return {}
+        result = self.execute_query(queries.VESSEL_INFO_MANY, {'mmsis': mmsis})
+        if result is None:
+            return {}
+        return {int(row['mmsi']): row for row in result.to_dict('records')}
+
+    def get_recent_positions(self, hours: int = 24, budgeted: bool = False) -> pd.DataFrame:
+        """Get vessel positions from the last n hours
+
+        ``budgeted`` fits the result to the budget generated SQL gets (see
+        ``execute_budgeted``).
         """
-        result = self.execute_query(query)
-        return result.iloc[0].to_dict() if not result.empty else None
-
-    def get_recent_positions(self, hours: int = 24) -> pd.DataFrame:
-        """Get vessel positions from the last n hours"""
-        query = f"""
-            SELECT v.vessel_name, v.vessel_type, p.*
-            FROM ais_positions p
-            JOIN vessels v ON p.mmsi = v.mmsi
-            WHERE p.timestamp >= datetime('now', '-{hours} hours')
-            ORDER BY p.timestamp DESC
+        params = {'offset': f'-{int(hours)} hours'}
+        if budgeted:
+            return self.execute_budgeted(queries.RECENT_POSITIONS, params)
+        return self.execute_query(queries.RECENT_POSITIONS, params)
+
+    def get_vessels(self) -> pd.DataFrame:
+        """Get static data for every vessel"""
+        return self.execute_query(queries.VESSELS)
+
+    def find_vessel(self, name: str) -> Optional[int]:
+        """MMSI of the vessel with this name (case-insensitive), if any"""
+        result = self.execute_query(queries.VESSEL_BY_NAME, {'name': name})
+        return int(result.iloc[0]['mmsi']) if result is not None and not result.empty else None
+
+    def get_vessel_track(self, mmsi: int, start: Optional[str] = None,
+                         end: Optional[str] = None, budgeted: bool = False) -> pd.DataFrame:
+        """Get one vessel's positions in time order, optionally within a time range"""
+        params = {
+            'mmsi': int(mmsi),
+            'start': start or queries.MIN_TIMESTAMP,
+            'end': end or queries.MAX_TIMESTAMP,
+        }
+        if budgeted:
+            return self.execute_budgeted(queries.VESSEL_TRACK, params)
+        return self.execute_query(queries.VESSEL_TRACK, params)
+
+    def get_density_grid(self, cell_degrees: float = 0.5, start: Optional[str] = None,
+                         end: Optional[str] = None) -> pd.DataFrame:
+        """Position counts (and mean speed) per grid cell, binned in the database
+
+        Returns latitude/longitude cell centers with a ``count`` column, ready
+        for VisualizationManager's density map without pulling raw points.
+        Served from the columnar mirror when it is enabled.
+        """
+        return self.execute_analytical(columnar.DENSITY_GRID, {
+            'cell_degrees': float(cell_degrees),
+            'start': start or queries.MIN_TIMESTAMP,
+            'end': end or queries.MAX_TIMESTAMP,
+        }, fallback=queries.DENSITY_GRID)
+
+    def refresh_rollups(self) -> Dict[str, int]:
+        """Fold positions written outside this manager into the rollup tables"""
+        progress = refresh_rollups(self.engine)
+        if progress['to_id'] > progress['from_id']:
+            self._invalidate()
+        return progress
+
+    def get_speed_histogram(self, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Positions per speed bucket from the hourly rollup
+
+        ``speed`` is each bucket's lower bound; buckets are SPEED_BUCKET_KNOTS
+        wide and the time range is matched at hour granularity.
+        """
+        return self.execute_query(queries.SPEED_HISTOGRAM, self._hour_range(start, end))
+
+    def get_speed_summary(self, start: Optional[str] = None, end: Optional[str] = None) -> Optional[Dict]:
+        """Vessel and position counts with mean/max speed, from the hourly rollup"""
+        result = self.execute_query(queries.SPEED_SUMMARY, self._hour_range(start, end))
+        return result.iloc[0].to_dict() if result is not None and not result.empty else None
+
+    def get_hourly_speed(self, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Fleet-wide mean/max speed and position count per hour"""
+        return self.execute_query(queries.HOURLY_SPEED, self._hour_range(start, end))
+
+    def get_vessel_type_counts(self) -> pd.DataFrame:
+        """Vessels and positions per vessel type, from the rollup"""
+        return self.execute_query(queries.VESSEL_TYPE_COUNTS)
+
+    def get_port_events(self, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Arrivals and departures (moored/at-anchor transitions) in time order"""
+        return self.execute_query(queries.PORT_EVENTS, {
+            'start': start or queries.MIN_TIMESTAMP,
+            'end': end or queries.MAX_TIMESTAMP,
+        })
+
+    def refresh_anomalies(self) -> Dict[str, int]:
+        """Check positions written outside this manager for anomalies"""
+        progress = refresh_anomalies(self.engine)
+        if progress['to_id'] > progress['from_id']:
+            self._invalidate()
+        return progress
+
+    def get_anomalies(self, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Flagged positions (gaps, teleports, speed jumps, out-of-range values) in time order"""
+        return self.execute_query(queries.ANOMALIES, {
+            'start': start or queries.MIN_TIMESTAMP,
+            'end': end or queries.MAX_TIMESTAMP,
+        })
+
+    def get_anomaly_summary(self, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Flag counts and worst value per vessel and anomaly kind, most flagged first"""
+        return self.execute_query(queries.ANOMALY_SUMMARY, {
+            'start': start or queries.MIN_TIMESTAMP,
+            'end': end or queries.MAX_TIMESTAMP,
+        })
+
+    @staticmethod
+    def _hour_range(start: Optional[str], end: Optional[str]) -> Dict[str, str]:
+        """Widen a timestamp range to the hour rows that overlap it"""
+        return {
+            'start': start[:13] + ':00:00' if start else queries.MIN_TIMESTAMP,
+            'end': end or queries.MAX_TIMESTAMP,
+        }
+
+    def get_positions_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                              start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Get positions inside a lat/lon bounding box, optionally within a time range
+
+        Uses the R*Tree on SQLite and the grid cell index elsewhere. A box
+        with ``min_lon > max_lon`` crosses the antimeridian and is queried
+        as its two halves.
         """
-        return self.execute_query(query)
+        if min_lon > max_lon:
+            halves = [
+                self.get_positions_in_bbox(min_lat, min_lon, max_lat, 180.0, start, end),
+                self.get_positions_in_bbox(min_lat, -180.0, max_lat, max_lon, start, end),
+            ]
+            if any(half is None for half in halves):
+                return None
+            return pd.concat(halves, ignore_index=True).sort_values(['mmsi', 'timestamp'], ignore_index=True)
+        params = {
+            'min_lat': min_lat, 'min_lon': min_lon, 'max_lat': max_lat, 'max_lon': max_lon,
+            'start': start or queries.MIN_TIMESTAMP, 'end': end or queries.MAX_TIMESTAMP,
+        }
+        with self.engine.connect() as conn:
+            use_rtree = has_rtree(conn)
+        if use_rtree:
+            statement = queries.BBOX_RTREE
+        else:
+            statement = queries.BBOX_CELLS
+            params['cells'] = cells_for_bbox(min_lat, min_lon, max_lat, max_lon)
+        return self.execute_query(statement, params)
@@ -0,0 +1,92 @@
+
+import threading
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, StaticPool
+
+# Applied to every new SQLite connection. WAL lets readers proceed while a
+# writer (ingestion) holds the write lock; NORMAL sync is durable under WAL.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,        # 64 MB page cache per connection
+    'mmap_size': 268435456,      # 256 MB memory-mapped reads
+    'foreign_keys': 'OFF',
+}
+
+_engines: Dict[Tuple, Engine] = {}
+_lock = threading.Lock()
+
+
+def get_engine(connection_string: str, pool_size: int = 5, max_overflow: int = 10,
+               timeout: float = 30) -> Engine:
+    """Return the process-wide engine for these settings, creating it once
+
+    ``timeout`` is used both as the pool checkout timeout and, on SQLite, as
+    the busy timeout when a connection waits on a lock.
+    """
+    key = (connection_string, pool_size, max_overflow, timeout)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _create_engine(connection_string, pool_size, max_overflow, timeout)
+            _engines[key] = engine
+        return engine
+
+
+def dispose_engines() -> None:
+    """Close every pooled connection (for tests and shutdown hooks)"""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def _create_engine(connection_string: str, pool_size: int, max_overflow: int,
+                   timeout: float) -> Engine:
+    if not connection_string.startswith('sqlite'):
+        return create_engine(
+            connection_string,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=timeout,
+            pool_pre_ping=True,
+        )
+
+    connect_args = {'timeout': timeout, 'check_same_thread': False}
+    if _is_memory(connection_string):
+        # Every connection to :memory: is a separate database, so share one
+        return create_engine(connection_string, connect_args=connect_args, poolclass=StaticPool)
+
+    engine = create_engine(
+        connection_string,
+        connect_args=connect_args,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=timeout,
+    )
+    event.listen(engine, 'connect', _sqlite_pragmas(timeout))
+    return engine
+
+
+def _sqlite_pragmas(timeout: float):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        cursor.close()
+    return on_connect
+
+
+def _is_memory(connection_string: str) -> bool:
+    path = connection_string.split(':///', 1)[-1] if ':///' in connection_string else ''
+    return path in ('', ':memory:') or 'mode=memory' in path
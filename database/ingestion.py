@@ -0,0 +1,418 @@
+
+import csv
+import gzip
+import json
+import math
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# AIS navigation status codes (ITU-R M.1371) mapped onto the labels used in
+# ais_positions. "Under way" covers both engine and sail.
+NAVIGATION_STATUS = {
+    0: 'Under way',
+    1: 'At anchor',
+    2: 'Not under command',
+    3: 'Restricted manoeuvrability',
+    4: 'Constrained by draught',
+    5: 'Moored',
+    6: 'Aground',
+    7: 'Engaged in fishing',
+    8: 'Under way',
+    14: 'AIS-SART',
+}
+
+# CSV/NDJSON column aliases, including the MarineCadastre export headers
+FIELD_ALIASES = {
+    'mmsi': 'mmsi',
+    'timestamp': 'timestamp',
+    'basedatetime': 'timestamp',
+    'time': 'timestamp',
+    'latitude': 'latitude',
+    'lat': 'latitude',
+    'longitude': 'longitude',
+    'lon': 'longitude',
+    'speed': 'speed',
+    'sog': 'speed',
+    'course': 'course',
+    'cog': 'course',
+    'navigation_status': 'navigation_status',
+    'status': 'navigation_status',
+    'vessel_name': 'vessel_name',
+    'vesselname': 'vessel_name',
+    'shipname': 'vessel_name',
+    'vessel_type': 'vessel_type',
+    'vesseltype': 'vessel_type',
+    'shiptype': 'vessel_type',
+    'length': 'length',
+    'width': 'width',
+    'flag': 'flag',
+    'destination': 'destination',
+}
+
+# AIS "not available" speed (1023 in tenths of a knot) and course (3600 in tenths of a degree)
+SPEED_NOT_AVAILABLE = 102.3
+COURSE_NOT_AVAILABLE = 360.0
+
+POSITION_FIELDS = ['mmsi', 'timestamp', 'latitude', 'longitude', 'speed', 'course', 'navigation_status',
+                   'reported_speed', 'reported_course']
+VESSEL_FIELDS = ['mmsi', 'vessel_name', 'vessel_type', 'length', 'width', 'flag', 'destination']
+
+Source = Union[str, Path, Iterable[Any]]
+
+
+class IngestStats:
+    """Running throughput and lag metrics for one ingestion run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.positions = 0
+        self.vessels = 0
+        self.batches = 0
+        self.max_timestamp: Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Records read per second"""
+        return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def lag_seconds(self) -> Optional[float]:
+        """How far the newest ingested fix trails the wall clock"""
+        if self.max_timestamp is None:
+            return None
+        newest = datetime.strptime(self.max_timestamp, '%Y-%m-%d %H:%M:%S')
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (now - newest).total_seconds()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'read': self.read,
+            'rejected': self.rejected,
+            'duplicates': self.duplicates,
+            'positions_written': self.positions,
+            'vessels_upserted': self.vessels,
+            'batches': self.batches,
+            'elapsed_s': round(self.elapsed, 3),
+            'records_per_s': round(self.throughput, 1),
+            'lag_s': self.lag_seconds,
+        }
+
+
+def iter_records(source: Source, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield raw AIS records from a path, line iterable or record iterable
+
+    ``fmt`` is one of ``nmea``, ``csv`` or ``ndjson``; when omitted it is
+    taken from the file extension or sniffed from the first line. NDJSON
+    lines that don't parse are yielded as None, so they are counted as
+    rejected instead of ending the feed.
+    """
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        suffixes = [s.lower() for s in path.suffixes]
+        opener = gzip.open if suffixes and suffixes[-1] == '.gz' else open
+        if fmt is None:
+            fmt = _format_from_suffix(suffixes)
+        with opener(path, 'rt', newline='') as handle:
+            yield from iter_records(handle, fmt)
+        return
+
+    lines = iter(source)
+    first = next(lines, None)
+    if first is None:
+        return
+    if isinstance(first, dict):
+        yield first
+        yield from lines
+        return
+
+    fmt = fmt or _sniff_format(first)
+    lines = _chain(first, lines)
+    if fmt == 'nmea':
+        yield from parse_nmea(lines)
+    elif fmt == 'ndjson':
+        for line in lines:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+    elif fmt == 'csv':
+        yield from csv.DictReader(lines)
+    else:
+        raise ValueError(f"Unsupported AIS feed format: {fmt}")
+
+
+def normalize_record(raw: Any) -> Optional[Dict[str, Any]]:
+    """Map aliases, coerce types and validate ranges; None if unusable"""
+    if not isinstance(raw, dict):
+        return None
+    record = {}
+    for key, value in raw.items():
+        field = FIELD_ALIASES.get(str(key).strip().lower())
+        if field is not None and value not in ('', None):
+            record[field] = value
+
+    try:
+        record['mmsi'] = int(float(record['mmsi']))
+        if raw.get('static_only'):
+            record['static_only'] = True
+        else:
+            record['latitude'] = float(record['latitude'])
+            record['longitude'] = float(record['longitude'])
+            record['timestamp'] = _normalize_timestamp(record['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if not 0 < record['mmsi'] <= 999_999_999:
+        return None
+    if not record.get('static_only') and not (
+        -90 <= record['latitude'] <= 90 and -180 <= record['longitude'] <= 180
+    ):
+        return None
+
+    # Out-of-range values are nulled but kept as reported for the anomaly flags;
+    # 102.3 kn and 360 degrees are AIS "not available", not bad readings
+    record['speed'], record['reported_speed'] = _checked_float(
+        record.get('speed'), 0, 102.2, unavailable=SPEED_NOT_AVAILABLE)
+    record['course'], record['reported_course'] = _checked_float(
+        record.get('course'), 0, 360, inclusive_upper=False, unavailable=COURSE_NOT_AVAILABLE)
+    for field in ('length', 'width'):
+        record[field] = _bounded_float(record.get(field), 0, 1000)
+
+    status = record.get('navigation_status')
+    if status is not None and str(status).strip().isdigit():
+        record['navigation_status'] = NAVIGATION_STATUS.get(int(status))
+    vessel_type = record.get('vessel_type')
+    if vessel_type is not None and str(vessel_type).strip().isdigit():
+        record['vessel_type'] = ship_type_label(int(vessel_type))
+    return record
+
+
+def batched(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Group an iterator into lists of at most ``size`` items"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def split_batch(batch: List[Dict[str, Any]], stats: IngestStats) -> Tuple[List[Dict], List[Dict]]:
+    """Validate a raw batch into de-duplicated position rows and vessel rows"""
+    positions: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    vessels: Dict[int, Dict[str, Any]] = {}
+
+    for raw in batch:
+        stats.read += 1
+        record = normalize_record(raw)
+        if record is None:
+            stats.rejected += 1
+            continue
+
+        static = {field: record.get(field) for field in VESSEL_FIELDS}
+        previous = vessels.get(record['mmsi'])
+        if previous is not None:
+            static = {k: static[k] if static[k] is not None else previous[k] for k in VESSEL_FIELDS}
+        vessels[record['mmsi']] = static
+
+        if record.get('static_only'):
+            continue
+        key = (record['mmsi'], record['timestamp'])
+        if key in positions:
+            stats.duplicates += 1
+            continue
+        positions[key] = {field: record.get(field) for field in POSITION_FIELDS}
+        if stats.max_timestamp is None or record['timestamp'] > stats.max_timestamp:
+            stats.max_timestamp = record['timestamp']
+
+    return list(positions.values()), list(vessels.values())
+
+
+def ship_type_label(code: int) -> str:
+    """Collapse the AIS ship-and-cargo type code into our vessel categories"""
+    if 60 <= code <= 69:
+        return 'Passenger'
+    if 70 <= code <= 79:
+        return 'Cargo'
+    if 80 <= code <= 89:
+        return 'Tanker'
+    return 'Other'
+
+
+def parse_nmea(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Decode !AIVDM/!AIVDO sentences (types 1-3, 5 and 18)
+
+    Multi-fragment messages are reassembled per sequence id. The fix time is
+    taken from an NMEA 4.0 tag block (``\\c:<unix>*hh\\``) when present and
+    otherwise from the receive time.
+    """
+    fragments: Dict[Tuple[str, str], List[str]] = {}
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        received = None
+        if line.startswith('\\'):
+            tag, _, line = line[1:].partition('\\')
+            for item in tag.split('*')[0].split(','):
+                if item.startswith('c:'):
+                    try:
+                        received = datetime.fromtimestamp(int(item[2:]), timezone.utc)
+                    except ValueError:
+                        pass
+
+        parts = line.split(',')
+        if len(parts) < 7 or not parts[0].endswith(('VDM', 'VDO')):
+            continue
+        try:
+            total, number = int(parts[1]), int(parts[2])
+        except ValueError:
+            continue
+        payload = parts[5]
+
+        if total > 1:
+            key = (parts[3], parts[4])
+            fragments.setdefault(key, []).append(payload)
+            if number < total:
+                continue
+            payload = ''.join(fragments.pop(key))
+
+        record = _decode_payload(payload)
+        if record is not None:
+            stamp = received or datetime.now(timezone.utc)
+            record['timestamp'] = stamp.strftime('%Y-%m-%d %H:%M:%S')
+            yield record
+
+
+def _decode_payload(payload: str) -> Optional[Dict[str, Any]]:
+    bits = ''.join(format(_sixbit(c), '06b') for c in payload)
+    if len(bits) < 38:
+        return None
+
+    def uint(start, length):
+        return int(bits[start:start + length], 2)
+
+    def sint(start, length):
+        value = uint(start, length)
+        return value - (1 << length) if value & (1 << (length - 1)) else value
+
+    def string(start, length):
+        chars = [_ITA_CHARS[uint(i, 6)] for i in range(start, start + length, 6)]
+        return ''.join(chars).split('@')[0].strip() or None
+
+    msg_type = uint(0, 6)
+    mmsi = uint(8, 30)
+
+    if msg_type in (1, 2, 3) and len(bits) >= 137:
+        speed, lon, lat, course = uint(50, 10), sint(61, 28), sint(89, 27), uint(116, 12)
+        status = NAVIGATION_STATUS.get(uint(38, 4))
+    elif msg_type == 18 and len(bits) >= 124:
+        speed, lon, lat, course = uint(46, 10), sint(57, 28), sint(85, 27), uint(112, 12)
+        status = None
+    elif msg_type == 5 and len(bits) >= 422:
+        return {
+            'mmsi': mmsi,
+            'vessel_name': string(112, 120),
+            'vessel_type': ship_type_label(uint(232, 8)),
+            'length': float(uint(240, 9) + uint(249, 9)) or None,
+            'width': float(uint(258, 6) + uint(264, 6)) or None,
+            'destination': string(302, 120),
+            # Static reports carry no position, only the vessel row is updated
+            'static_only': True,
+        }
+    else:
+        return None
+
+    return {
+        'mmsi': mmsi,
+        'latitude': lat / 600000.0,
+        'longitude': lon / 600000.0,
+        'speed': None if speed == 1023 else speed / 10.0,
+        'course': None if course == 3600 else course / 10.0,
+        'navigation_status': status,
+    }
+
+
+_ITA_CHARS = '@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_ !"#$%&\'()*+,-./0123456789:;<=>?'
+
+
+def _sixbit(char: str) -> int:
+    value = ord(char) - 48
+    return value - 8 if value > 40 else value
+
+
+def _normalize_timestamp(value: Any) -> str:
+    if isinstance(value, (int, float)):
+        stamp = datetime.fromtimestamp(value, timezone.utc)
+    elif isinstance(value, datetime):
+        stamp = value
+    else:
+        stamp = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return stamp.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _bounded_float(value: Any, low: float, high: float, inclusive_upper: bool = True) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if value < low or value > high or (not inclusive_upper and value == high):
+        return None
+    return value
+
+
+def _checked_float(value: Any, low: float, high: float, inclusive_upper: bool = True,
+                   unavailable: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+    """(value if in range, value as reported if a number outside the range)"""
+    checked = _bounded_float(value, low, high, inclusive_upper)
+    if checked is not None:
+        return checked, None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None, None
+    if math.isnan(value) or value == unavailable:
+        return None, None
+    return None, value
+
+
+def _format_from_suffix(suffixes: List[str]) -> Optional[str]:
+    for suffix in reversed(suffixes):
+        if suffix in ('.nmea', '.ais', '.txt'):
+            return 'nmea'
+        if suffix == '.csv':
+            return 'csv'
+        if suffix in ('.json', '.ndjson', '.jsonl'):
+            return 'ndjson'
+    return None
+
+
+def _sniff_format(first_line: str) -> str:
+    stripped = first_line.lstrip()
+    if stripped.startswith(('!', '\\')):
+        return 'nmea'
+    if stripped.startswith('{'):
+        return 'ndjson'
+    return 'csv'
+
+
+def _chain(first: str, rest: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from rest
@@ -0,0 +1,337 @@
+
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+import numpy as np
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+# Positions are bucketed into 1-degree cells so bounding-box filters can use
+# an ordinary B-tree index: cell = floor(lat + 90) * 360 + floor(lon + 180).
+CELL_DEGREES = 1
+CELL_COLUMNS = 360 // CELL_DEGREES
+CELL_SQL = (
+    f"CAST((:latitude + 90) / {CELL_DEGREES} AS INTEGER) * {CELL_COLUMNS}"
+    f" + CAST((:longitude + 180) / {CELL_DEGREES} AS INTEGER)"
+)
+
+
+def grid_cell(latitude, longitude):
+    """Grid cell id for scalar or NumPy lat/lon values"""
+    row = np.floor_divide(np.add(latitude, 90), CELL_DEGREES).astype(np.int64)
+    col = np.floor_divide(np.add(longitude, 180), CELL_DEGREES).astype(np.int64)
+    return row * CELL_COLUMNS + col
+
+
+def cells_for_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+    """All grid cells overlapping a bounding box
+
+    A box with ``min_lon > max_lon`` crosses the antimeridian and covers
+    min_lon..180 plus -180..max_lon.
+    """
+    if min_lon > max_lon:
+        return (cells_for_bbox(min_lat, min_lon, max_lat, 180.0)
+                + cells_for_bbox(min_lat, -180.0, max_lat, max_lon))
+    rows = range(int((min_lat + 90) // CELL_DEGREES), int((max_lat + 90) // CELL_DEGREES) + 1)
+    cols = range(int((min_lon + 180) // CELL_DEGREES), int((max_lon + 180) // CELL_DEGREES) + 1)
+    return [r * CELL_COLUMNS + c for r in rows for c in cols]
+
+
+def _dedupe_positions(conn: Connection) -> None:
+    """Unique (mmsi, timestamp); on SQLite this DELETEs all but the first copy of duplicate fixes"""
+    if conn.dialect.name == 'sqlite':
+        removed = conn.execute(text("""
+            DELETE FROM ais_positions WHERE rowid NOT IN (
+                SELECT MIN(rowid) FROM ais_positions GROUP BY mmsi, timestamp
+            )
+        """)).rowcount
+        if removed:
+            print(f"Migration 1 deleted {removed} duplicate (mmsi, timestamp) rows from ais_positions")
+    conn.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_ais_positions_mmsi_timestamp
+        ON ais_positions (mmsi, timestamp)
+    """))
+
+
+def _timestamp_index(conn: Connection) -> None:
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_ais_positions_timestamp
+        ON ais_positions (timestamp)
+    """))
+
+
+def _grid_cell_column(conn: Connection) -> None:
+    columns = {c['name'] for c in _columns(conn, 'ais_positions')}
+    if 'cell' not in columns:
+        conn.execute(text("ALTER TABLE ais_positions ADD COLUMN cell INTEGER"))
+    conn.execute(text(
+        "UPDATE ais_positions SET cell = "
+        + CELL_SQL.replace(':latitude', 'latitude').replace(':longitude', 'longitude')
+        + " WHERE cell IS NULL"
+    ))
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_ais_positions_cell_timestamp
+        ON ais_positions (cell, timestamp)
+    """))
+
+
+def _rtree_index(conn: Connection) -> None:
+    """R*Tree over position points, kept in sync by triggers (SQLite only)"""
+    if not _rtree_supported(conn):
+        return
+    if 'id' not in {c['name'] for c in _columns(conn, 'ais_positions')}:
+        return
+    conn.execute(text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS ais_positions_rtree
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    """))
+    conn.execute(text("""
+        INSERT OR IGNORE INTO ais_positions_rtree
+        SELECT id, latitude, latitude, longitude, longitude
+        FROM ais_positions WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS ais_positions_rtree_insert
+        AFTER INSERT ON ais_positions
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+        BEGIN
+            INSERT INTO ais_positions_rtree
+            VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS ais_positions_rtree_delete
+        AFTER DELETE ON ais_positions
+        BEGIN
+            DELETE FROM ais_positions_rtree WHERE id = old.id;
+        END
+    """))
+
+
+def _rollup_tables(conn: Connection) -> None:
+    """Aggregate tables maintained by database/rollups.py"""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS vessel_hourly (
+            mmsi INTEGER,
+            hour TEXT,
+            positions INTEGER,
+            speeds INTEGER,
+            speed_sum REAL,
+            speed_min REAL,
+            speed_max REAL,
+            PRIMARY KEY (mmsi, hour)
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vessel_hourly_hour ON vessel_hourly (hour)"))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS speed_histogram_hourly (
+            mmsi INTEGER,
+            hour TEXT,
+            speed_bucket INTEGER,
+            positions INTEGER,
+            PRIMARY KEY (mmsi, hour, speed_bucket)
+        )
+    """))
+    # Covering, so fleet-wide histograms over a time range never touch the table
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_speed_histogram_hourly_hour "
+        "ON speed_histogram_hourly (hour, speed_bucket, positions)"
+    ))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS vessel_type_counts (
+            vessel_type TEXT PRIMARY KEY,
+            vessels INTEGER,
+            positions INTEGER,
+            first_seen TEXT,
+            last_seen TEXT
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS port_events (
+            mmsi INTEGER,
+            timestamp TEXT,
+            event TEXT,
+            navigation_status TEXT,
+            latitude REAL,
+            longitude REAL,
+            PRIMARY KEY (mmsi, timestamp)
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_port_events_timestamp ON port_events (timestamp)"))
+    # Bookkeeping: how far the rollups have read, and each vessel's last status
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS rollup_vessel_status (
+            mmsi INTEGER PRIMARY KEY,
+            timestamp TEXT,
+            navigation_status TEXT
+        )
+    """))
+
+
+def _anomaly_tables(conn: Connection) -> None:
+    """Data-quality flags maintained by database/anomalies.py"""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS position_anomalies (
+            position_id INTEGER,
+            mmsi INTEGER,
+            timestamp TEXT,
+            anomaly TEXT,
+            value REAL,
+            latitude REAL,
+            longitude REAL,
+            previous_timestamp TEXT,
+            PRIMARY KEY (position_id, anomaly)
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_position_anomalies_timestamp ON position_anomalies (timestamp)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_position_anomalies_mmsi ON position_anomalies (mmsi, timestamp)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_position_anomalies_anomaly ON position_anomalies (anomaly, timestamp)"
+    ))
+    # Each vessel's last checked fix, which the next batch is diffed against
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS rollup_anomaly_state (
+            mmsi INTEGER PRIMARY KEY,
+            position_id INTEGER,
+            timestamp TEXT,
+            latitude REAL,
+            longitude REAL,
+            speed REAL
+        )
+    """))
+
+
+def _vessel_type_rollup(conn: Connection) -> None:
+    """Per-vessel totals that vessel_type_counts is folded from (database/rollups.py)"""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS rollup_vessel_type (
+            mmsi INTEGER PRIMARY KEY,
+            vessel_type TEXT,
+            positions INTEGER,
+            first_seen TEXT,
+            last_seen TEXT
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_rollup_vessel_type_type ON rollup_vessel_type (vessel_type)"
+    ))
+    # Same id range as vessel_hourly, so the positions watermark still holds
+    conn.execute(text("""
+        INSERT INTO rollup_vessel_type (mmsi, vessel_type, positions, first_seen, last_seen)
+        SELECT h.mmsi, COALESCE(MAX(v.vessel_type), 'Unknown'), SUM(h.positions), MIN(h.hour), MAX(h.hour)
+        FROM vessel_hourly h
+        LEFT JOIN vessels v ON v.mmsi = h.mmsi
+        GROUP BY h.mmsi
+    """))
+
+
+def _data_version(conn: Connection) -> None:
+    """Write counter shared by every process, part of result cache keys (database/cache.py)"""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER
+        )
+    """))
+    conn.execute(text("INSERT INTO data_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING"))
+
+
+def _reported_values(conn: Connection) -> None:
+    """Out-of-range speed/course as received, kept for the range anomaly flags"""
+    columns = {c['name'] for c in _columns(conn, 'ais_positions')}
+    for column in ('reported_speed', 'reported_course'):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE ais_positions ADD COLUMN {column} REAL"))
+
+
+def _database_identity(conn: Connection) -> None:
+    """Random id of this database and a counter of ais_positions resets, for derived copies (database/columnar.py)"""
+    columns = {c['name'] for c in _columns(conn, 'data_version')}
+    if 'instance' not in columns:
+        conn.execute(text("ALTER TABLE data_version ADD COLUMN instance TEXT"))
+    if 'generation' not in columns:
+        conn.execute(text("ALTER TABLE data_version ADD COLUMN generation INTEGER DEFAULT 0"))
+    conn.execute(text("UPDATE data_version SET instance = :instance WHERE instance IS NULL"),
+                 {'instance': uuid.uuid4().hex})
+    conn.execute(text("UPDATE data_version SET generation = 0 WHERE generation IS NULL"))
+
+
+# Ordered, append-only. Never edit an applied step; add a new one instead.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, 'unique (mmsi, timestamp) index', _dedupe_positions),
+    (2, 'timestamp index', _timestamp_index),
+    (3, 'grid cell column and (cell, timestamp) index', _grid_cell_column),
+    (4, 'R*Tree spatial index', _rtree_index),
+    (5, 'rollup tables', _rollup_tables),
+    (6, 'position anomaly flags', _anomaly_tables),
+    (7, 'per-vessel type rollup', _vessel_type_rollup),
+    (8, 'persistent data version', _data_version),
+    (9, 'reported out-of-range speed/course', _reported_values),
+    (10, 'database identity and reset generation', _database_identity),
+]
+
+
+def apply_migrations(engine: Engine) -> List[int]:
+    """Apply pending migrations in order and return the versions applied"""
+    applied = []
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at DATETIME
+            )
+        """))
+        done = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    for version, description, step in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations VALUES (:version, :description, :applied_at)"),
+                {
+                    'version': version,
+                    'description': description,
+                    'applied_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                },
+            )
+        applied.append(version)
+    return applied
+
+
+def schema_version(engine: Engine) -> int:
+    """Highest applied migration version (0 for an unmigrated database)"""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def has_rtree(conn: Connection) -> bool:
+    """Whether the ais_positions R*Tree has been created on this database"""
+    if conn.dialect.name != 'sqlite':
+        return False
+    row = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'ais_positions_rtree'"
+    )).first()
+    return row is not None
+
+
+def _rtree_supported(conn: Connection) -> bool:
+    if conn.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in conn.execute(text("PRAGMA compile_options"))}
+    return 'ENABLE_RTREE' in options
+
+
+def _columns(conn: Connection, table: str):
+    return inspect(conn).get_columns(table)
@@ -0,0 +1,206 @@
+
+# Prepared statements used by DatabaseManager. Each one is built once at import
+# time with bound parameters, so SQLAlchemy reuses its compiled form and the
+# DBAPI driver reuses the prepared statement instead of re-parsing SQL per call.
+from sqlalchemy import Float, Integer, String, bindparam, text
+
+from database.migrations import CELL_SQL
+from database.rollups import SPEED_BUCKET_KNOTS
+
+# Sentinels for open-ended timestamp ranges; they sort before/after any
+# 'YYYY-MM-DD HH:MM:SS' value so the range stays index-friendly.
+MIN_TIMESTAMP = '0000-01-01 00:00:00'
+MAX_TIMESTAMP = '9999-12-31 23:59:59'
+
+VESSEL_INFO = text("""
+    SELECT v.*,
+           (SELECT COUNT(*) FROM ais_positions p WHERE p.mmsi = v.mmsi) AS position_count,
+           (SELECT MAX(p.timestamp) FROM ais_positions p WHERE p.mmsi = v.mmsi) AS last_position
+    FROM vessels v
+    WHERE v.mmsi = :mmsi
+""").bindparams(bindparam('mmsi', type_=Integer))
+
+VESSEL_INFO_MANY = text("""
+    SELECT v.*,
+           (SELECT COUNT(*) FROM ais_positions p WHERE p.mmsi = v.mmsi) AS position_count,
+           (SELECT MAX(p.timestamp) FROM ais_positions p WHERE p.mmsi = v.mmsi) AS last_position
+    FROM vessels v
+    WHERE v.mmsi IN :mmsis
+""").bindparams(bindparam('mmsis', type_=Integer, expanding=True))
+
+RECENT_POSITIONS = text("""
+    SELECT v.vessel_name, v.vessel_type, p.*
+    FROM ais_positions p
+    JOIN vessels v ON p.mmsi = v.mmsi
+    WHERE p.timestamp >= datetime('now', :offset)
+    ORDER BY p.timestamp DESC
+""").bindparams(bindparam('offset', type_=String))
+
+VESSEL_TRACK = text("""
+    SELECT v.vessel_name, v.vessel_type, p.*
+    FROM ais_positions p
+    JOIN vessels v ON p.mmsi = v.mmsi
+    WHERE p.mmsi = :mmsi AND p.timestamp BETWEEN :start AND :end
+    ORDER BY p.timestamp
+""").bindparams(
+    bindparam('mmsi', type_=Integer),
+    bindparam('start', type_=String),
+    bindparam('end', type_=String),
+)
+
+VESSELS = text("""
+    SELECT mmsi, vessel_name, vessel_type, length, width, flag, destination
+    FROM vessels
+""")
+
+VESSEL_BY_NAME = text("""
+    SELECT mmsi FROM vessels WHERE UPPER(vessel_name) = UPPER(:name)
+""").bindparams(bindparam('name', type_=String))
+
+_BBOX_BINDS = (
+    bindparam('min_lat', type_=Float),
+    bindparam('min_lon', type_=Float),
+    bindparam('max_lat', type_=Float),
+    bindparam('max_lon', type_=Float),
+    bindparam('start', type_=String),
+    bindparam('end', type_=String),
+)
+
+# CROSS JOIN pins the R*Tree as the outer loop of the plan
+BBOX_RTREE = text("""
+    SELECT p.* FROM ais_positions_rtree r
+    CROSS JOIN ais_positions p
+    WHERE p.id = r.id
+      AND r.min_lat >= :min_lat AND r.max_lat <= :max_lat
+      AND r.min_lon >= :min_lon AND r.max_lon <= :max_lon
+      AND p.timestamp BETWEEN :start AND :end
+    ORDER BY p.mmsi, p.timestamp
+""").bindparams(*_BBOX_BINDS)
+
+BBOX_CELLS = text("""
+    SELECT p.* FROM ais_positions p
+    WHERE p.cell IN :cells
+      AND p.timestamp BETWEEN :start AND :end
+      AND p.latitude BETWEEN :min_lat AND :max_lat
+      AND p.longitude BETWEEN :min_lon AND :max_lon
+    ORDER BY p.mmsi, p.timestamp
+""").bindparams(*_BBOX_BINDS, bindparam('cells', type_=Integer, expanding=True))
+
+# Positions counted per grid cell of :cell_degrees, reported at the cell center.
+# Shifting to non-negative coordinates lets CAST truncate like FLOOR on any backend.
+DENSITY_GRID = text("""
+    SELECT (CAST((p.latitude + 90) / :cell_degrees AS INTEGER) + 0.5) * :cell_degrees - 90 AS latitude,
+           (CAST((p.longitude + 180) / :cell_degrees AS INTEGER) + 0.5) * :cell_degrees - 180 AS longitude,
+           COUNT(*) AS count,
+           AVG(p.speed) AS speed
+    FROM ais_positions p
+    WHERE p.timestamp BETWEEN :start AND :end
+    GROUP BY 1, 2
+""").bindparams(
+    bindparam('cell_degrees', type_=Float),
+    bindparam('start', type_=String),
+    bindparam('end', type_=String),
+)
+
+# Rollup tables (database/rollups.py); hour is 'YYYY-MM-DD HH:00:00'
+_RANGE_BINDS = (
+    bindparam('start', type_=String),
+    bindparam('end', type_=String),
+)
+
+SPEED_HISTOGRAM = text(f"""
+    SELECT speed_bucket * {SPEED_BUCKET_KNOTS} AS speed, SUM(positions) AS positions
+    FROM speed_histogram_hourly
+    WHERE hour BETWEEN :start AND :end
+    GROUP BY speed_bucket
+    ORDER BY speed_bucket
+""").bindparams(*_RANGE_BINDS)
+
+SPEED_SUMMARY = text("""
+    SELECT COUNT(DISTINCT mmsi) AS vessels,
+           SUM(positions) AS positions,
+           SUM(speed_sum) / NULLIF(SUM(speeds), 0) AS mean_speed,
+           MAX(speed_max) AS max_speed
+    FROM vessel_hourly
+    WHERE hour BETWEEN :start AND :end
+""").bindparams(*_RANGE_BINDS)
+
+HOURLY_SPEED = text("""
+    SELECT hour AS timestamp,
+           SUM(speed_sum) / NULLIF(SUM(speeds), 0) AS speed,
+           MAX(speed_max) AS max_speed,
+           SUM(positions) AS positions,
+           COUNT(*) AS vessels
+    FROM vessel_hourly
+    WHERE hour BETWEEN :start AND :end
+    GROUP BY hour
+    ORDER BY hour
+""").bindparams(*_RANGE_BINDS)
+
+VESSEL_TYPE_COUNTS = text("""
+    SELECT vessel_type, vessels, positions, first_seen, last_seen
+    FROM vessel_type_counts
+    ORDER BY vessels DESC
+""")
+
+PORT_EVENTS = text("""
+    SELECT v.vessel_name, v.vessel_type, e.*
+    FROM port_events e
+    JOIN vessels v ON e.mmsi = v.mmsi
+    WHERE e.timestamp BETWEEN :start AND :end
+    ORDER BY e.timestamp
+""").bindparams(*_RANGE_BINDS)
+
+ANOMALIES = text("""
+    SELECT v.vessel_name, v.vessel_type, a.*
+    FROM position_anomalies a
+    LEFT JOIN vessels v ON a.mmsi = v.mmsi
+    WHERE a.timestamp BETWEEN :start AND :end
+    ORDER BY a.timestamp
+""").bindparams(*_RANGE_BINDS)
+
+ANOMALY_SUMMARY = text("""
+    SELECT a.mmsi, v.vessel_name, v.vessel_type, a.anomaly,
+           COUNT(*) AS flags, MAX(a.value) AS worst, MIN(a.timestamp) AS first_seen,
+           MAX(a.timestamp) AS last_seen
+    FROM position_anomalies a
+    LEFT JOIN vessels v ON a.mmsi = v.mmsi
+    WHERE a.timestamp BETWEEN :start AND :end
+    GROUP BY a.mmsi, v.vessel_name, v.vessel_type, a.anomaly
+    ORDER BY flags DESC
+""").bindparams(*_RANGE_BINDS)
+
+# Static fields only overwrite stored values when the feed actually carries them
+VESSEL_UPSERT = text("""
+    INSERT INTO vessels (mmsi, vessel_name, vessel_type, length, width, flag, destination)
+    VALUES (:mmsi, :vessel_name, :vessel_type, :length, :width, :flag, :destination)
+    ON CONFLICT (mmsi) DO UPDATE SET
+        vessel_name = COALESCE(excluded.vessel_name, vessels.vessel_name),
+        vessel_type = COALESCE(excluded.vessel_type, vessels.vessel_type),
+        length = COALESCE(excluded.length, vessels.length),
+        width = COALESCE(excluded.width, vessels.width),
+        flag = COALESCE(excluded.flag, vessels.flag),
+        destination = COALESCE(excluded.destination, vessels.destination)
+""")
+
+POSITION_INSERT = text("""
+    INSERT INTO ais_positions
+        (mmsi, timestamp, latitude, longitude, speed, course, navigation_status,
+         reported_speed, reported_course, cell)
+    VALUES (:mmsi, :timestamp, :latitude, :longitude, :speed, :course, :navigation_status,
+            :reported_speed, :reported_course, """ + CELL_SQL + """)
+    ON CONFLICT (mmsi, timestamp) DO NOTHING
+""")
+
+# Persistent stamp for result cache keys: writes from any process move it
+DATA_STAMP = text("""
+    SELECT (SELECT MAX(id) FROM ais_positions), (SELECT version FROM data_version WHERE id = 1)
+""")
+
+DATA_VERSION_BUMP = text("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+# Which database, and how many times ais_positions was emptied: copies kept by id
+# watermark (the columnar mirror) are only valid while both are unchanged
+DATA_SOURCE = text("SELECT instance, generation FROM data_version WHERE id = 1")
+
+DATA_GENERATION_BUMP = text("UPDATE data_version SET generation = generation + 1 WHERE id = 1")
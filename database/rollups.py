@@ -0,0 +1,191 @@
+
+from typing import Dict, Set
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection, Engine
+
+# Rollups read ais_positions incrementally by id (rows are only ever inserted)
+# and fold each new batch into small aggregate tables:
+#   vessel_hourly           positions and speed count/sum/min/max per vessel and hour
+#   speed_histogram_hourly  positions per vessel, hour and SPEED_BUCKET_KNOTS bucket
+#   rollup_vessel_type      positions and first/last hour per vessel, under the type it was counted as
+#   vessel_type_counts      vessels/positions per type, recomputed from rollup_vessel_type
+#                           for the types touched by new positions or a vessel type change
+#   port_events             arrivals/departures from navigation_status transitions
+SPEED_BUCKET_KNOTS = 2
+MAX_SPEED_BUCKET = 15  # everything from 30 kn up shares the last bucket
+STOPPED_STATUSES = ('Moored', 'At anchor')
+
+ROLLUP_TABLES = (
+    'vessel_hourly', 'speed_histogram_hourly', 'vessel_type_counts', 'port_events',
+    'rollup_state', 'rollup_vessel_status', 'rollup_vessel_type',
+)
+
+# Colons escaped so text() doesn't read ":00" as a bind parameter
+_HOUR = r"substr(p.timestamp, 1, 13) || '\:00\:00'"
+_STOPPED_LIST = "('" + "', '".join(STOPPED_STATUSES) + "')"
+_STOPPED = f"navigation_status IN {_STOPPED_LIST}"
+
+
+def refresh_rollups(engine: Engine) -> Dict[str, int]:
+    """Fold positions inserted since the last refresh into the rollup tables
+
+    Runs in one transaction and is cheap when nothing is new. Returns the
+    ais_positions id range processed.
+    """
+    with engine.begin() as conn:
+        last = conn.execute(text(
+            "SELECT last_id FROM rollup_state WHERE name = 'positions'"
+        )).scalar() or 0
+        upto = conn.execute(text("SELECT MAX(id) FROM ais_positions")).scalar() or 0
+        if upto <= last:
+            return {'from_id': last, 'to_id': last}
+
+        params = {'last': last, 'upto': upto}
+        _fold_hourly(conn, params)
+        _fold_port_events(conn, params)
+        _fold_type_counts(conn, params)
+        conn.execute(text("""
+            INSERT INTO rollup_state (name, last_id) VALUES ('positions', :upto)
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+        """), params)
+    return {'from_id': last, 'to_id': upto}
+
+
+def reset_rollups(conn: Connection) -> None:
+    """Empty every rollup table, e.g. after ais_positions was cleared"""
+    for table in ROLLUP_TABLES:
+        conn.execute(text(f"DELETE FROM {table}"))
+
+
+def _least(conn: Connection) -> str:
+    return 'MIN' if conn.dialect.name == 'sqlite' else 'LEAST'
+
+
+def _greatest(conn: Connection) -> str:
+    return 'MAX' if conn.dialect.name == 'sqlite' else 'GREATEST'
+
+
+def _fold_hourly(conn: Connection, params: Dict[str, int]) -> None:
+    # The WHERE clause also resolves SQLite's INSERT ... SELECT ... ON CONFLICT ambiguity
+    conn.execute(text(f"""
+        INSERT INTO vessel_hourly (mmsi, hour, positions, speeds, speed_sum, speed_min, speed_max)
+        SELECT p.mmsi, {_HOUR}, COUNT(*), COUNT(p.speed), SUM(p.speed), MIN(p.speed), MAX(p.speed)
+        FROM ais_positions p
+        WHERE p.id > :last AND p.id <= :upto
+        GROUP BY p.mmsi, {_HOUR}
+        ON CONFLICT (mmsi, hour) DO UPDATE SET
+            positions = vessel_hourly.positions + excluded.positions,
+            speeds = vessel_hourly.speeds + excluded.speeds,
+            speed_sum = COALESCE(vessel_hourly.speed_sum, 0) + COALESCE(excluded.speed_sum, 0),
+            speed_min = COALESCE({_least(conn)}(vessel_hourly.speed_min, excluded.speed_min),
+                                 vessel_hourly.speed_min, excluded.speed_min),
+            speed_max = COALESCE({_greatest(conn)}(vessel_hourly.speed_max, excluded.speed_max),
+                                 vessel_hourly.speed_max, excluded.speed_max)
+    """), params)
+    bucket = f"{_least(conn)}(CAST(p.speed / {SPEED_BUCKET_KNOTS} AS INTEGER), {MAX_SPEED_BUCKET})"
+    conn.execute(text(f"""
+        INSERT INTO speed_histogram_hourly (mmsi, hour, speed_bucket, positions)
+        SELECT p.mmsi, {_HOUR}, {bucket}, COUNT(*)
+        FROM ais_positions p
+        WHERE p.id > :last AND p.id <= :upto AND p.speed IS NOT NULL
+        GROUP BY p.mmsi, {_HOUR}, {bucket}
+        ON CONFLICT (mmsi, hour, speed_bucket) DO UPDATE SET
+            positions = speed_histogram_hourly.positions + excluded.positions
+    """), params)
+
+
+def _fold_port_events(conn: Connection, params: Dict[str, int]) -> None:
+    """Arrival = moving -> stopped, departure = stopped -> moving
+
+    Each vessel's sequence continues from its last status seen by a previous
+    refresh. Rows older than that (late arrivals) are skipped here, since
+    they can't be placed in a sequence that has already been folded.
+    """
+    conn.execute(text(f"""
+        INSERT INTO port_events (mmsi, timestamp, event, navigation_status, latitude, longitude)
+        SELECT mmsi, timestamp,
+               CASE WHEN {_STOPPED} THEN 'arrival' ELSE 'departure' END,
+               navigation_status, latitude, longitude
+        FROM (
+            SELECT p.mmsi, p.timestamp, p.navigation_status, p.latitude, p.longitude,
+                   COALESCE(
+                       LAG(p.navigation_status) OVER (PARTITION BY p.mmsi ORDER BY p.timestamp),
+                       s.navigation_status
+                   ) AS previous
+            FROM ais_positions p
+            LEFT JOIN rollup_vessel_status s ON s.mmsi = p.mmsi
+            WHERE p.id > :last AND p.id <= :upto
+              AND p.navigation_status IS NOT NULL
+              AND (s.timestamp IS NULL OR p.timestamp > s.timestamp)
+        ) t
+        WHERE previous IS NOT NULL
+          AND ({_STOPPED}) <> (previous IN {_STOPPED_LIST})
+        ON CONFLICT (mmsi, timestamp) DO NOTHING
+    """), params)
+    conn.execute(text("""
+        INSERT INTO rollup_vessel_status (mmsi, timestamp, navigation_status)
+        SELECT mmsi, timestamp, navigation_status
+        FROM (
+            SELECT p.mmsi, p.timestamp, p.navigation_status,
+                   ROW_NUMBER() OVER (PARTITION BY p.mmsi ORDER BY p.timestamp DESC) AS newest
+            FROM ais_positions p
+            WHERE p.id > :last AND p.id <= :upto AND p.navigation_status IS NOT NULL
+        ) t
+        WHERE newest = 1
+        ON CONFLICT (mmsi) DO UPDATE SET
+            timestamp = excluded.timestamp,
+            navigation_status = excluded.navigation_status
+        WHERE excluded.timestamp > rollup_vessel_status.timestamp
+    """), params)
+
+
+def _fold_type_counts(conn: Connection, params: Dict[str, int]) -> None:
+    """Fold the new range into rollup_vessel_type and recompute only the types it touched
+
+    Vessels whose type changed in ``vessels`` since they were counted move to
+    their new type, so both the old and the new type are recomputed. Costs
+    grow with the number of vessels, not with the length of history.
+    """
+    conn.execute(text(f"""
+        INSERT INTO rollup_vessel_type (mmsi, vessel_type, positions, first_seen, last_seen)
+        SELECT p.mmsi, COALESCE(MAX(v.vessel_type), 'Unknown'), COUNT(*), MIN({_HOUR}), MAX({_HOUR})
+        FROM ais_positions p
+        LEFT JOIN vessels v ON v.mmsi = p.mmsi
+        WHERE p.id > :last AND p.id <= :upto
+        GROUP BY p.mmsi
+        ON CONFLICT (mmsi) DO UPDATE SET
+            positions = rollup_vessel_type.positions + excluded.positions,
+            first_seen = {_least(conn)}(rollup_vessel_type.first_seen, excluded.first_seen),
+            last_seen = {_greatest(conn)}(rollup_vessel_type.last_seen, excluded.last_seen)
+    """), params)
+    touched: Set[str] = {row[0] for row in conn.execute(text("""
+        SELECT DISTINCT t.vessel_type
+        FROM rollup_vessel_type t
+        WHERE t.mmsi IN (SELECT p.mmsi FROM ais_positions p WHERE p.id > :last AND p.id <= :upto)
+    """), params)}
+
+    moved = conn.execute(text("""
+        SELECT t.mmsi, t.vessel_type AS old_type, COALESCE(v.vessel_type, 'Unknown') AS new_type
+        FROM rollup_vessel_type t
+        LEFT JOIN vessels v ON v.mmsi = t.mmsi
+        WHERE t.vessel_type <> COALESCE(v.vessel_type, 'Unknown')
+    """)).mappings().all()
+    if moved:
+        conn.execute(text("UPDATE rollup_vessel_type SET vessel_type = :new_type WHERE mmsi = :mmsi"),
+                     [dict(row) for row in moved])
+        touched.update(row['old_type'] for row in moved)
+        touched.update(row['new_type'] for row in moved)
+    if not touched:
+        return
+
+    types = {'types': sorted(touched)}
+    conn.execute(text("DELETE FROM vessel_type_counts WHERE vessel_type IN :types")
+                 .bindparams(bindparam('types', expanding=True)), types)
+    conn.execute(text("""
+        INSERT INTO vessel_type_counts (vessel_type, vessels, positions, first_seen, last_seen)
+        SELECT vessel_type, COUNT(*), SUM(positions), MIN(first_seen), MAX(last_seen)
+        FROM rollup_vessel_type
+        WHERE vessel_type IN :types
+        GROUP BY vessel_type
+    """).bindparams(bindparam('types', expanding=True)), types)
@@ -0,0 +1,193 @@
+
+import hashlib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+# Bookkeeping tables and columns the LLM should never query directly
+HIDDEN_TABLE_PREFIXES = ('sqlite_', 'schema_migrations', 'data_version', 'ais_positions_rtree', 'rollup_')
+HIDDEN_COLUMNS = {'cell'}
+
+# Text columns with at most this many distinct values list them in the summary
+CATEGORICAL_MAX_DISTINCT = 12
+NUMERIC_TYPES = ('INT', 'REAL', 'FLOA', 'DOUB', 'NUM', 'DEC')
+TEMPORAL_TYPES = ('DATE', 'TIME')
+
+
+class SchemaIntrospector:
+    """Live, cached description of the database schema for LLM prompts
+
+    The structural signature (tables, columns, types) is cheap to check and
+    versions the schema. Column statistics scan every table, so they are
+    computed when the signature changes and otherwise refreshed at most every
+    ``stats_ttl`` seconds, in the background while the previous ones are
+    served. They describe the data for prompts and plan estimates and need
+    not be exact.
+    """
+
+    def __init__(self, engine: Engine, stats_ttl: float = 600):
+        self.engine = engine
+        self.stats_ttl = stats_ttl
+        self._lock = threading.Lock()
+        self._structure: Optional[Tuple[Any, Dict[str, List[Dict[str, Any]]], str]] = None
+        self._summaries: Dict[Tuple[str, int, int], str] = {}
+        # (signature, computed at, generation, stats per table)
+        self._stats: Optional[Tuple[str, float, int, Dict[str, Dict[str, Any]]]] = None
+        self._refreshing = False
+
+    def signature(self) -> str:
+        """Hash of the visible tables, columns and types"""
+        return self._load_structure()[2]
+
+    def tables(self) -> Dict[str, List[str]]:
+        """Visible tables and their column names"""
+        return {name: [c['name'] for c in columns] for name, columns in self._load_structure()[1].items()}
+
+    def row_counts(self) -> Dict[str, int]:
+        """Rows per visible table, from the cached column stats"""
+        return {name: stats['rows'] for name, stats in self._column_stats()[3].items()}
+
+    def describe(self, max_tokens: int = 600) -> str:
+        """Compact schema summary with column stats, within roughly ``max_tokens``"""
+        _, tables, _ = self._load_structure()
+        signature, _, generation, stats = self._column_stats()
+        key = (signature, generation, max_tokens)
+        with self._lock:
+            summary = self._summaries.get(key)
+        if summary is not None:
+            return summary
+
+        summary = self._render(tables, stats, max_tokens * 4)
+        with self._lock:
+            # Older stats can never be asked for again
+            self._summaries = {k: v for k, v in self._summaries.items() if k[:2] == key[:2]}
+            self._summaries[key] = summary
+        return summary
+
+    def _column_stats(self):
+        _, tables, signature = self._load_structure()
+        with self._lock:
+            current = self._stats
+            if current is not None and current[0] == signature:
+                if time.monotonic() - current[1] > self.stats_ttl and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_stats, args=(signature, tables),
+                                     name='schema-stats', daemon=True).start()
+                return current
+        return self._compute_stats(signature, tables)
+
+    def _compute_stats(self, signature: str, tables):
+        stats = {name: self._table_stats(name, columns) for name, columns in tables.items()}
+        with self._lock:
+            generation = self._stats[2] + 1 if self._stats is not None else 0
+            self._stats = (signature, time.monotonic(), generation, stats)
+            return self._stats
+
+    def _refresh_stats(self, signature: str, tables) -> None:
+        try:
+            self._compute_stats(signature, tables)
+        except Exception as e:
+            print(f"Schema stats refresh failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _load_structure(self):
+        stamp = self._schema_stamp()
+        with self._lock:
+            if self._structure is not None and stamp is not None and self._structure[0] == stamp:
+                return self._structure
+
+        inspector = inspect(self.engine)
+        tables = {}
+        for name in sorted(inspector.get_table_names()):
+            if name.startswith(HIDDEN_TABLE_PREFIXES):
+                continue
+            tables[name] = [
+                {'name': column['name'], 'type': str(column['type']).upper()}
+                for column in inspector.get_columns(name)
+                if column['name'] not in HIDDEN_COLUMNS
+            ]
+        layout = ';'.join(
+            f"{table}(" + ','.join(f"{c['name']}:{c['type']}" for c in columns) + ")"
+            for table, columns in tables.items()
+        )
+        structure = (stamp, tables, hashlib.sha1(layout.encode()).hexdigest())
+        with self._lock:
+            self._structure = structure
+        return structure
+
+    def _schema_stamp(self) -> Optional[int]:
+        """SQLite bumps PRAGMA schema_version on every DDL change; None elsewhere"""
+        if self.engine.dialect.name != 'sqlite':
+            return None
+        with self.engine.connect() as conn:
+            return conn.execute(text("PRAGMA schema_version")).scalar()
+
+    def _table_stats(self, table: str, columns: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Row count, min/max of numeric and temporal columns, values of categorical ones"""
+        ranged = [c['name'] for c in columns if _is_ranged(c['type']) and c['name'] != 'id']
+        textual = [c['name'] for c in columns if not _is_ranged(c['type'])]
+
+        selects = ['COUNT(*)']
+        for name in ranged:
+            selects += [f'MIN("{name}")', f'MAX("{name}")']
+        for name in textual:
+            selects.append(f'COUNT(DISTINCT "{name}")')
+
+        stats: Dict[str, Any] = {'columns': {}}
+        with self.engine.connect() as conn:
+            row = conn.execute(text(f'SELECT {", ".join(selects)} FROM "{table}"')).first()
+            stats['rows'] = row[0]
+            values = iter(row[1:])
+            for name in ranged:
+                stats['columns'][name] = {'min': next(values), 'max': next(values)}
+            for name in textual:
+                distinct = next(values)
+                column = {'distinct': distinct}
+                if distinct and distinct <= CATEGORICAL_MAX_DISTINCT:
+                    column['values'] = [
+                        r[0] for r in conn.execute(text(
+                            f'SELECT "{name}" FROM "{table}" WHERE "{name}" IS NOT NULL '
+                            f'GROUP BY "{name}" ORDER BY COUNT(*) DESC'
+                        ))
+                    ]
+                stats['columns'][name] = column
+        return stats
+
+    def _render(self, tables, stats, max_chars: int) -> str:
+        # Drop detail until the summary fits: values lists, then ranges, then all stats
+        for detail in (2, 1, 0):
+            lines = ["Tables:"]
+            for table, columns in tables.items():
+                table_stats = stats[table]
+                lines.append(f"- {table} ({table_stats['rows']} rows)")
+                for column in columns:
+                    lines.append(f"    {column['name']} {column['type'] or 'ANY'}"
+                                 + _column_note(table_stats['columns'].get(column['name']), detail))
+            summary = '\n'.join(lines)
+            if len(summary) <= max_chars:
+                return summary
+        return summary[:max_chars].rsplit('\n', 1)[0]
+
+
+def _is_ranged(column_type: str) -> bool:
+    return column_type.startswith(NUMERIC_TYPES) or any(t in column_type for t in TEMPORAL_TYPES)
+
+
+def _column_note(column_stats: Optional[Dict[str, Any]], detail: int) -> str:
+    if not column_stats or detail == 0:
+        return ''
+    if 'min' in column_stats:
+        low, high = column_stats['min'], column_stats['max']
+        if low is None:
+            return ''
+        if isinstance(low, float) or isinstance(high, float):
+            return f" [{low:.4g}..{high:.4g}]"
+        return f" [{low}..{high}]"
+    if detail >= 2 and 'values' in column_stats:
+        return f" one of {', '.join(repr(v) for v in column_stats['values'])}"
+    return f" ({column_stats['distinct']} distinct)"
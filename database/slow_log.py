@@ -0,0 +1,140 @@
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.metrics import metrics
+
+# Statement timings from SQLAlchemy cursor events. Every statement's execute
+# time goes to the db_statement_seconds summary; statements over the
+# threshold are kept, newest first, with their EXPLAIN output.
+#
+# The cursor events only see ``cursor.execute``. On SQLite a plain scan
+# returns its first row straight away and does the rest of its work while
+# rows are fetched, so reads wrapped in ``measure()`` are judged by the
+# block's wall time (execute + fetch + DataFrame) instead. Their plans are
+# taken when the statement first runs, as the connection is back in the pool
+# by the time the block ends.
+_EXPLAINABLE = ('select', 'with')
+_MAX_SQL_CHARS = 2000
+
+
+class SlowQueryLog:
+    """Slow statements of one engine, with their query plans"""
+
+    def __init__(self, threshold_ms: float = 500, max_entries: int = 50, explain: bool = True,
+                 plan_cache_size: int = 256):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.plan_cache_size = plan_cache_size
+        self._entries: "deque[Dict[str, Any]]" = deque(maxlen=max_entries)
+        self._plans: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dialect = 'sqlite'
+
+    def attach(self, engine: Engine) -> 'SlowQueryLog':
+        self._dialect = engine.dialect.name
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        return self
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Logged statements, newest first"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @contextmanager
+    def measure(self):
+        """Judge the statements run in this block by the block's wall time"""
+        scopes = self._scopes()
+        scope: List[Dict[str, Any]] = []
+        scopes.append(scope)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            scopes.pop()
+            if elapsed_ms >= self.threshold_ms:
+                for statement in scope:
+                    self._log(statement, elapsed_ms)
+
+    def _scopes(self) -> List[List[Dict[str, Any]]]:
+        scopes = getattr(self._local, 'scopes', None)
+        if scopes is None:
+            scopes = self._local.scopes = []
+        return scopes
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_log_start', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_log_start')
+        if not starts:
+            return
+        execute_ms = (time.perf_counter() - starts.pop()) * 1000
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+        metrics.observe('db_statement_seconds', execute_ms / 1000, operation=operation)
+
+        explainable = self.explain and not executemany and operation in _EXPLAINABLE
+        record = {'operation': operation, 'sql': statement, 'parameters': parameters,
+                  'execute_ms': execute_ms}
+        scopes = self._scopes()
+        if scopes:
+            if explainable:
+                record['plan'] = self._plan(cursor, statement, parameters)
+            scopes[-1].append(record)
+        elif execute_ms >= self.threshold_ms:
+            if explainable:
+                record['plan'] = self._plan(cursor, statement, parameters)
+            self._log(record, execute_ms)
+
+    def _plan(self, cursor, statement: str, parameters) -> str:
+        """EXPLAIN output, once per statement text, run on the statement's own DBAPI connection"""
+        with self._lock:
+            plan = self._plans.get(statement)
+            if plan is not None:
+                self._plans.move_to_end(statement)
+                return plan
+        prefix = 'EXPLAIN QUERY PLAN ' if self._dialect == 'sqlite' else 'EXPLAIN '
+        explain = cursor.connection.cursor()
+        try:
+            explain.execute(prefix + statement, parameters)
+            rows = explain.fetchall()
+            # SQLite rows are (id, parent, notused, detail); only the detail reads as a plan
+            plan = "\n".join(str(row[-1]) if self._dialect == 'sqlite' else " | ".join(str(v) for v in row)
+                              for row in rows)
+        except Exception as e:
+            return f"EXPLAIN failed: {str(e)}"
+        finally:
+            explain.close()
+        with self._lock:
+            self._plans[statement] = plan
+            while len(self._plans) > self.plan_cache_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _log(self, record: Dict[str, Any], duration_ms: float) -> None:
+        metrics.inc('db_slow_queries_total', operation=record['operation'])
+        entry = {
+            'at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_ms': round(duration_ms, 1),
+            'execute_ms': round(record['execute_ms'], 1),
+            'operation': record['operation'],
+            'sql': record['sql'][:_MAX_SQL_CHARS],
+            'parameters': str(record['parameters'])[:200],
+            'plan': record.get('plan'),
+        }
+        with self._lock:
+            self._entries.append(entry)
@@ -0,0 +1,285 @@
+
+import math
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from database.schema import SchemaIntrospector
+
+# Strings are kept verbatim, comments are dropped
+_LITERALS_AND_COMMENTS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_FENCE = re.compile(r"```(?:sql)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_STATEMENT_START = re.compile(r"\bselect\b|\bwith\s+(?:recursive\s+)?\w+\s+as\s*\(", re.IGNORECASE)
+_FORBIDDEN = re.compile(
+    r"\b(?:insert|update|delete|drop|alter|create|attach|detach|pragma|vacuum|reindex|analyze|"
+    r"begin|commit|rollback|savepoint|release|grant|revoke|truncate|merge|copy|call|exec|execute)\b"
+    r"|\breplace\b(?!\s*\()|\bload_extension\s*\(",
+    re.IGNORECASE,
+)
+_INNER_PARENS = re.compile(r"\([^()]*\)")
+_LIMIT = re.compile(r"\blimit\s+(\d+)", re.IGNORECASE)
+_AGGREGATE = re.compile(r"\b(?:count|sum|avg|min|max|total|group_concat)\s*\(", re.IGNORECASE)
+_GROUP_BY = re.compile(r"\bgroup\s+by\b", re.IGNORECASE)
+_TABLE_REF = re.compile(r"\b(?:from|join)\s+(\w+)(?:\s+(?:as\s+)?(\w+))?", re.IGNORECASE)
+_PLAN_TABLE = re.compile(r"^(SCAN|SEARCH) (\w+)(?: AS (\w+))?(.*)$")
+_PG_ROWS = re.compile(r"rows=(\d+)")
+# Plan steps that sort or aggregate the whole result before the first row
+_SQLITE_SORT = re.compile(r"USE TEMP B-TREE")
+_PG_SORT = re.compile(r"\b(?:Sort|HashAggregate|GroupAggregate|Unique)\b")
+
+# SQL words that can follow a table name and are therefore not an alias
+_CLAUSE_WORDS = {
+    'where', 'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'on', 'using',
+    'group', 'order', 'limit', 'having', 'union', 'intersect', 'except', 'window', 'offset',
+}
+
+# Rough selectivities for SQLite plan steps, which carry no row estimates
+EQ_SELECTIVITY = 0.01
+RANGE_SELECTIVITY = 0.25
+BOUNDED_RANGE_SELECTIVITY = 0.1
+# Approximate pandas footprint of one cell (numeric, or a short object string)
+BYTES_PER_VALUE = 24
+# Results estimated over budget are counted before being cut, up to this many
+# budgets, which also sets the sampling rate
+COUNT_CAP_BUDGETS = 10
+
+SAMPLE_TABLE = 'ais_positions'
+
+
+class UnsafeQueryError(ValueError):
+    """Generated SQL is not a single read-only statement"""
+
+
+class GuardedQuery:
+    """SQL that passed validation, possibly rewritten to fit the result budget"""
+
+    def __init__(self, sql: str, original: str, estimated_rows: Optional[int] = None,
+                 action: str = 'none', note: Optional[str] = None, row_cap: Optional[int] = None):
+        self.sql = sql
+        self.original = original
+        self.estimated_rows = estimated_rows
+        self.action = action
+        self.note = note
+        self.row_cap = row_cap
+
+    def to_dict(self, rows: Optional[int] = None) -> Dict[str, Any]:
+        """Report of what was done; pass the result size to drop a LIMIT that never bit"""
+        action, note = self.action, self.note
+        if action == 'limit' and rows is not None and rows < self.row_cap:
+            action, note = 'none', None
+        return {
+            'action': action,
+            'estimated_rows': self.estimated_rows,
+            'note': note,
+        }
+
+
+def clean_sql(query: str) -> str:
+    """Pull the statement out of an LLM reply: code fences, prose, comments, trailing ;"""
+    fenced = _FENCE.search(query)
+    if fenced:
+        query = fenced.group(1)
+    start = _STATEMENT_START.search(query)
+    if start is None:
+        raise UnsafeQueryError("No SELECT statement found in the generated SQL")
+    query = _LITERALS_AND_COMMENTS.sub(lambda m: m.group(1) or ' ', query[start.start():])
+    end = _mask_literals(query).find(';')
+    if end >= 0:
+        trailing = query[end + 1:]
+        # Prose after the statement is dropped, a second statement is not
+        if re.match(r"\s*(?:select|with)\b", trailing, re.IGNORECASE) or _FORBIDDEN.search(trailing):
+            raise UnsafeQueryError("Only a single SQL statement is allowed")
+        query = query[:end]
+    return query.strip()
+
+
+def validate_sql(query: str) -> str:
+    """Clean ``query`` and reject anything but a single read-only SELECT/WITH statement"""
+    sql = clean_sql(query)
+    masked = _mask_literals(sql)
+    if not re.match(r"\s*(?:select|with)\b", masked, re.IGNORECASE):
+        raise UnsafeQueryError("Only SELECT queries are allowed")
+    forbidden = _FORBIDDEN.search(masked)
+    if forbidden:
+        raise UnsafeQueryError(f"Statement not allowed in a read-only query: {forbidden.group(0).strip()}")
+    return sql
+
+
+class QueryGuard:
+    """Validates generated SQL and keeps its result within a row/memory budget
+
+    On SQLite the result size is estimated from EXPLAIN QUERY PLAN and the
+    cached table row counts; on PostgreSQL from the planner's own estimate.
+    Those estimates only decide whether to look closer: a result estimated
+    over budget is counted (up to COUNT_CAP_BUDGETS budgets) and left alone
+    if it actually fits. Oversized plain selects over ais_positions are sampled evenly by id
+    (``oversize='sample'``) so maps and tracks still cover the whole range;
+    everything else, and anything whose size can't be estimated, gets an
+    outer LIMIT. Plans that sort or aggregate the whole result (a temp
+    B-tree) are not counted, as that would do the sort twice; with only an
+    estimate to go on they get the outer LIMIT, which costs nothing when
+    the result fits after all.
+    """
+
+    def __init__(self, engine: Engine, introspector: SchemaIntrospector,
+                 max_rows: int = 100_000, max_mb: float = 256, oversize: str = 'sample'):
+        if oversize not in ('sample', 'limit'):
+            raise ValueError(f"oversize must be 'sample' or 'limit', not {oversize!r}")
+        self.engine = engine
+        self.introspector = introspector
+        self.max_rows = max_rows
+        self.max_bytes = max_mb * 1024 * 1024
+        self.oversize = oversize
+
+    def prepare(self, query: str, params: Optional[Dict[str, Any]] = None) -> GuardedQuery:
+        """Validate ``query`` and rewrite it if its estimated result is over budget
+
+        ``params`` are the bound values of a parameterized ``query``; the
+        rewritten SQL keeps the same placeholders.
+        """
+        sql = validate_sql(query)
+        top_level = _top_level(_mask_literals(sql))
+        limit = _LIMIT.search(top_level)
+
+        with self.engine.connect() as conn:
+            columns = len(conn.execute(text(f"SELECT * FROM ({sql}) AS guarded LIMIT 0"), params or {}).keys())
+            estimate, sorts = self._estimate_rows(conn, sql, params)
+
+            budget = max(1, min(self.max_rows, int(self.max_bytes // max(1, columns * BYTES_PER_VALUE))))
+            if limit is not None:
+                limit_rows = int(limit.group(1))
+                estimate = limit_rows if estimate is None else min(estimate, limit_rows)
+            if estimate is not None and _AGGREGATE.search(top_level) and not _GROUP_BY.search(top_level):
+                estimate = 1
+
+            if estimate is not None and estimate <= budget:
+                return GuardedQuery(sql, query, estimate)
+            if estimate is None and limit is not None:
+                return GuardedQuery(sql, query, estimate)
+
+            # Plan estimates use fixed selectivities; count before cutting anything
+            cap = budget * COUNT_CAP_BUDGETS
+            counted = None if sorts else self._count_rows(conn, sql, cap, params)
+        if counted is not None:
+            if counted <= budget:
+                return GuardedQuery(sql, query, counted)
+            # Past the cap the count is a floor; a larger plan estimate is the better guess
+            estimate = counted if counted <= cap or estimate is None else max(estimate, counted)
+
+        # A sorting plan's estimate was never checked; sampling on it could thin a result that fits
+        if (self.oversize == 'sample' and estimate is not None and not sorts
+                and not _AGGREGATE.search(top_level) and not _GROUP_BY.search(top_level)):
+            every = math.ceil(estimate / budget)
+            sampled = self._sample(sql, every)
+            if sampled is not None:
+                return GuardedQuery(
+                    _wrap_limit(sampled, budget), query, estimate, 'sample',
+                    f"Result of ~{estimate} rows sampled to every {every}th position (at most {budget} rows)",
+                    budget,
+                )
+
+        size = f"~{estimate}" if estimate is not None else "an unknown number of"
+        return GuardedQuery(
+            _wrap_limit(sql, budget), query, estimate, 'limit',
+            f"Result of {size} rows truncated to the first {budget}",
+            budget,
+        )
+
+    @staticmethod
+    def _count_rows(conn, sql: str, cap: int, params: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """Result rows of ``sql``, counting no further than ``cap + 1``; None if it can't be counted"""
+        try:
+            return conn.execute(text(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM ({sql}) AS guarded LIMIT {cap + 1}) AS capped"
+            ), params or {}).scalar()
+        except Exception:
+            return None
+
+    def _estimate_rows(self, conn, sql: str,
+                       params: Optional[Dict[str, Any]] = None) -> Tuple[Optional[int], bool]:
+        """(estimated result rows or None, whether the plan sorts or aggregates the whole result)"""
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            plan = [row[0] for row in conn.execute(text(f"EXPLAIN {sql}"), params or {})]
+            found = _PG_ROWS.search(plan[0]) if plan else None
+            return (int(found.group(1)) if found else None), any(_PG_SORT.search(line) for line in plan)
+        if dialect != 'sqlite':
+            return None, False
+
+        counts = self.introspector.row_counts()
+        aliases = _aliases(_mask_literals(sql))
+        estimate = 1.0
+        sorts = False
+        for _, _, _, detail in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params or {}):
+            sorts = sorts or bool(_SQLITE_SORT.search(detail))
+            step = _PLAN_TABLE.match(detail)
+            if step is None:
+                continue
+            kind, name, alias, rest = step.groups()
+            rows = counts.get(aliases.get(alias or name, name))
+            if rows is None:
+                # Subquery or CTE result; its own steps are already counted
+                continue
+            estimate *= _step_rows(kind, rest, rows)
+        return int(min(estimate, 2 ** 62)), sorts
+
+    def _sample(self, sql: str, every: int) -> Optional[str]:
+        """Rewrite the single ais_positions reference to read every ``every``th row by id"""
+        if 'id' not in self.introspector.tables().get(SAMPLE_TABLE, []):
+            return None
+        masked = _mask_literals(sql)
+        refs = [m for m in _TABLE_REF.finditer(masked) if m.group(1).lower() == SAMPLE_TABLE]
+        mentions = re.findall(rf"\b{SAMPLE_TABLE}\b", masked, re.IGNORECASE)
+        if len(refs) != 1 or len(mentions) != 1:
+            return None
+        ref = refs[0]
+        alias = ref.group(2) if ref.group(2) and ref.group(2).lower() not in _CLAUSE_WORDS else None
+        end = ref.end(2) if alias else ref.end(1)
+        subquery = f"(SELECT * FROM {SAMPLE_TABLE} WHERE id % {every} = 0) AS {alias or SAMPLE_TABLE}"
+        return f"{sql[:ref.start(1)]}{subquery}{sql[end:]}"
+
+
+def _mask_literals(sql: str) -> str:
+    """Blank out string literals so keywords inside them are ignored; offsets are kept"""
+    return re.sub(r"'(?:[^']|'')*'", lambda m: "'" + ' ' * (len(m.group(0)) - 2) + "'", sql)
+
+
+def _top_level(sql: str) -> str:
+    """Drop everything inside parentheses, leaving the outermost statement"""
+    previous = None
+    while previous != sql:
+        previous, sql = sql, _INNER_PARENS.sub('()', sql)
+    return sql
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    aliases = {}
+    for match in _TABLE_REF.finditer(sql):
+        table, alias = match.group(1), match.group(2)
+        if alias and alias.lower() not in _CLAUSE_WORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def _step_rows(kind: str, detail: str, rows: int) -> float:
+    """Rows produced by one SQLite plan step, per row of the enclosing loop"""
+    if kind == 'SCAN':
+        return rows
+    if 'PRIMARY KEY' in detail and '=?' in detail and '>' not in detail and '<' not in detail:
+        return 1
+    conditions = re.search(r"\((.*)\)", detail)
+    conditions = conditions.group(1) if conditions else ''
+    selectivity = 1.0
+    if '=?' in conditions.replace('>=?', '').replace('<=?', ''):
+        selectivity *= EQ_SELECTIVITY
+    if '>' in conditions and '<' in conditions:
+        selectivity *= BOUNDED_RANGE_SELECTIVITY
+    elif '>' in conditions or '<' in conditions:
+        selectivity *= RANGE_SELECTIVITY
+    return max(1.0, rows * selectivity)
+
+
+def _wrap_limit(sql: str, rows: int) -> str:
+    return f"SELECT * FROM ({sql}) AS guarded LIMIT {rows}"
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from database.db_manager import DatabaseManager
+
+
+def _fix(timestamp, **fields):
+    return {'mmsi': 211000001, 'timestamp': timestamp, 'latitude': 54.0, 'longitude': 8.0,
+            'speed': 10.0, 'course': 90.0, **fields}
+
+
+def test_late_fix_does_not_block_refresh(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    db.ingest_stream([_fix('2024-01-01 12:00:00')])
+    # Older than the vessel's last fix: only range checks apply, the watermark still moves
+    db.ingest_stream([_fix('2024-01-01 11:00:00')])
+    db.ingest_stream([_fix('2024-01-01 16:00:00')])
+
+    assert db.execute_query("SELECT last_id FROM rollup_state WHERE name = 'anomalies'")['last_id'][0] == 3
+    flags = db.get_anomalies()
+    assert list(flags['anomaly']) == ['gap']
+    assert flags['previous_timestamp'][0] == '2024-01-01 12:00:00'
+    # A new manager on the same database starts cleanly
+    DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+
+
+def test_out_of_range_values_are_flagged_after_ingestion(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    db.ingest_stream([
+        _fix('2024-01-01 12:00:00', speed=150.0, course=400.0),
+        _fix('2024-01-01 12:05:00', speed=60.0, course=-5.0),
+        # AIS "not available" values are missing data, not anomalies
+        _fix('2024-01-01 12:10:00', speed=102.3, course=360.0),
+    ])
+
+    stored = db.execute_query("SELECT speed, course FROM ais_positions ORDER BY timestamp")
+    assert stored['speed'].isna().tolist() == [True, False, True]
+    assert stored['course'].isna().all()
+    flags = db.get_anomalies()
+    found = sorted(zip(flags['anomaly'], flags['value']))
+    assert found == [('course_range', -5.0), ('course_range', 400.0),
+                     ('speed_range', 60.0), ('speed_range', 150.0)]
@@ -0,0 +1,57 @@
+import sqlite3
+import time
+
+from database.cache import HAS_PYARROW, QueryCache
+from database.db_manager import DatabaseManager
+
+COUNT = "SELECT COUNT(*) AS n FROM ais_positions"
+
+
+def _fix(timestamp):
+    return {'mmsi': 211000001, 'timestamp': timestamp, 'latitude': 54.0, 'longitude': 8.0,
+            'speed': 10.0, 'course': 90.0}
+
+
+def test_write_from_another_process_invalidates(tmp_path):
+    path = tmp_path / 'ais.db'
+    db = DatabaseManager(f"sqlite:///{path}", cache_config={'enabled': True, 'stamp_interval': 0.05})
+    db.ingest_stream([_fix('2024-01-01 12:00:00')])
+    assert db.execute_query(COUNT)['n'][0] == 1
+
+    # e.g. an ingest worker: its in-process invalidation never reaches this cache
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO ais_positions (mmsi, timestamp, latitude, longitude) "
+                 "VALUES (211000001, '2024-01-01 13:00:00', 54.1, 8.1)")
+    conn.commit()
+    time.sleep(0.1)
+    assert db.execute_query(COUNT)['n'][0] == 2
+
+    conn.execute("UPDATE data_version SET version = version + 1")
+    conn.commit()
+    time.sleep(0.1)
+    key = db.cache.make_key(COUNT)
+    assert db.cache.get(key) is None
+    conn.close()
+
+
+def test_spills_from_an_earlier_process_are_dropped(tmp_path):
+    if not HAS_PYARROW:
+        return
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    (spill_dir / 'stale.parquet').write_bytes(b'')
+    QueryCache(spill_dir=str(spill_dir))
+    assert list(spill_dir.iterdir()) == []
+
+
+def test_hits_do_not_read_the_stamp_every_time():
+    reads = []
+    cache = QueryCache(stamp=lambda: reads.append(1) or len(reads), stamp_interval=60)
+    key = cache.make_key(COUNT)
+    for _ in range(5):
+        assert cache.make_key(COUNT) == key
+    assert len(reads) == 1
+    # Local writes re-read it straight away
+    cache.invalidate()
+    cache.make_key(COUNT)
+    assert len(reads) == 2
@@ -0,0 +1,30 @@
+import pytest
+
+from database.columnar import HAS_DUCKDB
+from database.db_manager import DatabaseManager
+from database.engine import dispose_engines
+
+pytestmark = pytest.mark.skipif(not HAS_DUCKDB, reason="needs duckdb and pyarrow")
+
+
+def _positions(db):
+    return int(db.get_density_grid(cell_degrees=5)['count'].sum())
+
+
+def test_mirror_is_rebuilt_when_the_database_changes_underneath(tmp_path):
+    url = f"sqlite:///{tmp_path / 'ais.db'}"
+    reader = DatabaseManager(url, columnar_config={'enabled': True, 'path': 'columnar'})
+    assert reader.columnar.path == str(tmp_path / 'columnar')
+    reader.load_sample_data(n_vessels=5, days=1, interval_minutes=60, seed=0)
+    assert _positions(reader) == 5 * 24
+
+    # Another process (its own engine) reloads fewer positions
+    DatabaseManager(url, pool_size=2).load_sample_data(n_vessels=2, days=1, interval_minutes=60, seed=1)
+    assert _positions(reader) == 2 * 24
+
+    # The file is replaced by a new database with fewer rows than the watermark
+    dispose_engines()
+    for path in tmp_path.glob('ais.db*'):
+        path.unlink()
+    DatabaseManager(url, pool_size=3).load_sample_data(n_vessels=1, days=1, interval_minutes=60, seed=2)
+    assert _positions(reader) == 24
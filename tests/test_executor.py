@@ -0,0 +1,21 @@
+from concurrent.futures import Future
+
+import pytest
+
+from chains.executor import Stage, StageExecutor, StageTimeout
+from utils.cancellation import wait_result
+
+
+def test_timed_out_stage_gives_its_worker_back():
+    executor = StageExecutor(max_workers=1)
+    never: Future = Future()
+
+    hung = executor.run([Stage('hung', lambda: wait_result(never), timeout=0.1)])
+    with pytest.raises(StageTimeout):
+        hung.result('hung')
+
+    # The only worker is free again and the abandoned request was withdrawn
+    after = executor.run([Stage('next', lambda: 'ok')])
+    assert after.result('next', timeout=1) == 'ok'
+    assert never.cancelled()
+    assert [record['status'] for record in hung.trace] == ['timeout']
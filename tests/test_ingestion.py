@@ -0,0 +1,24 @@
+import json
+
+from database.db_manager import DatabaseManager
+
+
+def _line(timestamp):
+    return json.dumps({'mmsi': 211000001, 'timestamp': timestamp, 'lat': 54.0, 'lon': 8.0, 'sog': 10.0})
+
+
+def test_bad_ndjson_lines_are_rejected_not_fatal(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    feed = [
+        _line('2024-01-01 12:00:00'),
+        '{"mmsi": 211000001, "timestamp": "2024-01-01 12:05',  # truncated
+        '[]',
+        '"x"',
+        _line('2024-01-01 12:10:00'),
+    ]
+    stats = db.ingest_stream(feed, fmt='ndjson', batch_size=2)
+
+    assert stats['read'] == 5
+    assert stats['rejected'] == 3
+    assert stats['positions_written'] == 2
+    assert db.execute_query("SELECT COUNT(*) AS n FROM ais_positions")['n'][0] == 2
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+
+from chains.intent_router import IntentRouter
+from database.db_manager import DatabaseManager
+
+
+def test_routed_positions_respect_the_result_budget(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}", max_result_rows=10)
+    now = datetime.now(timezone.utc)
+    db.ingest_stream([
+        {'mmsi': 211000000 + vessel, 'latitude': 54.0 + step / 100, 'longitude': 8.0, 'speed': 10.0,
+         'timestamp': (now - timedelta(minutes=10 * step)).strftime('%Y-%m-%d %H:%M:%S')}
+        for vessel in range(3) for step in range(20)
+    ])
+
+    response = IntentRouter().route("Show vessel positions in the last 24 hours", db)
+    assert response['route'] == 'recent_positions'
+    assert len(response['data']) <= 10
+    assert response['data'].attrs['sql_guard']['action'] == 'sample'
+    assert 'sampled' in response['text']
+
+
+def test_how_far_only_routes_questions_about_distance_sailed(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    db.load_sample_data(n_vessels=3, days=1, seed=1)
+    router = IntentRouter()
+
+    response = router.route("How far did the fleet sail in the last 24 hours?", db)
+    assert response['route'] == 'distance_sailed'
+    for question in ("How far apart were 211000000 and 211000001 yesterday?",
+                     "How far from port is 211000000?"):
+        response = router.route(question, db)
+        assert response is None or response['route'] != 'distance_sailed'
+
+
+def test_vessel_types_come_from_the_rollup(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    db.load_sample_data(n_vessels=6, days=1, seed=1)
+
+    response = IntentRouter().route("Show the vessel type breakdown", db)
+    assert response['route'] == 'vessel_types'
+    assert response['data'].equals(db.get_vessel_type_counts())
@@ -0,0 +1,18 @@
+from database.db_manager import DatabaseManager
+from database.migrations import cells_for_bbox, grid_cell
+
+
+def _fix(mmsi, longitude):
+    return {'mmsi': mmsi, 'timestamp': '2030-01-01 00:00:00', 'latitude': 10.5, 'longitude': longitude}
+
+
+def test_bbox_across_the_antimeridian(tmp_path):
+    cells = cells_for_bbox(10.0, 179.2, 11.0, -179.2)
+    assert int(grid_cell(10.5, 179.5)) in cells
+    assert int(grid_cell(10.5, -179.5)) in cells
+    assert int(grid_cell(10.5, 0.0)) not in cells
+
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    db.ingest_stream([_fix(211000001, 179.5), _fix(211000002, -179.5), _fix(211000003, 0.0)])
+    found = db.get_positions_in_bbox(10.0, 179.2, 11.0, -179.2)
+    assert found['mmsi'].tolist() == [211000001, 211000002]
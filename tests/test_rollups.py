@@ -0,0 +1,38 @@
+from database.db_manager import DatabaseManager
+
+# What vessel_type_counts must always equal, computed from scratch
+FULL_RECOMPUTE = """
+    SELECT COALESCE(v.vessel_type, 'Unknown') AS vessel_type, COUNT(DISTINCT h.mmsi) AS vessels,
+           SUM(h.positions) AS positions, MIN(h.hour) AS first_seen, MAX(h.hour) AS last_seen
+    FROM vessel_hourly h
+    LEFT JOIN vessels v ON v.mmsi = h.mmsi
+    GROUP BY 1 ORDER BY 1
+"""
+
+
+def _counts(db):
+    return db.execute_query(
+        "SELECT vessel_type, vessels, positions, first_seen, last_seen FROM vessel_type_counts ORDER BY 1"
+    )
+
+
+def _fix(mmsi, timestamp, **fields):
+    return {'mmsi': mmsi, 'timestamp': timestamp, 'latitude': 54.0, 'longitude': 8.0, **fields}
+
+
+def test_type_counts_follow_ingest_and_type_changes(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    db.load_sample_data(n_vessels=6, days=1, seed=1)
+    assert _counts(db).equals(db.execute_query(FULL_RECOMPUTE))
+
+    db.ingest_stream([
+        _fix(100000000, '2030-01-01 00:00:00'),
+        _fix(999000001, '2030-01-01 00:00:00'),  # no static data yet: Unknown
+    ])
+    assert _counts(db).equals(db.execute_query(FULL_RECOMPUTE))
+
+    # The new vessel's type arrives with its next fix; it moves out of Unknown
+    db.ingest_stream([_fix(999000001, '2030-01-01 01:00:00', vessel_type='Tanker')])
+    counts = _counts(db)
+    assert counts.equals(db.execute_query(FULL_RECOMPUTE))
+    assert 'Unknown' not in set(counts['vessel_type'])
@@ -0,0 +1,14 @@
+import re
+
+from database.db_manager import DatabaseManager
+
+USER_TABLES = {
+    'ais_positions', 'vessels', 'port_events', 'position_anomalies',
+    'speed_histogram_hourly', 'vessel_hourly', 'vessel_type_counts',
+}
+
+
+def test_schema_prompt_lists_only_user_facing_tables(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}")
+    listed = set(re.findall(r"^- (\w+) \(", db.describe_schema(max_tokens=10_000), re.MULTILINE))
+    assert listed == USER_TABLES
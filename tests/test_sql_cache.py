@@ -0,0 +1,38 @@
+import pytest
+
+from chains.sql_cache import SQLCache
+
+SQL = "SELECT 1"
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("What is the maximum speed of tankers in the last week?",
+     "What is the minimum speed of tankers in the last week?"),
+    ("How many tankers are under way?", "How many tankers are not under way?"),
+    ("Average speed in the last 6 hours", "Average speed in the last 24 hours"),
+    ("How many tankers are moored?", "Which tankers are moored?"),
+    ("Arrivals in Rotterdam not Singapore", "Arrivals in Singapore not Rotterdam"),
+    ("Tankers under way in the last week", "In the last week, tankers under way?"),
+])
+def test_near_miss_is_not_a_hit(cached, asked):
+    cache = SQLCache()
+    cache.store(cached, SQL, 'v1')
+    assert cache.lookup(asked, 'v1') is None
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("What is the maximum speed of tankers in the last week?",
+     "Maximum speed of the tankers in the last week"),
+    ("how many TANKERS are moored", "How many tankers are moored?"),
+])
+def test_filler_difference_is_a_hit(cached, asked):
+    cache = SQLCache()
+    cache.store(cached, SQL, 'v1')
+    assert cache.lookup(asked, 'v1') == SQL
+    assert cache.stats()['hits'] == 1
+
+
+def test_schema_version_partitions_entries():
+    cache = SQLCache()
+    cache.store("How many tankers are moored?", SQL, 'v1')
+    assert cache.lookup("How many tankers are moored?", 'v2') is None
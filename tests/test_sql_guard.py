@@ -0,0 +1,30 @@
+from sqlalchemy import event
+
+from database.db_manager import DatabaseManager
+
+
+def _statements(db):
+    seen = []
+    event.listen(db.engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: seen.append(statement))
+    return seen
+
+
+def test_sorted_results_are_limited_without_a_second_pass(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}", max_result_rows=10)
+    db.load_sample_data(n_vessels=3, days=1, seed=1)
+    query = "SELECT mmsi, speed FROM ais_positions ORDER BY speed DESC"
+    seen = _statements(db)
+
+    guarded = db.guard.prepare(query)
+    assert guarded.action == 'limit'
+    assert sum(query in statement for statement in seen) == 2  # column probe and plan, no count
+
+
+def test_unsorted_results_that_fit_are_left_alone(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ais.db'}", max_result_rows=10)
+    db.load_sample_data(n_vessels=3, days=1, seed=1)
+
+    guarded = db.guard.prepare("SELECT mmsi, speed FROM ais_positions WHERE mmsi = 0")
+    assert guarded.action == 'none'
+    assert "LIMIT" not in guarded.sql
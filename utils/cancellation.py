@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+# How often a cancellable wait checks its flag
+POLL_S = 0.05
+
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    """The work was abandoned by whoever started it (e.g. a chain stage timed out)"""
+
+
+@contextmanager
+def cancel_scope(flag: threading.Event) -> Iterator[threading.Event]:
+    """Make ``flag`` the cancellation flag of work done on this thread"""
+    previous = getattr(_local, 'flag', None)
+    _local.flag = flag
+    try:
+        yield flag
+    finally:
+        _local.flag = previous
+
+
+def current_flag() -> Optional[threading.Event]:
+    """Cancellation flag of the enclosing cancel_scope on this thread, if any"""
+    return getattr(_local, 'flag', None)
+
+
+def wait_result(future: Future) -> Any:
+    """``future.result()`` that gives up once the enclosing scope is cancelled
+
+    A future that hasn't started yet is cancelled too, so abandoned work
+    doesn't run at all.
+    """
+    flag = current_flag()
+    if flag is None:
+        return future.result()
+    while True:
+        try:
+            return future.result(timeout=POLL_S)
+        except FutureTimeout:
+            if flag.is_set():
+                future.cancel()
+                raise Cancelled()
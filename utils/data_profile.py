@@ -0,0 +1,226 @@
+
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# Text columns whose first values all parse with this format are profiled as times
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class QuantileSketch:
+    """Mergeable approximate-quantile sketch (KLL-style compactor levels)
+
+    Level ``i`` holds items of weight ``2**i``; when a level outgrows ``k``
+    it is sorted and every other item (random offset) moves up a level, so
+    memory stays O(k log n) however many values are added.
+    """
+
+    def __init__(self, k: int = 256, seed: Optional[int] = None):
+        self.k = k
+        self.count = 0
+        self._levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compact()
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        for level, items in enumerate(other._levels):
+            if level == len(self._levels):
+                self._levels.append(np.empty(0))
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.count += other.count
+        self._compact()
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        qs = list(qs)
+        if not self.count:
+            return [None] * len(qs)
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self._levels)])
+        order = np.argsort(items)
+        cumulative = np.cumsum(weights[order])
+        ranks = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return [float(v) for v in items[order][np.minimum(ranks, len(items) - 1)]]
+
+    def _compact(self) -> None:
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) > self.k:
+                items = np.sort(items)
+                if len(items) % 2:
+                    # Keep one item back so the promoted half has an exact weight
+                    self._levels[level], items = items[-1:], items[:-1]
+                else:
+                    self._levels[level] = np.empty(0)
+                promoted = items[self._rng.integers(2)::2]
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+            level += 1
+
+
+class ColumnProfile:
+    """Running summary of one column; the kind is fixed by the first non-empty chunk"""
+
+    def __init__(self, name: str, top_k: int = 5, max_tracked: int = 1000):
+        self.name = name
+        self.kind: Optional[str] = None
+        self.count = 0
+        self.nulls = 0
+        self.top_k = top_k
+        self.max_tracked = max_tracked
+        self.minimum = None
+        self.maximum = None
+        self._sum = 0.0
+        self._sketch = QuantileSketch()
+        self._counts: Counter = Counter()
+        self._distinct_overflow = False
+
+    def update(self, series: pd.Series) -> None:
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if not len(values):
+            return
+        if self.kind is None:
+            self.kind = _column_kind(values)
+
+        if self.kind == 'time':
+            time_format = None if _is_datetime(values) else TIMESTAMP_FORMAT
+            values = pd.to_datetime(values, errors='coerce', format=time_format).dropna()
+            if not len(values):
+                return
+            self._update_range(values.min(), values.max())
+        elif self.kind == 'number':
+            numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+            numbers = numbers[~np.isnan(numbers)]
+            if not len(numbers):
+                return
+            self._update_range(numbers.min(), numbers.max())
+            self._sum += numbers.sum()
+            self._sketch.update(numbers)
+            values = numbers
+        else:
+            self._counts.update(values.astype(str).value_counts().to_dict())
+            if len(self._counts) > self.max_tracked:
+                # Keep the heaviest values; counts of the rest become approximate
+                self._counts = Counter(dict(self._counts.most_common(self.max_tracked)))
+                self._distinct_overflow = True
+        self.count += len(values)
+
+    def _update_range(self, low, high) -> None:
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def summary(self) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {'kind': self.kind or 'empty', 'count': self.count, 'nulls': self.nulls}
+        if self.kind == 'number' and self.count:
+            summary.update(
+                min=float(self.minimum), max=float(self.maximum), mean=self._sum / self.count,
+                quantiles=dict(zip(QUANTILES, self._sketch.quantiles(QUANTILES))),
+            )
+        elif self.kind == 'time' and self.count:
+            summary.update(
+                min=str(self.minimum), max=str(self.maximum),
+                span_hours=(self.maximum - self.minimum).total_seconds() / 3600,
+            )
+        elif self.kind == 'text':
+            summary.update(
+                distinct=len(self._counts),
+                distinct_is_lower_bound=self._distinct_overflow,
+                top=self._counts.most_common(self.top_k),
+            )
+        return summary
+
+    def describe(self) -> str:
+        s = self.summary()
+        head = f"{self.name} ({s['kind']}"
+        head += f", {s['nulls']} null)" if s['nulls'] else ")"
+        if s['kind'] == 'number' and s['count']:
+            q = s['quantiles']
+            return (f"{head}: {_num(s['min'])}..{_num(s['max'])}, mean {_num(s['mean'])}, "
+                    f"p25/p50/p75 {_num(q[0.25])}/{_num(q[0.5])}/{_num(q[0.75])}")
+        if s['kind'] == 'time' and s['count']:
+            return f"{head}: {s['min']} to {s['max']} ({s['span_hours']:.1f} h)"
+        if s['kind'] == 'text':
+            distinct = f"{s['distinct']}{'+' if s['distinct_is_lower_bound'] else ''} distinct"
+            top = ', '.join(f"{value} {count / max(1, s['count']):.0%}" for value, count in s['top'])
+            return f"{head}: {distinct}; top {top}"
+        return f"{head}: no values"
+
+
+class DataProfiler:
+    """One-pass, chunk-at-a-time profile of a query result
+
+    Feed DataFrames (whole results or ``DatabaseManager.iter_query`` chunks)
+    to ``update``; ``summary`` gives typed per-column stats and ``describe``
+    a compact text version for prompts.
+    """
+
+    def __init__(self, top_k: int = 5):
+        self.top_k = top_k
+        self.rows = 0
+        self.columns: Dict[str, ColumnProfile] = {}
+
+    def update(self, frame: pd.DataFrame) -> 'DataProfiler':
+        self.rows += len(frame)
+        for name in frame.columns:
+            profile = self.columns.get(name)
+            if profile is None:
+                profile = self.columns[name] = ColumnProfile(name, self.top_k)
+            profile.update(frame[name])
+        return self
+
+    @classmethod
+    def from_frames(cls, frames: Iterable[pd.DataFrame], top_k: int = 5) -> 'DataProfiler':
+        profiler = cls(top_k)
+        for frame in frames:
+            profiler.update(frame)
+        return profiler
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'columns': {name: profile.summary() for name, profile in self.columns.items()},
+        }
+
+    def describe(self, max_chars: int = 1500) -> str:
+        lines = [f"{self.rows} rows, {len(self.columns)} columns:"]
+        lines += [f"- {profile.describe()}" for profile in self.columns.values()]
+        text = '\n'.join(lines)
+        return text if len(text) <= max_chars else text[:max_chars].rsplit('\n', 1)[0]
+
+
+def _is_datetime(values: pd.Series) -> bool:
+    return pd.api.types.is_datetime64_any_dtype(values)
+
+
+def _column_kind(values: pd.Series) -> str:
+    if _is_datetime(values):
+        return 'time'
+    if pd.api.types.is_bool_dtype(values):
+        return 'text'
+    if pd.api.types.is_numeric_dtype(values):
+        return 'number'
+    head = values.head(20).astype(str)
+    if not pd.to_datetime(head, errors='coerce', format=TIMESTAMP_FORMAT).isna().any():
+        return 'time'
+    return 'text'
+
+
+def _num(value: Optional[float]) -> str:
+    if value is None:
+        return '?'
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.4g}"
@@ -0,0 +1,245 @@
+
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.trajectory import EARTH_RADIUS_NM, epoch_seconds, format_timestamps, haversine_nm, vessel_names
+
+# Close encounters are found with a hash join on (time slice, 3-D grid cell).
+# Positions become points on a sphere of radius EARTH_RADIUS_NM; the straight
+# line between two points is never longer than the great circle, so vessels
+# within ``distance_nm`` always sit in neighbouring cells of size
+# ``distance_nm`` (no special cases at the poles or the antimeridian). Time
+# slices are ``window_minutes`` long, so fixes close enough in time are in
+# the same or the next slice.
+_NEIGHBOURS = list(itertools.product((-1, 0, 1), repeat=3))
+# Within one slice a pair is found from both ends, so half the neighbourhood
+# (plus the fix's own cell) is enough
+_FORWARD = [offset for offset in _NEIGHBOURS if offset >= (0, 0, 0)]
+# Multipliers for packing (slice, cell x, y, z) into one int64 hash; a
+# collision only adds candidates, which the exact distance check removes
+_HASH = (np.int64(73856093), np.int64(19349663), np.int64(83492791))
+
+
+def _close_pairs(rows: np.ndarray, seconds: np.ndarray, slices: np.ndarray, lat: np.ndarray,
+                 lon: np.ndarray, tracks: np.ndarray, last_slice: int, distance_nm: float,
+                 window_s: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pairs of fixes from different vessels within ``distance_nm`` and ``window_s``
+
+    Only pairs whose first fix lies in a slice up to ``last_slice`` are
+    returned; the caller passes the following slice along as a halo, so
+    chunks of consecutive slices produce every pair exactly once.
+    Returns (row, other row, distance) arrays.
+    """
+    phi, lam = np.radians(lat), np.radians(lon)
+    xyz = EARTH_RADIUS_NM * np.column_stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)])
+    cells = np.floor(xyz / distance_nm).astype(np.int64)
+
+    keys = _hash(slices, cells)
+    order = np.argsort(keys, kind='stable')
+    unique_keys, bucket_start, bucket_size = np.unique(keys[order], return_index=True, return_counts=True)
+    # Searched in key order: the hash is linear, so each neighbour's keys are
+    # the fix's own key plus a constant and the needles stay sorted, which
+    # keeps searchsorted cache-friendly
+    first = order[slices[order] <= last_slice]
+    first_keys = keys[first]
+
+    found_i: List[np.ndarray] = []
+    found_j: List[np.ndarray] = []
+    for step, offsets in ((0, _FORWARD), (1, _NEIGHBOURS)):
+        for offset in offsets:
+            with np.errstate(over='ignore'):
+                target = first_keys + _hash(np.array([step]), np.array([offset]))[0]
+            bucket = np.minimum(np.searchsorted(unique_keys, target), len(unique_keys) - 1)
+            hit = unique_keys[bucket] == target
+            if not hit.any():
+                continue
+            lo, counts = bucket_start[bucket[hit]], bucket_size[bucket[hit]]
+            total = int(counts.sum())
+            positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+            i = np.repeat(first[hit], counts)
+            j = order[positions]
+            # Hash collisions only add candidates; the slice check keeps each pair once
+            keep = (tracks[i] != tracks[j]) & (slices[j] == slices[i] + step)
+            if step == 0 and offset == (0, 0, 0):
+                keep &= i < j
+            found_i.append(i[keep])
+            found_j.append(j[keep])
+
+    if not found_i:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    i, j = np.concatenate(found_i), np.concatenate(found_j)
+    close = np.abs(seconds[i] - seconds[j]) <= window_s
+    i, j = i[close], j[close]
+    distance = haversine_nm(lat[i], lon[i], lat[j], lon[j])
+    close = distance <= distance_nm
+    return rows[i[close]], rows[j[close]], distance[close]
+
+
+def _hash(slices: np.ndarray, cells: np.ndarray) -> np.ndarray:
+    """Linear in its inputs: hash(s + ds, c + dc) == hash(s, c) + hash(ds, dc)"""
+    with np.errstate(over='ignore'):
+        key = slices.astype(np.int64)
+        for axis, multiplier in enumerate(_HASH):
+            key = key * multiplier + cells[:, axis]
+    return key
+
+
+class EncounterDetector:
+    """Vessel pairs that come within ``distance_nm`` of each other within ``window_minutes``
+
+    Positions are split into runs of consecutive time slices that are
+    searched independently, on a process pool when there are at least
+    ``parallel_min_rows`` positions. Close fixes of the same pair no more
+    than a window apart form one encounter, reported at its closest approach.
+    """
+
+    def __init__(self, distance_nm: float = 1.0, window_minutes: float = 10,
+                 max_workers: Optional[int] = None, parallel_min_rows: int = 200_000,
+                 chunk_rows: int = 100_000):
+        self.distance_nm = distance_nm
+        self.window_minutes = window_minutes
+        self.max_workers = max_workers
+        self.parallel_min_rows = parallel_min_rows
+        self.chunk_rows = chunk_rows
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_config(cls, maritime_config: Optional[Dict] = None) -> 'EncounterDetector':
+        """Build from the ``maritime`` section of config.yaml"""
+        settings = (maritime_config or {}).get('encounters', {})
+        return cls(
+            distance_nm=settings.get('distance_nm', 1.0),
+            window_minutes=settings.get('window_minutes', 10),
+            max_workers=settings.get('max_workers'),
+            parallel_min_rows=settings.get('parallel_min_rows', 200_000),
+        )
+
+    def detect(self, data: pd.DataFrame, distance_nm: Optional[float] = None,
+               window_minutes: Optional[float] = None) -> pd.DataFrame:
+        """One row per encounter, at the pair's closest approach
+
+        ``latitude``/``longitude`` is the midpoint between the two vessels
+        (so the result renders on the vessel map); each vessel's own fix is
+        in ``vessel_*``/``other_*``.
+        """
+        distance_nm = distance_nm or self.distance_nm
+        window_s = (window_minutes or self.window_minutes) * 60
+        if data is None or len(data) < 2:
+            return _empty()
+
+        seconds = epoch_seconds(data['timestamp'])
+        lat = data['latitude'].to_numpy(dtype=float)
+        lon = data['longitude'].to_numpy(dtype=float)
+        valid = ~(np.isnan(lat) | np.isnan(lon)) & (seconds != np.iinfo(np.int64).min)
+        mmsis, tracks = np.unique(data['mmsi'].to_numpy(), return_inverse=True)
+
+        rows = np.flatnonzero(valid)
+        rows = rows[np.argsort(seconds[rows], kind='stable')]
+        slices = (seconds[rows] - seconds[rows[0]]) // int(window_s) if len(rows) else rows
+        tasks = [
+            (rows[lo:hi], seconds[rows[lo:hi]], slices[lo:hi], lat[rows[lo:hi]], lon[rows[lo:hi]],
+             tracks[rows[lo:hi]], last, distance_nm, window_s)
+            for lo, hi, last in self._chunks(slices)
+        ]
+        results = None
+        if len(rows) >= self.parallel_min_rows and len(tasks) > 1 and self.max_workers != 1:
+            try:
+                results = list(self._executor().map(_close_pairs, *zip(*tasks)))
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                print(f"Encounter search pool failed, searching in-process: {str(e)}")
+                self.close()
+        if results is None:
+            results = [_close_pairs(*task) for task in tasks]
+        if not results:
+            return _empty()
+
+        i = np.concatenate([r[0] for r in results])
+        j = np.concatenate([r[1] for r in results])
+        distance = np.concatenate([r[2] for r in results])
+        if not len(i):
+            return _empty()
+        return self._episodes(data, mmsis, tracks, seconds, lat, lon, i, j, distance, window_s)
+
+    def close(self) -> None:
+        """Shut down the worker pool, if one was started"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded server process can copy held locks
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _chunks(self, slices: np.ndarray):
+        """(start, end, last slice) row ranges of whole slices, plus the next slice as halo"""
+        n = len(slices)
+        start = 0
+        while start < n:
+            end = min(n, start + self.chunk_rows)
+            last = slices[end - 1]
+            # Finish the last slice, then take the following one as the halo
+            end = int(np.searchsorted(slices, last, side='right'))
+            halo = int(np.searchsorted(slices, last + 1, side='right'))
+            yield start, halo, int(last)
+            start = end
+
+    def _episodes(self, data, mmsis, tracks, seconds, lat, lon, i, j, distance, window_s) -> pd.DataFrame:
+        """Collapse close fixes of the same pair into encounters, keeping the closest approach"""
+        swap = tracks[i] > tracks[j]
+        i, j = np.where(swap, j, i), np.where(swap, i, j)
+        when = np.minimum(seconds[i], seconds[j])
+        order = np.lexsort((when, tracks[j], tracks[i]))
+        i, j, distance, when = i[order], j[order], distance[order], when[order]
+
+        new = np.ones(len(i), dtype=bool)
+        new[1:] = ((tracks[i[1:]] != tracks[i[:-1]]) | (tracks[j[1:]] != tracks[j[:-1]])
+                   | (when[1:] - when[:-1] > window_s))
+        episode = np.cumsum(new) - 1
+        starts = np.flatnonzero(new)
+        ends = np.append(starts[1:], len(i)) - 1
+        closest = np.lexsort((distance, episode))[starts]
+
+        a, b = i[closest], j[closest]
+        encounters = pd.DataFrame({
+            'mmsi': mmsis[tracks[a]],
+            'other_mmsi': mmsis[tracks[b]],
+            'timestamp': format_timestamps(np.maximum(seconds[a], seconds[b])),
+            'start_time': format_timestamps(when[starts]),
+            'end_time': format_timestamps(np.maximum(seconds[i[ends]], seconds[j[ends]])),
+            'distance_nm': distance[closest],
+            'time_gap_minutes': np.abs(seconds[a] - seconds[b]) / 60.0,
+            'fixes': np.diff(np.append(starts, len(i))),
+            'latitude': (lat[a] + lat[b]) / 2,
+            'longitude': _mid_longitude(lon[a], lon[b]),
+            'vessel_latitude': lat[a],
+            'vessel_longitude': lon[a],
+            'other_latitude': lat[b],
+            'other_longitude': lon[b],
+        })
+        if 'vessel_name' in data.columns:
+            encounters.insert(1, 'vessel_name', vessel_names(data, encounters['mmsi'].to_numpy()))
+            encounters.insert(3, 'other_vessel_name', vessel_names(data, encounters['other_mmsi'].to_numpy()))
+        return encounters.sort_values('distance_nm', kind='stable').reset_index(drop=True)
+
+
+def _mid_longitude(lon_a: np.ndarray, lon_b: np.ndarray) -> np.ndarray:
+    """Midpoint longitude, taking the short way across the antimeridian"""
+    delta = (lon_b - lon_a + 180) % 360 - 180
+    return (lon_a + delta / 2 + 180) % 360 - 180
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=[
+        'mmsi', 'other_mmsi', 'timestamp', 'start_time', 'end_time', 'distance_nm', 'time_gap_minutes',
+        'fixes', 'latitude', 'longitude', 'vessel_latitude', 'vessel_longitude', 'other_latitude',
+        'other_longitude',
+    ])
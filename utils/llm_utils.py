@@ -1,13 +1,54 @@
 
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, TextIteratorStreamer
 import torch
-from typing import Tuple, Dict, Any
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Tuple, Dict, Any, Iterator, List, Optional
+from utils.cancellation import wait_result
+from utils.metrics import metrics, profile_thread
+
+# Fixed instruction text goes first so its KV cache can be shared between queries
+ANALYSIS_PROMPT_PREFIX = """
+        Analyze this maritime data query and extract key components.
+
+        Identify:
+        1. Query type (vessel tracking, port analysis, speed analysis)
+        2. Time range
+        3. Specific vessels or vessel types
+        4. Geographic area
+        5. Required visualization
+
+        """
 
 class LLMUtils:
     def __init__(self, model_config: Dict[str, Any]):
         """Initialize LLM utilities"""
         self.config = model_config
+        self.timings: Dict[str, float] = {}
+        start = time.perf_counter()
         self.model, self.tokenizer = self._load_model()
+        self.timings['load_s'] = time.perf_counter() - start
+
+        # Batched generation pads on the left so every prompt ends at the same position
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self._prefix_cache: "OrderedDict[str, Tuple[torch.Tensor, Tuple]]" = OrderedDict()
+        self._prefix_lock = threading.Lock()
+        # Set when this transformers version can't reuse a prefix cache; plain batching from then on
+        self._prefix_error: Optional[str] = None
+        batching = self.config.get('batching', {})
+        self.batcher = GenerationBatcher(
+            self,
+            max_batch_size=batching.get('max_batch_size', 8),
+            max_wait_ms=batching.get('max_wait_ms', 20),
+        )
 
     def _load_model(self) -> Tuple[AutoModelForCausalLM, AutoTokenizer]:
         """Load the LLM model and tokenizer"""
@@ -23,36 +64,196 @@ class LLMUtils:
         except Exception as e:
             raise Exception(f"Failed to load model: {str(e)}")
 
-    def generate_response(self, prompt: str) -> str:
-        """Generate response from the model"""
+    def generate_response(self, prompt: str, prefix: Optional[str] = None) -> str:
+        """Generate response from the model
+
+        Requests from concurrent callers are coalesced by the batcher into a
+        single batched forward pass. ``prefix`` marks a fixed leading part of
+        the prompt whose KV cache can be reused across calls. Token counts
+        and tokens/sec are recorded per batch (see ``_record_generation``).
+        A caller whose cancel_scope is cancelled (a timed-out chain stage)
+        stops waiting and withdraws the request if it hasn't run yet.
+        """
+        with metrics.timer('llm_request_seconds'):
+            return wait_result(self.batcher.submit(prompt, prefix=prefix))
+
+    def stream_response(self, prompt: str, max_new_tokens: Optional[int] = None) -> Iterator[str]:
+        """Yield decoded text chunks as the model produces them
+
+        Generation runs in a background thread feeding a TextIteratorStreamer,
+        so the caller can render the first tokens while the rest are still
+        being generated. Works the same on CPU-only hosts.
+        """
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
         inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-        
-        outputs = self.model.generate(
-            inputs["input_ids"],
-            max_length=self.config.get('max_length', 512),
-            temperature=self.config.get('temperature', 0.7),
-            num_return_sequences=1,
-            pad_token_id=self.tokenizer.eos_token_id
+        kwargs = dict(
+            **inputs,
+            streamer=streamer,
+            **self._generation_kwargs(max_new_tokens or self.config.get('max_new_tokens', 256))
         )
-        
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        return response
+        errors: List[Exception] = []
+
+        def run():
+            try:
+                with profile_thread(), torch.inference_mode():
+                    self.model.generate(**kwargs)
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer, which would otherwise wait on the queue forever
+                streamer.end()
+
+        start = time.perf_counter()
+        thread = threading.Thread(target=run, name="llm-stream", daemon=True)
+        thread.start()
+        first = True
+        text = ""
+        for chunk in streamer:
+            if not chunk:
+                continue
+            if first:
+                self.timings['last_first_token_s'] = time.perf_counter() - start
+                first = False
+            text += chunk
+            yield chunk
+        thread.join()
+        if errors:
+            raise errors[0]
+        completion = len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+        self._record_generation('stream', inputs["input_ids"].shape[1], completion,
+                                time.perf_counter() - start)
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: Optional[int] = None,
+                       prefix: Optional[str] = None) -> List[str]:
+        """Generate completions for several prompts in one padded batch
+
+        When every prompt starts with ``prefix`` (e.g. the fixed schema and
+        instruction text), the prefix is run through the model once and its
+        KV cache is reused for the whole batch and for later calls. If the
+        installed transformers can't take a precomputed cache, the prefix
+        path is switched off after the first attempt.
+        """
+        if not prompts:
+            return []
+        max_new_tokens = max_new_tokens or self.config.get('max_new_tokens', 256)
+        if prefix and self._prefix_error is None and all(p.startswith(prefix) for p in prompts):
+            try:
+                return self._generate_with_prefix(prefix, [p[len(prefix):] for p in prompts], max_new_tokens)
+            except (AttributeError, TypeError) as e:
+                # Cache reuse depends on the transformers version (DynamicCache API, generate kwargs)
+                self._prefix_error = f"{type(e).__name__}: {str(e)}"
+                metrics.inc('llm_prefix_cache_failures_total')
+                print(f"Prefix cache reuse failed, using plain batching: {self._prefix_error}")
+        return self._generate_padded(prompts, max_new_tokens)
+
+    def _generation_kwargs(self, max_new_tokens: int) -> Dict[str, Any]:
+        return {
+            "max_new_tokens": max_new_tokens,
+            "temperature": self.config.get('temperature', 0.7),
+            "num_return_sequences": 1,
+            "pad_token_id": self.tokenizer.pad_token_id,
+        }
+
+    def _record_generation(self, mode: str, prompt_tokens: int, completion_tokens: int,
+                           seconds: float, batch_size: int = 1) -> None:
+        """Token counts and throughput of one generate call"""
+        metrics.inc('llm_prompt_tokens_total', prompt_tokens, mode=mode)
+        metrics.inc('llm_completion_tokens_total', completion_tokens, mode=mode)
+        metrics.observe('llm_generate_seconds', seconds, mode=mode)
+        metrics.observe('llm_batch_size', batch_size, mode=mode)
+        if seconds > 0:
+            metrics.observe('llm_tokens_per_second', completion_tokens / seconds, mode=mode)
+            self.timings['last_tokens_per_s'] = completion_tokens / seconds
+
+    def _completion_tokens(self, generated: torch.Tensor) -> int:
+        """Generated tokens, not counting the padding after sequences that stopped early"""
+        return int((generated != self.tokenizer.pad_token_id).sum().item())
+
+    def _generate_padded(self, prompts: List[str], max_new_tokens: int) -> List[str]:
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            outputs = self.model.generate(**inputs, **self._generation_kwargs(max_new_tokens))
+        generated = outputs[:, inputs["input_ids"].shape[1]:]
+        self._record_generation('batch', int(inputs["attention_mask"].sum().item()),
+                                self._completion_tokens(generated), time.perf_counter() - start,
+                                len(prompts))
+        return self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+
+    def _generate_with_prefix(self, prefix: str, suffixes: List[str], max_new_tokens: int) -> List[str]:
+        prefix_ids, prefix_kv = self._prefix_kv(prefix)
+        n = len(suffixes)
+        suffix = self.tokenizer(
+            suffixes, return_tensors="pt", padding=True, add_special_tokens=False
+        ).to(self.model.device)
+
+        # Pads sit between prefix and suffix; the attention mask hides them and
+        # position ids are derived from the mask, so the cached prefix stays valid.
+        input_ids = torch.cat([prefix_ids.expand(n, -1), suffix["input_ids"]], dim=1)
+        attention_mask = torch.cat([
+            torch.ones((n, prefix_ids.shape[1]), dtype=suffix["attention_mask"].dtype,
+                       device=self.model.device),
+            suffix["attention_mask"],
+        ], dim=1)
+        past = DynamicCache.from_legacy_cache(tuple(
+            (k.expand(n, -1, -1, -1).contiguous(), v.expand(n, -1, -1, -1).contiguous())
+            for k, v in prefix_kv
+        ))
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past,
+                **self._generation_kwargs(max_new_tokens)
+            )
+        generated = outputs[:, input_ids.shape[1]:]
+        # Prompt tokens include the cached prefix, which this call didn't recompute
+        self._record_generation('prefix', int(attention_mask.sum().item()),
+                                self._completion_tokens(generated), time.perf_counter() - start, n)
+        return self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+
+    def _prefix_kv(self, prefix: str) -> Tuple[torch.Tensor, Tuple]:
+        """Prefix token ids and their KV cache, computed once per prefix"""
+        with self._prefix_lock:
+            if prefix in self._prefix_cache:
+                self._prefix_cache.move_to_end(prefix)
+                return self._prefix_cache[prefix]
+
+        prefix_ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"].to(self.model.device)
+        with torch.inference_mode():
+            past = self.model(prefix_ids, use_cache=True).past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            past = past.to_legacy_cache()
+
+        with self._prefix_lock:
+            self._prefix_cache[prefix] = (prefix_ids, past)
+            while len(self._prefix_cache) > self.config.get('prefix_cache_size', 4):
+                self._prefix_cache.popitem(last=False)
+        return prefix_ids, past
+
+    def warmup(self, prompt: str = "Vessel status:") -> float:
+        """Run a one-token generation to prime kernels and caches
+
+        Returns the first-token latency in seconds.
+        """
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            self.model.generate(
+                inputs["input_ids"],
+                max_new_tokens=1,
+                pad_token_id=self.tokenizer.eos_token_id
+            )
+        self.timings['first_token_s'] = time.perf_counter() - start
+        return self.timings['first_token_s']
 
     def analyze_maritime_query(self, query: str) -> Dict[str, Any]:
         """Analyze maritime query and extract key components"""
-        prompt = f"""
-        Analyze this maritime data query and extract key components:
-        Query: {query}
-        
-        Identify:
-        1. Query type (vessel tracking, port analysis, speed analysis)
-        2. Time range
-        3. Specific vessels or vessel types
-        4. Geographic area
-        5. Required visualization
+        prompt = ANALYSIS_PROMPT_PREFIX + f"""Query: {query}
         """
-        
-        response = self.generate_response(prompt)
+
+        response = self.generate_response(prompt, prefix=ANALYSIS_PROMPT_PREFIX)
         # Process response to structured format
         return self._parse_analysis(response)
 
@@ -67,6 +268,177 @@ class LLMUtils:
             "visualization": "map"
         }
 
+class GenerationBatcher:
+    """Coalesces concurrent generate requests into batched forward passes
+
+    A worker thread takes the first pending request, waits up to
+    ``max_wait_ms`` for more (up to ``max_batch_size``), and runs them as one
+    batch. The longest common line-aligned prefix of the batch is passed on
+    so its KV cache is shared.
+    """
+
+    def __init__(self, llm: LLMUtils, max_batch_size: int = 8, max_wait_ms: float = 20,
+                 min_prefix_chars: int = 200):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.min_prefix_chars = min_prefix_chars
+        self._queue: "queue.Queue[Tuple[str, Optional[int], Optional[str], Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, prompt: str, max_new_tokens: Optional[int] = None,
+               prefix: Optional[str] = None) -> Future:
+        future: Future = Future()
+        self._queue.put((prompt, max_new_tokens, prefix, future))
+        self._ensure_worker()
+        return future
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Requests with different token budgets or prefixes can't share a generate call
+            groups: Dict[Tuple[Optional[int], Optional[str]], List[Tuple[str, Future]]] = {}
+            for prompt, max_new_tokens, prefix, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue  # withdrawn by a caller that gave up
+                groups.setdefault((max_new_tokens, prefix), []).append((prompt, future))
+            for (max_new_tokens, prefix), items in groups.items():
+                self._run_group(max_new_tokens, prefix, items)
+
+    def _run_group(self, max_new_tokens: Optional[int], prefix: Optional[str],
+                   items: List[Tuple[str, Future]]) -> None:
+        prompts = [prompt for prompt, _ in items]
+        try:
+            with profile_thread():
+                results = self.llm.generate_batch(
+                    prompts, max_new_tokens, prefix=prefix or self._shared_prefix(prompts)
+                )
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(items, results):
+            future.set_result(result)
+
+    def _shared_prefix(self, prompts: List[str]) -> Optional[str]:
+        if len(prompts) < 2:
+            return None
+        common = os.path.commonprefix(prompts)
+        # Cut at a line break so the prefix tokenizes the same on its own
+        cut = common.rfind("\n")
+        if cut < self.min_prefix_chars:
+            return None
+        return common[:cut + 1]
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models, one instance per model config
+
+    Loading a 7B checkpoint takes far longer than any request, so models are
+    loaded lazily on first use (or ahead of time via ``preload``) and shared
+    by every caller with the same configuration. A per-config lock makes
+    concurrent first requests wait for a single load instead of racing.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, LLMUtils] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._threads: Dict[str, threading.Thread] = {}
+        self._errors: Dict[str, Exception] = {}
+        self._started = time.perf_counter()
+
+    @staticmethod
+    def config_key(config: Dict[str, Any]) -> str:
+        """Stable hash of a model config"""
+        payload = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get(self, config: Dict[str, Any], warmup: bool = True) -> LLMUtils:
+        """Return the shared model for this config, loading it on first use"""
+        key = self.config_key(config)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            model = self._models.get(key)
+            if model is None:
+                model = LLMUtils(config)
+                if warmup:
+                    model.warmup()
+                model.timings['ready_after_startup_s'] = time.perf_counter() - self._started
+                self._models[key] = model
+                self._errors.pop(key, None)
+        return model
+
+    def preload(self, config: Dict[str, Any]) -> threading.Thread:
+        """Start loading and warming a model in a background thread
+
+        Runs once per config: a failed preload keeps its error (see
+        ``timing_report``) and isn't restarted until ``reset``.
+        """
+        key = self.config_key(config)
+        with self._guard:
+            thread = self._threads.get(key)
+            if thread is None:
+                thread = threading.Thread(
+                    target=self._preload, args=(config, key), name=f"llm-preload-{key[:8]}", daemon=True
+                )
+                self._threads[key] = thread
+                thread.start()
+        return thread
+
+    def _preload(self, config: Dict[str, Any], key: str) -> None:
+        try:
+            self.get(config)
+        except Exception as e:
+            self._errors[key] = e
+
+    def reset(self, config: Dict[str, Any]) -> None:
+        """Forget a failed preload so the next ``preload`` tries again"""
+        key = self.config_key(config)
+        with self._guard:
+            if key in self._errors:
+                self._errors.pop(key)
+                self._threads.pop(key, None)
+
+    def is_ready(self, config: Dict[str, Any]) -> bool:
+        return self.config_key(config) in self._models
+
+    def timing_report(self) -> Dict[str, Dict[str, Any]]:
+        """Load, first-token and time-to-ready timings per loaded model"""
+        report = {}
+        for key, model in self._models.items():
+            report[key[:12]] = {'name': model.config.get('name'), **model.timings}
+        for key, error in self._errors.items():
+            report[key[:12]] = {'error': str(error)}
+        return report
+
+
+registry = ModelRegistry()
+
 def load_llm_model(config: Dict[str, Any]) -> LLMUtils:
-    """Helper function to load LLM model"""
-    return LLMUtils(config)
+    """Helper function to load LLM model (shared per config via the registry)"""
+    return registry.get(config)
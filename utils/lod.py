@@ -0,0 +1,190 @@
+
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Level-of-detail helpers that keep figures within a point budget
+
+
+def track_significance(x: np.ndarray, y: np.ndarray, track_ids: np.ndarray,
+                       top: Optional[int] = None, tolerance: float = 0.0) -> np.ndarray:
+    """Douglas-Peucker significance of every point, for all tracks at once
+
+    Points must be grouped by track and in time order within a track. A
+    point's significance is the tolerance below which Douglas-Peucker keeps
+    it (track endpoints are infinite), so keeping every point with
+    significance >= t gives the simplification at tolerance t. The splits
+    of all tracks run together, one vectorized round per tree level.
+
+    With ``top`` (or ``tolerance``) the splitting stops early: points that
+    can no longer be among the ``top`` most significant (or reach the
+    tolerance) are left at zero.
+    """
+    n = len(x)
+    significance = np.zeros(n)
+    if n == 0:
+        return significance
+    boundaries = np.flatnonzero(np.diff(track_ids)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [n]]) - 1
+    significance[starts] = np.inf
+    significance[ends] = np.inf
+
+    caps = np.full(len(starts), np.inf)
+    found = np.empty(0)
+    while True:
+        interior = ends - starts - 1
+        active = interior > 0
+        starts, ends, caps, interior = starts[active], ends[active], caps[active], interior[active]
+        if not len(starts):
+            return significance
+
+        offsets = np.concatenate([[0], np.cumsum(interior)[:-1]])
+        index = np.repeat(starts + 1 - offsets, interior) + np.arange(int(interior.sum()))
+
+        dx, dy = x[ends] - x[starts], y[ends] - y[starts]
+        length = np.hypot(dx, dy)
+        inverse = np.divide(1.0, length, out=np.zeros_like(length), where=length > 0)
+        px = x[index] - np.repeat(x[starts], interior)
+        py = y[index] - np.repeat(y[starts], interior)
+        distance = np.abs(px * np.repeat(dy * inverse, interior) - py * np.repeat(dx * inverse, interior))
+        closed = np.repeat(length == 0, interior)
+        if closed.any():
+            # Track returns to its start: distance from that point instead
+            distance[closed] = np.hypot(px[closed], py[closed])
+
+        # Farthest point of each segment (the first one on ties)
+        dmax = np.maximum.reduceat(distance, offsets)
+        hits = np.flatnonzero(distance == np.repeat(dmax, interior))
+        segment = np.searchsorted(offsets, hits, side='right') - 1
+        split = index[hits[np.unique(segment, return_index=True)[1]]]
+        caps = np.minimum(caps, dmax)
+        significance[split] = caps
+
+        # Segments whose interior lies on the chord are done (this also stops
+        # rounding noise on straight legs from splitting one point at a time),
+        # as are segments whose points can't make the cut any more
+        floor = tolerance
+        if top is not None:
+            found = np.concatenate([found, caps])
+            if len(found) >= top:
+                floor = max(floor, np.partition(found, -top)[-top])
+        live = (dmax > 1e-9) & (caps >= floor)
+        starts, ends, caps, split = starts[live], ends[live], caps[live], split[live]
+        starts, ends, caps = (
+            np.concatenate([starts, split]),
+            np.concatenate([split, ends]),
+            np.concatenate([caps, caps]),
+        )
+
+
+def simplify_tracks(data: pd.DataFrame, max_points: int, tolerance: Optional[float] = None,
+                    track_column: str = 'mmsi') -> pd.DataFrame:
+    """Douglas-Peucker simplify every track, keeping at most ``max_points`` rows
+
+    Returns the kept rows sorted by track and time. ``tolerance`` (degrees)
+    drops detail below it even when the budget allows more points. If the
+    track endpoints alone exceed the budget, whole tracks are sampled.
+    """
+    sort_columns = [c for c in (track_column, 'timestamp') if c in data.columns]
+    data = data.sort_values(sort_columns, kind='stable') if sort_columns else data
+    if len(data) <= max_points and tolerance is None:
+        return data
+
+    lat = data['latitude'].to_numpy(dtype=float)
+    lon = data['longitude'].to_numpy(dtype=float)
+    # Equirectangular projection keeps distances comparable away from the equator
+    x = lon * np.cos(np.radians(np.nanmean(lat) if len(lat) else 0))
+    if track_column in data.columns:
+        track_ids = pd.factorize(data[track_column], sort=False)[0]
+    else:
+        track_ids = np.zeros(len(data), dtype=int)
+    significance = track_significance(x, lat, track_ids, top=max_points, tolerance=tolerance or 0.0)
+
+    keep = significance >= (tolerance or 0)
+    if keep.sum() > max_points:
+        finite = np.isfinite(significance)
+        budget = max_points - int((~finite).sum())
+        if budget < 0:
+            # More tracks than the budget has endpoints for: draw a sample of tracks
+            tracks = np.unique(track_ids)
+            chosen = np.random.default_rng(0).choice(tracks, size=max(1, max_points // 2), replace=False)
+            return simplify_tracks(data[np.isin(track_ids, chosen)], max_points, tolerance, track_column)
+        threshold = np.partition(significance[finite], -budget)[-budget] if budget else np.inf
+        keep &= significance >= threshold
+        excess = int(keep.sum()) - max_points
+        if excess > 0:
+            # Ties at the threshold
+            keep[np.flatnonzero(keep & (significance == threshold))[:excess]] = False
+    return data[keep]
+
+
+def grid_bins(lat: np.ndarray, lon: np.ndarray, cell_degrees: float,
+              weights: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """Count points per ``cell_degrees`` grid cell; one row per non-empty cell, at its center"""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    rows = np.floor((lat[valid] + 90) / cell_degrees).astype(np.int64)
+    cols = np.floor((lon[valid] + 180) / cell_degrees).astype(np.int64)
+    ncols = int(np.ceil(360 / cell_degrees)) + 1
+    cells, inverse = np.unique(rows * ncols + cols, return_inverse=True)
+    counts = np.bincount(inverse, weights=None if weights is None else np.asarray(weights)[valid])
+    return pd.DataFrame({
+        'latitude': (cells // ncols + 0.5) * cell_degrees - 90,
+        'longitude': (cells % ncols + 0.5) * cell_degrees - 180,
+        'count': counts,
+    })
+
+
+def cell_size_for_budget(lat: np.ndarray, lon: np.ndarray, max_cells: int) -> float:
+    """Grid cell size (degrees) so the data's bounding box holds about ``max_cells`` cells"""
+    lat_range, lon_range = _extent(lat), _extent(lon)
+    area = max(lat_range, 1e-6) * max(lon_range, 1e-6)
+    return float(max(np.sqrt(area / max(1, max_cells)), 1e-4))
+
+
+def _extent(values: np.ndarray) -> float:
+    values = np.asarray(values, dtype=float)
+    return float(np.nanmax(values) - np.nanmin(values)) if len(values) else 0.0
+
+
+def bin_to_budget(data: pd.DataFrame, max_points: int) -> Tuple[pd.DataFrame, float]:
+    """Grid-bin positions so at most ``max_points`` cells remain; returns (bins, cell size)"""
+    lat, lon = data['latitude'].to_numpy(dtype=float), data['longitude'].to_numpy(dtype=float)
+    cell = cell_size_for_budget(lat, lon, max_points)
+    bins = grid_bins(lat, lon, cell)
+    while len(bins) > max_points:
+        cell *= 1.5
+        bins = grid_bins(lat, lon, cell)
+    return bins, cell
+
+
+def break_tracks(data: pd.DataFrame, track_column: str = 'mmsi') -> pd.DataFrame:
+    """Insert an all-null row between tracks so one line trace draws them apart
+
+    Rows must already be grouped by ``track_column``. A track that crosses the
+    antimeridian is broken there too, so its line doesn't span the map.
+    """
+    if data.empty:
+        return data
+    split = np.zeros(len(data) - 1, dtype=bool)
+    if track_column in data.columns:
+        codes = pd.factorize(data[track_column], sort=False)[0]
+        split |= np.diff(codes) != 0
+    if 'longitude' in data.columns:
+        split |= np.abs(np.diff(data['longitude'].to_numpy(dtype=float))) > 180
+    if not split.any():
+        return data
+    shift = np.concatenate([[0], np.cumsum(split)])
+    positions = np.arange(len(data)) + shift
+    total = len(data) + int(shift[-1])
+    columns = {}
+    for name in data.columns:
+        values = data[name].to_numpy()
+        numeric = np.issubdtype(values.dtype, np.number) and not np.issubdtype(values.dtype, np.integer)
+        column = np.full(total, np.nan if numeric else None, dtype=float if numeric else object)
+        column[positions] = values
+        columns[name] = column
+    return pd.DataFrame(columns)
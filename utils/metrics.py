@@ -0,0 +1,283 @@
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Process-wide counters and latency/size summaries, labelled like Prometheus
+# series. Summaries keep a count, a sum and the last ``max_samples`` values
+# for quantiles. ``metrics`` is shared by the database, LLM, visualization
+# and chain code; the sidebar shows ``snapshot()`` and ``serve_metrics``
+# exposes ``to_prometheus()`` for a local scraper.
+QUANTILES = (0.5, 0.95, 0.99)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class MetricsRegistry:
+    """Thread-safe counters and summaries keyed by name and labels"""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._counters: Dict[_Key, float] = {}
+        self._summaries: Dict[_Key, Dict[str, Any]] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {
+                    'count': 0, 'sum': 0.0, 'samples': deque(maxlen=self.max_samples)
+                }
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['samples'].append(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the block's wall time in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, name: str, fn: Callable[[], Dict[str, Any]]) -> None:
+        """Export the numeric values of ``fn()`` (e.g. a ``stats()`` method) as gauges ``<name>_<key>``"""
+        with self._lock:
+            self._collectors[name] = fn
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters, summaries (count, mean, quantiles) and collector values"""
+        counters, summaries = self._copy()
+        out: Dict[str, Any] = {'counters': {}, 'summaries': {}, 'gauges': {}}
+        for (name, labels), value in sorted(counters.items()):
+            out['counters'][_series(name, labels)] = value
+        for (name, labels), (count, total, samples) in sorted(summaries.items()):
+            out['summaries'][_series(name, labels)] = {
+                'count': count,
+                'mean': total / count if count else 0.0,
+                **{f'p{int(q * 100)}': value for q, value in _quantiles(samples).items()},
+            }
+        for name, values in self._collect().items():
+            out['gauges'][name] = values
+        return out
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        counters, summaries = self._copy()
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{_series(name, labels)} {_number(value)}")
+        for (name, labels), (count, total, samples) in sorted(summaries.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            for q, value in _quantiles(samples).items():
+                lines.append(f"{_series(name, labels + (('quantile', str(q)),))} {_number(value)}")
+            lines.append(f"{_series(name + '_sum', labels)} {_number(total)}")
+            lines.append(f"{_series(name + '_count', labels)} {count}")
+        for name, values in self._collect().items():
+            for key, value in values.items():
+                series = f"{name}_{key}"
+                lines.append(f"# TYPE {series} gauge")
+                lines.append(f"{series} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _copy(self):
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: (s['count'], s['sum'], list(s['samples'])) for key, s in self._summaries.items()}
+        return counters, summaries
+
+    def _collect(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            collectors = dict(self._collectors)
+        out = {}
+        for name, fn in sorted(collectors.items()):
+            try:
+                values = fn()
+            except Exception as e:
+                print(f"Metrics collector {name} failed: {str(e)}")
+                continue
+            out[name] = {
+                key: float(value) for key, value in values.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            }
+        return out
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{name}{{{body}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _quantiles(samples: List[float]) -> Dict[float, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = MetricsRegistry()
+
+_servers: Dict[Tuple[str, int], ThreadingHTTPServer] = {}
+_servers_lock = threading.Lock()
+
+
+def serve_metrics(port: int, host: str = '127.0.0.1',
+                  registry: MetricsRegistry = metrics) -> ThreadingHTTPServer:
+    """Serve ``registry.to_prometheus()`` at http://host:port/metrics from a daemon thread
+
+    Started once per address; later calls return the running server.
+    """
+    with _servers_lock:
+        server = _servers.get((host, port))
+        if server is not None:
+            return server
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+        _servers[(host, port)] = server
+        return server
+
+
+class RequestProfile:
+    """cProfile of one request, merged across the threads that worked on it
+
+    cProfile only sees the thread that enabled it, while a request's work is
+    spread over the chain's stage pool and the LLM threads; those wrap their
+    work in ``profile_thread()``, which joins the active capture.
+    """
+
+    def __init__(self):
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self.seconds: Optional[float] = None
+
+    @contextmanager
+    def thread(self):
+        """Profile the calling thread for the duration of the block"""
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.append(profile)
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def report(self, top: int = 30, sort: str = 'cumulative') -> str:
+        """The ``top`` functions by ``sort`` as pstats text"""
+        stats = self.stats()
+        if stats is None:
+            return ""
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(top)
+        return stream.getvalue()
+
+    def dump(self, path: str) -> None:
+        """Write the merged profile for snakeviz/pstats"""
+        stats = self.stats()
+        if stats is not None:
+            stats.dump_stats(path)
+
+
+_active_profile: Optional[RequestProfile] = None
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profile_request():
+    """Capture a cProfile of the block and the threads it hands work to
+
+    Yields the RequestProfile, or None when another request is already being
+    profiled. The shared stage and LLM threads join whichever capture is
+    active, so work they do for other sessions meanwhile is included too.
+    """
+    global _active_profile
+    with _profile_lock:
+        if _active_profile is not None:
+            profile = None
+        else:
+            profile = _active_profile = RequestProfile()
+    if profile is None:
+        yield None
+        return
+    start = time.perf_counter()
+    try:
+        with profile.thread():
+            yield profile
+    finally:
+        profile.seconds = time.perf_counter() - start
+        with _profile_lock:
+            _active_profile = None
+
+
+def profile_thread():
+    """Join the active request profile from a worker thread, if there is one"""
+    profile = _active_profile
+    return profile.thread() if profile is not None else nullcontext()
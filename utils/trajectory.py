@@ -0,0 +1,286 @@
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Trajectory metrics for many vessels at once. Rows are ordered by
+# (mmsi, timestamp) with one lexsort, track boundaries come from comparing
+# neighbouring ids, and per-track or per-stop totals use bincount/reduceat,
+# so no Python code runs per row or per vessel.
+EARTH_RADIUS_NM = 3440.065
+STOPPED_STATUSES = ('Moored', 'At anchor')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TRACK_COLUMNS = ('mmsi', 'timestamp', 'latitude', 'longitude')
+
+# Columns added by TrajectoryEngine.enrich
+MOTION_COLUMNS = ('leg_nm', 'leg_hours', 'derived_speed', 'derived_course', 'cumulative_nm', 'stopped', 'stop_id')
+
+# Approximate harbour positions for port names given without coordinates
+KNOWN_PORTS = {
+    'Rotterdam': (51.95, 4.14),
+    'Singapore': (1.26, 103.84),
+    'Shanghai': (31.23, 121.49),
+    'Los Angeles': (33.73, -118.26),
+    'Hamburg': (53.54, 9.97),
+    'Antwerp': (51.26, 4.39),
+    'Busan': (35.10, 129.04),
+    'Hong Kong': (22.29, 114.16),
+    'Ningbo': (29.87, 121.55),
+    'Dubai': (25.01, 55.06),
+}
+
+
+def haversine_nm(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in nautical miles, element-wise"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Initial course (degrees true) from the first point to the second, element-wise"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def resolve_ports(ports: Iterable[Any]) -> Dict[str, Tuple[float, float]]:
+    """Port name -> (lat, lon) from ``maritime.default_ports`` entries
+
+    Entries are names (looked up in KNOWN_PORTS) or mappings with ``name``,
+    ``latitude`` and ``longitude``.
+    """
+    resolved = {}
+    for port in ports or []:
+        if isinstance(port, dict):
+            resolved[port['name']] = (float(port['latitude']), float(port['longitude']))
+        elif port in KNOWN_PORTS:
+            resolved[port] = KNOWN_PORTS[port]
+        else:
+            print(f"No coordinates for port {port!r}; give latitude/longitude in config")
+    return resolved
+
+
+class TrajectoryEngine:
+    """Per-vessel movement metrics: legs, derived speed/course, stops and port calls
+
+    A fix counts as stopped when its reported (or, without one, derived)
+    speed is below ``stop_speed`` knots or its status is moored/at anchor.
+    Runs of stopped fixes lasting at least ``min_stop_minutes`` are stops;
+    a stop within ``port_radius_nm`` of a configured port is a port call.
+    """
+
+    def __init__(self, ports: Optional[Dict[str, Tuple[float, float]]] = None,
+                 stop_speed: float = 0.5, min_stop_minutes: float = 30,
+                 port_radius_nm: float = 15):
+        self.ports = ports if ports is not None else dict(KNOWN_PORTS)
+        self.stop_speed = stop_speed
+        self.min_stop_minutes = min_stop_minutes
+        self.port_radius_nm = port_radius_nm
+
+    @classmethod
+    def from_config(cls, maritime_config: Optional[Dict[str, Any]] = None) -> 'TrajectoryEngine':
+        """Build from the ``maritime`` section of config.yaml"""
+        maritime_config = maritime_config or {}
+        settings = maritime_config.get('trajectory', {})
+        ports = maritime_config.get('default_ports')
+        return cls(
+            ports=resolve_ports(ports) if ports is not None else None,
+            stop_speed=settings.get('stop_speed_knots', 0.5),
+            min_stop_minutes=settings.get('min_stop_minutes', 30),
+            port_radius_nm=settings.get('port_radius_nm', 15),
+        )
+
+    @staticmethod
+    def has_tracks(data: Optional[pd.DataFrame]) -> bool:
+        """True for position rows (mmsi, timestamp, latitude, longitude) with some repeat vessel"""
+        return (data is not None and all(c in data.columns for c in TRACK_COLUMNS)
+                and len(data) > 1 and data['mmsi'].nunique() < len(data))
+
+    def enrich(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Copy of ``data`` with MOTION_COLUMNS added, rows in their original order
+
+        ``leg_*`` describe the leg from the vessel's previous fix (NaN on its
+        first fix), ``cumulative_nm`` is distance sailed so far and
+        ``stop_id`` numbers the stops (-1 while under way).
+        """
+        if not self.has_tracks(data):
+            return data
+        motion = self._motion(data)
+        data = data.copy()
+        for name in MOTION_COLUMNS:
+            values = np.empty(len(data), dtype=motion[name].dtype)
+            values[motion['order']] = motion[name]
+            data[name] = values
+        return data
+
+    def stops(self, data: pd.DataFrame) -> pd.DataFrame:
+        """One row per stop: vessel, start/end, duration, mean position and kind"""
+        if not self.has_tracks(data):
+            return pd.DataFrame(columns=['mmsi', 'start_time', 'end_time', 'duration_hours',
+                                         'latitude', 'longitude', 'kind'])
+        return self._stops(data, self._motion(data))
+
+    def port_calls(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Stops near a configured port, with arrival/departure time and dwell hours"""
+        return self._port_calls(self.stops(data))
+
+    def summary(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Per vessel: distance sailed, hours covered, hours stopped/at anchor/moored, stops, port calls"""
+        if not self.has_tracks(data):
+            return pd.DataFrame()
+        motion = self._motion(data)
+        codes, mmsis, starts = motion['track'], motion['mmsis'], motion['starts']
+        n = len(mmsis)
+        ends = np.append(starts[1:], len(codes)) - 1
+        summary = pd.DataFrame({
+            'mmsi': mmsis,
+            'positions': np.diff(np.append(starts, len(codes))),
+            'distance_nm': np.bincount(codes, weights=np.nan_to_num(motion['leg_nm']), minlength=n),
+            'hours': (motion['seconds'][ends] - motion['seconds'][starts]) / 3600.0,
+            'first_seen': format_timestamps(motion['seconds'][starts]),
+            'last_seen': format_timestamps(motion['seconds'][ends]),
+        })
+        stops = self._stops(data, motion)
+        stop_codes = np.searchsorted(mmsis, stops['mmsi'].to_numpy())
+        hours = stops['duration_hours'].to_numpy(dtype=float)
+        kinds = stops['kind'].to_numpy()
+        summary['stopped_hours'] = np.bincount(stop_codes, weights=hours, minlength=n)
+        summary['anchor_hours'] = np.bincount(stop_codes, weights=np.where(kinds == 'anchor', hours, 0), minlength=n)
+        summary['moored_hours'] = np.bincount(stop_codes, weights=np.where(kinds == 'moored', hours, 0), minlength=n)
+        summary['stops'] = np.bincount(stop_codes, minlength=n)
+        moving = (summary['hours'] - summary['stopped_hours']).to_numpy()
+        summary['mean_speed'] = np.divide(summary['distance_nm'].to_numpy(), moving,
+                                          out=np.full(n, np.nan), where=moving > 0)
+        calls = self._port_calls(stops)
+        summary['port_calls'] = np.bincount(np.searchsorted(mmsis, calls['mmsi'].to_numpy(dtype=mmsis.dtype)),
+                                            minlength=n)
+        if 'vessel_name' in data.columns:
+            summary.insert(1, 'vessel_name', vessel_names(data, mmsis))
+        return summary
+
+    def _port_calls(self, stops: pd.DataFrame) -> pd.DataFrame:
+        columns = ['mmsi', 'port_name', 'arrival_time', 'departure_time', 'dwell_hours',
+                   'distance_nm', 'latitude', 'longitude', 'kind']
+        if stops.empty or not self.ports:
+            return pd.DataFrame(columns=columns)
+        names = np.array(list(self.ports))
+        coords = np.array(list(self.ports.values()))
+        distance = haversine_nm(stops['latitude'].to_numpy()[:, None], stops['longitude'].to_numpy()[:, None],
+                                coords[None, :, 0], coords[None, :, 1])
+        nearest = distance.argmin(axis=1)
+        nearest_nm = distance[np.arange(len(stops)), nearest]
+        calls = stops.assign(port_name=names[nearest], distance_nm=nearest_nm)
+        calls = calls[nearest_nm <= self.port_radius_nm].rename(columns={
+            'start_time': 'arrival_time', 'end_time': 'departure_time', 'duration_hours': 'dwell_hours',
+        })
+        extra = [c for c in calls.columns if c not in columns]
+        return calls[columns + extra].reset_index(drop=True)
+
+    def _motion(self, data: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Motion arrays in (mmsi, timestamp) order; ``order`` maps them back to rows"""
+        seconds = epoch_seconds(data['timestamp'])
+        mmsis, track = np.unique(data['mmsi'].to_numpy(), return_inverse=True)
+        order = np.lexsort((seconds, track))
+        track, seconds = track[order], seconds[order]
+        lat = data['latitude'].to_numpy(dtype=float)[order]
+        lon = data['longitude'].to_numpy(dtype=float)[order]
+
+        n = len(order)
+        same = np.zeros(n, dtype=bool)
+        same[1:] = track[1:] == track[:-1]
+        starts = np.flatnonzero(~same)
+
+        leg_nm = np.full(n, np.nan)
+        leg_hours = np.full(n, np.nan)
+        course = np.full(n, np.nan)
+        leg_nm[1:] = haversine_nm(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        leg_hours[1:] = (seconds[1:] - seconds[:-1]) / 3600.0
+        course[1:] = initial_bearing(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        leg_nm[~same] = leg_hours[~same] = course[~same] = np.nan
+        speed = np.divide(leg_nm, leg_hours, out=np.full(n, np.nan), where=leg_hours > 0)
+
+        travelled = np.cumsum(np.nan_to_num(leg_nm))
+        cumulative = travelled - np.repeat(travelled[starts], np.diff(np.append(starts, n)))
+
+        reported = data['speed'].to_numpy(dtype=float)[order] if 'speed' in data.columns else np.full(n, np.nan)
+        reference = np.where(np.isnan(reported), speed, reported)
+        stopped = reference < self.stop_speed
+        if 'navigation_status' in data.columns:
+            status = data['navigation_status'].to_numpy(dtype=object)[order]
+            stopped |= np.isin(status, STOPPED_STATUSES)
+        else:
+            status = np.full(n, None, dtype=object)
+
+        # Runs of stopped fixes within a track; long enough runs become stops
+        run_start = stopped.copy()
+        run_start[1:] &= ~(stopped[:-1] & same[1:])
+        run_end = stopped.copy()
+        run_end[:-1] &= ~(stopped[1:] & same[1:])
+        first, last = np.flatnonzero(run_start), np.flatnonzero(run_end)
+        long_enough = (seconds[last] - seconds[first]) / 60.0 >= self.min_stop_minutes
+        run = np.cumsum(run_start) - 1
+        in_stop = stopped.copy()
+        in_stop[stopped] = long_enough[run[stopped]]
+        stop_id = np.full(n, -1)
+        stop_id[in_stop] = (np.cumsum(long_enough) - 1)[run[in_stop]]
+
+        return {
+            'order': order, 'track': track, 'mmsis': mmsis, 'starts': starts, 'seconds': seconds,
+            'latitude': lat, 'longitude': lon, 'status': status,
+            'leg_nm': leg_nm, 'leg_hours': leg_hours, 'derived_speed': speed, 'derived_course': course,
+            'cumulative_nm': cumulative, 'stopped': stopped, 'stop_id': stop_id,
+            'stop_first': first[long_enough], 'stop_last': last[long_enough],
+        }
+
+    def _stops(self, data: pd.DataFrame, motion: Dict[str, np.ndarray]) -> pd.DataFrame:
+        first, last = motion['stop_first'], motion['stop_last']
+        rows = np.flatnonzero(motion['stop_id'] >= 0)
+        counts = last - first + 1
+        offsets = np.cumsum(counts) - counts
+        status = motion['status'][rows]
+        anchor = _run_sums(status == 'At anchor', offsets)
+        moored = _run_sums(status == 'Moored', offsets)
+        stops = pd.DataFrame({
+            'mmsi': motion['mmsis'][motion['track'][first]],
+            'start_time': format_timestamps(motion['seconds'][first]),
+            'end_time': format_timestamps(motion['seconds'][last]),
+            'duration_hours': (motion['seconds'][last] - motion['seconds'][first]) / 3600.0,
+            'latitude': _run_sums(motion['latitude'][rows], offsets) / np.maximum(counts, 1),
+            'longitude': _run_sums(motion['longitude'][rows], offsets) / np.maximum(counts, 1),
+            'kind': np.where((moored >= anchor) & (moored > 0), 'moored', np.where(anchor > 0, 'anchor', 'stopped')),
+        })
+        if 'vessel_name' in data.columns:
+            stops.insert(1, 'vessel_name', vessel_names(data, stops['mmsi'].to_numpy()))
+        return stops
+
+
+def epoch_seconds(timestamps: pd.Series) -> np.ndarray:
+    """Epoch seconds (int64) of timestamp strings or datetimes"""
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        parsed = pd.to_datetime(timestamps, errors='coerce', format=TIMESTAMP_FORMAT)
+        if parsed.isna().any():
+            parsed = pd.to_datetime(timestamps, errors='coerce', format='mixed')
+        timestamps = parsed
+    return timestamps.to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def format_timestamps(seconds: np.ndarray) -> np.ndarray:
+    """'YYYY-MM-DD HH:MM:SS' strings for epoch seconds"""
+    return np.char.replace(np.datetime_as_string(np.asarray(seconds).astype('datetime64[s]'), unit='s'), 'T', ' ')
+
+
+def _run_sums(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Sums of consecutive runs of ``values`` starting at ``offsets``"""
+    if not len(offsets):
+        return np.empty(0)
+    return np.add.reduceat(np.asarray(values, dtype=float), offsets)
+
+
+def vessel_names(data: pd.DataFrame, mmsis: np.ndarray) -> np.ndarray:
+    """``vessel_name`` from ``data`` for each of ``mmsis``"""
+    names = data.drop_duplicates('mmsi').set_index('mmsi')['vessel_name']
+    return names.reindex(mmsis).to_numpy()
@@ -1,11 +1,33 @@
 
 import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
+import time
 from typing import Optional, Dict, Any
+from utils.lod import bin_to_budget, break_tracks, simplify_tracks
+from utils.metrics import metrics
+
+# Columns track figures draw or show on hover; the rest are dropped before
+# simplification so they are neither copied nor sent to the browser
+TRACK_COLUMNS = ('mmsi', 'timestamp', 'latitude', 'longitude', 'vessel_name', 'speed', 'cumulative_nm')
+# ~10 m, well below what a map at any useful zoom can show
+COORDINATE_DECIMALS = 4
 
 class VisualizationManager:
-    def __init__(self):
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """``config`` is the ``visualization`` section of config.yaml
+
+        ``max_points`` caps the points each map figure sends to the browser:
+        tracks are Douglas-Peucker simplified and density maps grid-binned
+        down to it; 10000 keeps a fleet-wide map well under a second to
+        build and serialize. ``max_route_traces`` caps the per-vessel traces of the
+        route analysis. With ``measure_payload`` each figure is serialized
+        once more to record the bytes it sends to the browser.
+        """
+        self.max_points = (config or {}).get('max_points', 10_000)
+        self.measure_payload = (config or {}).get('measure_payload', True)
+        self.max_route_traces = (config or {}).get('max_route_traces', 20)
         self.default_height = 600
         self.default_width = 800
         self.color_scheme = {
@@ -16,7 +38,11 @@ class VisualizationManager:
         }
 
     def create_visualization(self, data: pd.DataFrame, viz_type: str, **kwargs) -> go.Figure:
-        """Create visualization based on data and type"""
+        """Create visualization based on data and type
+
+        Build time and payload size go to the figure_build_seconds and
+        figure_payload_bytes metrics.
+        """
         viz_functions = {
             "vessel_map": self._create_vessel_map,
             "vessel_density": self._create_density_map,
@@ -29,33 +55,54 @@ class VisualizationManager:
         
         if viz_type not in viz_functions:
             raise ValueError(f"Unsupported visualization type: {viz_type}")
-            
-        return viz_functions[viz_type](data, **kwargs)
+
+        start = time.perf_counter()
+        fig = viz_functions[viz_type](data, **kwargs)
+        metrics.observe('figure_build_seconds', time.perf_counter() - start, viz_type=viz_type)
+        if self.measure_payload:
+            metrics.observe('figure_payload_bytes', len(fig.to_json()), viz_type=viz_type)
+        return fig
 
     def _create_vessel_map(self, data: pd.DataFrame, **kwargs) -> go.Figure:
-        """Create vessel movement map"""
+        """Create vessel movement map
+
+        Close encounters (EncounterDetector.detect, recognised by an
+        ``other_mmsi`` column) are drawn as links between the two vessels;
+        pass them as ``encounters=`` to overlay them on a track map.
+        """
         fig = go.Figure()
+        max_points = kwargs.get('max_points', self.max_points)
+        encounters = kwargs.get('encounters')
+        if 'other_mmsi' in data.columns:
+            encounters, data = data, None
 
-        # Add vessel trajectories
-        fig.add_trace(go.Scattergeo(
-            lon=data['longitude'],
-            lat=data['latitude'],
-            mode='lines+markers',
-            line=dict(width=2, color=self.color_scheme['primary']),
-            marker=dict(size=4),
-            name='Vessel Track',
-            hovertemplate=(
-                '<b>Vessel:</b> %{customdata[0]}<br>'
-                '<b>Time:</b> %{customdata[1]}<br>'
-                '<b>Speed:</b> %{customdata[2]:.1f} knots<br>'
-                '<b>Position:</b> (%{lat:.2f}, %{lon:.2f})'
-            ),
-            customdata=data[['vessel_name', 'timestamp', 'speed']].values
-        ))
+        if data is not None:
+            # Simplify tracks to the point budget; null rows keep vessels' lines apart
+            points = break_tracks(simplify_tracks(self._track_columns(data), max_points))
+
+            # Add vessel trajectories
+            fig.add_trace(go.Scattergeo(
+                lon=points['longitude'].round(COORDINATE_DECIMALS),
+                lat=points['latitude'].round(COORDINATE_DECIMALS),
+                mode='lines+markers',
+                line=dict(width=2, color=self.color_scheme['primary']),
+                marker=dict(size=4),
+                name='Vessel Track',
+                hovertemplate=(
+                    '<b>Vessel:</b> %{customdata[0]}<br>'
+                    '<b>Time:</b> %{text}<br>'
+                    '<b>Speed:</b> %{customdata[1]:.1f} knots<br>'
+                    '<b>Position:</b> (%{lat:.2f}, %{lon:.2f})'
+                ),
+                **self._hover_values(points, ['vessel_name', 'speed'])
+            ))
+
+        if encounters is not None and not encounters.empty:
+            self._add_encounters(fig, encounters, max_points)
 
         # Update layout
         fig.update_layout(
-            title=kwargs.get('title', 'Vessel Movements'),
+            title=kwargs.get('title', 'Vessel Movements' if data is not None else 'Close Encounters'),
             geo=dict(
                 showland=True,
                 showcountries=True,
@@ -71,18 +118,83 @@ class VisualizationManager:
 
         return fig
 
+    @staticmethod
+    def _track_columns(data: pd.DataFrame) -> pd.DataFrame:
+        return data[[column for column in TRACK_COLUMNS if column in data.columns]]
+
+    @staticmethod
+    def _hover_values(points: pd.DataFrame, columns) -> Dict[str, np.ndarray]:
+        """``text`` (time to the minute) and ``customdata`` (``columns``, numbers to 0.1) for a track trace
+
+        customdata stays a float array when every column is numeric, which
+        plotly copies and serializes far faster than an object array.
+        """
+        timestamps = points['timestamp']
+        values = [points[column].round(1) if pd.api.types.is_float_dtype(points[column]) else points[column]
+                  for column in columns]
+        numeric = all(pd.api.types.is_numeric_dtype(value) for value in values)
+        return {
+            'text': timestamps.astype(str).str[:16].where(timestamps.notna()).to_numpy(dtype=object),
+            'customdata': np.column_stack([value.to_numpy(dtype=float if numeric else object) for value in values]),
+        }
+
+    def _add_encounters(self, fig: go.Figure, encounters: pd.DataFrame, max_points: int) -> None:
+        """Closest encounters first, three points each (both vessels and a line break)"""
+        shown = encounters.nsmallest(max(1, max_points // 3), 'distance_nm')
+        gap = np.full(len(shown), np.nan)
+        fig.add_trace(go.Scattergeo(
+            lon=np.column_stack([shown['vessel_longitude'], shown['other_longitude'], gap]).ravel(),
+            lat=np.column_stack([shown['vessel_latitude'], shown['other_latitude'], gap]).ravel(),
+            mode='lines+markers',
+            line=dict(width=2, color=self.color_scheme['secondary']),
+            marker=dict(size=5, color=self.color_scheme['secondary']),
+            name='Encounter Vessels',
+            hoverinfo='skip',
+        ))
+
+        names = shown['vessel_name'] if 'vessel_name' in shown.columns else shown['mmsi']
+        others = shown['other_vessel_name'] if 'other_vessel_name' in shown.columns else shown['other_mmsi']
+        fig.add_trace(go.Scattergeo(
+            lon=shown['longitude'],
+            lat=shown['latitude'],
+            mode='markers',
+            marker=dict(size=9, color=shown['distance_nm'], colorscale='Reds_r',
+                        colorbar=dict(title='Distance (nm)')),
+            name='Closest Approach',
+            hovertemplate=(
+                '<b>%{customdata[0]}</b> / <b>%{customdata[1]}</b><br>'
+                '<b>Distance:</b> %{customdata[2]:.2f} nm<br>'
+                '<b>Time:</b> %{customdata[3]}<br>'
+                '<b>Fix gap:</b> %{customdata[4]:.0f} min'
+            ),
+            customdata=np.column_stack([
+                names, others, shown['distance_nm'], shown['timestamp'], shown['time_gap_minutes'],
+            ]),
+        ))
+
     def _create_density_map(self, data: pd.DataFrame, **kwargs) -> go.Figure:
-        """Create vessel density heatmap"""
+        """Create vessel density heatmap
+
+        Accepts raw positions or pre-binned cells with a ``count`` column
+        (e.g. DatabaseManager.get_density_grid). Raw positions beyond the
+        point budget are grid-binned first.
+        """
+        max_points = kwargs.get('max_points', self.max_points)
+        if 'count' not in data.columns and len(data) > max_points:
+            data, _ = bin_to_budget(data, max_points)
+        weights = data['count'] if 'count' in data.columns else None
+
         fig = go.Figure(go.Densitymapbox(
             lat=data['latitude'],
             lon=data['longitude'],
+            z=weights,
             radius=10,
             colorscale='Viridis',
             hovertemplate='Count: %{z}<br>Position: (%{lat:.2f}, %{lon:.2f})'
         ))
 
-        center_lat = data['latitude'].mean()
-        center_lon = data['longitude'].mean()
+        center_lat = np.average(data['latitude'], weights=weights)
+        center_lon = np.average(data['longitude'], weights=weights)
 
         fig.update_layout(
             title=kwargs.get('title', 'Vessel Density Map'),
@@ -98,26 +210,42 @@ class VisualizationManager:
         return fig
 
     def _create_speed_analysis(self, data: pd.DataFrame, **kwargs) -> go.Figure:
-        """Create speed analysis visualization"""
-        fig = go.Figure()
+        """Create speed analysis visualization
 
-        # Add speed distribution histogram
-        fig.add_trace(go.Histogram(
-            x=data['speed'],
-            nbinsx=30,
-            name='Speed Distribution',
-            marker_color=self.color_scheme['primary']
-        ))
+        Takes raw positions, or a pre-binned histogram with ``speed`` (bucket
+        lower bound) and ``positions`` columns such as
+        DatabaseManager.get_speed_histogram returns.
+        """
+        fig = go.Figure()
 
-        # Add KDE line if specified
-        if kwargs.get('show_kde', True):
-            kde = self._calculate_kde(data['speed'])
-            fig.add_trace(go.Scatter(
-                x=kde['x'],
-                y=kde['y'],
-                name='Density',
-                line=dict(color=self.color_scheme['secondary'])
+        if 'positions' in data.columns:
+            speeds = data['speed'].to_numpy(dtype=float)
+            width = kwargs.get('bin_width') or (float(np.diff(speeds).min()) if len(speeds) > 1 else 1.0)
+            fig.add_trace(go.Bar(
+                x=speeds + width / 2,
+                y=data['positions'],
+                width=width,
+                name='Speed Distribution',
+                marker_color=self.color_scheme['primary']
             ))
+        else:
+            # Add speed distribution histogram
+            fig.add_trace(go.Histogram(
+                x=data['speed'],
+                nbinsx=30,
+                name='Speed Distribution',
+                marker_color=self.color_scheme['primary']
+            ))
+
+            # Add KDE line if specified
+            if kwargs.get('show_kde', True):
+                kde = self._calculate_kde(data['speed'])
+                fig.add_trace(go.Scatter(
+                    x=kde['x'],
+                    y=kde['y'],
+                    name='Density',
+                    line=dict(color=self.color_scheme['secondary'])
+                ))
 
         fig.update_layout(
             title=kwargs.get('title', 'Vessel Speed Analysis'),
@@ -131,19 +259,33 @@ class VisualizationManager:
         return fig
 
     def _create_port_activity(self, data: pd.DataFrame, **kwargs) -> go.Figure:
-        """Create port activity visualization"""
+        """Create port activity visualization
+
+        Port calls with ``port_name`` and ``dwell_hours`` (or arrival and
+        departure times), as TrajectoryEngine.port_calls returns, give
+        per-port vessel counts and mean stays; arrival/departure events
+        (DatabaseManager.get_port_events) give daily event counts.
+        """
+        if 'event' in data.columns and 'port_name' not in data.columns:
+            return self._create_port_events(data, **kwargs)
+
+        if 'dwell_hours' not in data.columns:
+            data = data.assign(dwell_hours=(
+                pd.to_datetime(data['departure_time']) - pd.to_datetime(data['arrival_time'])
+            ).dt.total_seconds() / 3600)
+
         # Group data by port and calculate metrics
-        port_stats = data.groupby('port_name').agg({
-            'mmsi': 'count',
-            'departure_time': lambda x: (x - x.min()).mean()
-        }).reset_index()
+        port_stats = data.groupby('port_name').agg(
+            vessels=('mmsi', 'nunique'),
+            dwell_hours=('dwell_hours', 'mean'),
+        ).reset_index()
 
         fig = go.Figure()
 
         # Add bars for vessel count
         fig.add_trace(go.Bar(
             x=port_stats['port_name'],
-            y=port_stats['mmsi'],
+            y=port_stats['vessels'],
             name='Vessel Count',
             marker_color=self.color_scheme['primary']
         ))
@@ -151,7 +293,7 @@ class VisualizationManager:
         # Add line for average stay duration
         fig.add_trace(go.Scatter(
             x=port_stats['port_name'],
-            y=port_stats['departure_time'],
+            y=port_stats['dwell_hours'],
             name='Avg Stay Duration',
             yaxis='y2',
             line=dict(color=self.color_scheme['secondary'])
@@ -172,9 +314,42 @@ class VisualizationManager:
 
         return fig
 
+    def _create_port_events(self, data: pd.DataFrame, **kwargs) -> go.Figure:
+        """Daily arrivals and departures as grouped bars"""
+        days = pd.to_datetime(data['timestamp']).dt.floor('D')
+        daily = pd.crosstab(days, data['event'])
+
+        fig = go.Figure()
+        for event, color in (('arrival', 'primary'), ('departure', 'secondary')):
+            if event in daily.columns:
+                fig.add_trace(go.Bar(
+                    x=daily.index,
+                    y=daily[event],
+                    name=event.capitalize() + 's',
+                    marker_color=self.color_scheme[color]
+                ))
+
+        fig.update_layout(
+            title=kwargs.get('title', 'Port Activity Analysis'),
+            xaxis_title='Date',
+            yaxis_title='Events',
+            barmode='group',
+            height=self.default_height,
+            width=self.default_width
+        )
+
+        return fig
+
     def _create_vessel_type_distribution(self, data: pd.DataFrame, **kwargs) -> go.Figure:
-        """Create vessel type distribution visualization"""
-        type_counts = data['vessel_type'].value_counts()
+        """Create vessel type distribution visualization
+
+        Counts rows per type, or uses a ``vessels`` column when the data is
+        already counted (DatabaseManager.get_vessel_type_counts).
+        """
+        if 'vessels' in data.columns:
+            type_counts = data.set_index('vessel_type')['vessels']
+        else:
+            type_counts = data['vessel_type'].value_counts()
 
         fig = go.Figure(data=[
             go.Pie(
@@ -229,23 +404,56 @@ class VisualizationManager:
         return fig
 
     def _create_route_analysis(self, data: pd.DataFrame, **kwargs) -> go.Figure:
-        """Create route analysis visualization"""
-        fig = go.Figure()
+        """Create route analysis visualization
 
-        # Add route lines
-        for vessel in data['mmsi'].unique():
-            vessel_data = data[data['mmsi'] == vessel].sort_values('timestamp')
+        Tracks are sorted and simplified once. The vessels with the most
+        positions (up to ``max_traces``) get their own trace and legend entry;
+        the rest share a single null-separated trace, hovering name and time only.
+        """
+        fig = go.Figure()
+        points = simplify_tracks(self._track_columns(data), kwargs.get('max_points', self.max_points))
+        label = 'vessel_name' if 'vessel_name' in points.columns else 'mmsi'
+        hovertemplate = (
+            '<b>Vessel:</b> %{meta[0]}<br>'
+            '<b>Time:</b> %{text}<br>'
+            '<b>Speed:</b> %{customdata[0]:.1f} knots'
+        )
+        hover_columns = ['speed']
+        if 'cumulative_nm' in points.columns:
+            # Distance sailed so far, from TrajectoryEngine.enrich
+            hovertemplate += '<br><b>Sailed:</b> %{customdata[1]:,.0f} nm'
+            hover_columns.append('cumulative_nm')
+
+        sizes = points.groupby('mmsi', sort=False).size().sort_values(ascending=False, kind='stable')
+        leader_ids = sizes.index[:kwargs.get('max_traces', self.max_route_traces)]
+        leaders = points['mmsi'].isin(leader_ids)
+
+        # Add route lines; a leader's name goes in its trace, not in every point
+        for vessel, vessel_data in points[leaders].groupby('mmsi', sort=False):
+            name = vessel_data[label].iloc[0]
+            vessel_data = break_tracks(vessel_data)
             fig.add_trace(go.Scattergeo(
-                lon=vessel_data['longitude'],
-                lat=vessel_data['latitude'],
+                lon=vessel_data['longitude'].round(COORDINATE_DECIMALS),
+                lat=vessel_data['latitude'].round(COORDINATE_DECIMALS),
                 mode='lines+markers',
                 name=f'Vessel {vessel}',
-                hovertemplate=(
-                    '<b>Vessel:</b> %{customdata[0]}<br>'
-                    '<b>Time:</b> %{customdata[1]}<br>'
-                    '<b>Speed:</b> %{customdata[2]:.1f} knots'
-                ),
-                customdata=vessel_data[['vessel_name', 'timestamp', 'speed']].values
+                meta=[str(name)],
+                hovertemplate=hovertemplate,
+                **self._hover_values(vessel_data, hover_columns)
+            ))
+
+        others = points[~leaders]
+        if not others.empty:
+            others = break_tracks(others)
+            fig.add_trace(go.Scattergeo(
+                lon=others['longitude'].round(COORDINATE_DECIMALS),
+                lat=others['latitude'].round(COORDINATE_DECIMALS),
+                mode='lines',
+                name=f'Other vessels ({len(sizes) - len(leader_ids)})',
+                line=dict(width=1, color='rgba(120, 120, 120, 0.5)'),
+                # Background lines: who and when is enough
+                hovertemplate='<b>Vessel:</b> %{customdata[0]}<br><b>Time:</b> %{text}',
+                **self._hover_values(others, [label])
             ))
 
         fig.update_layout(
@@ -266,8 +474,7 @@ class VisualizationManager:
     def _calculate_kde(self, data: pd.Series) -> Dict[str, np.ndarray]:
         """Calculate Kernel Density Estimation"""
         from scipy.stats import gaussian_kde
-        import numpy as np
-        
+
         kde = gaussian_kde(data)
         x_range = np.linspace(data.min(), data.max(), 100)
         return {'x': x_range, 'y': kde(x_range)}